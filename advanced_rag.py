@@ -0,0 +1,152 @@
+import os
+import heapq
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from query_processor import QueryAnalysis, QueryProcessor
+from query_planner import FanoutPlanner, Variant
+from retrieval import (RetrievedChunk, dense_search_by_vectors, embed_queries, reciprocal_rank_fusion,
+                       search_positions)
+from ann_index import search_parameters
+from context_packer import pack_context
+import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Candidates fetched per variant before fusion
+VARIANT_CANDIDATES = int(os.getenv('ADVANCED_VARIANT_CANDIDATES', '10'))
+
+@dataclass
+class RAGResult:
+    """Everything one pass of the advanced pipeline produced, with per-stage timings in ms"""
+    question: str
+    answer: str
+    analysis: QueryAnalysis
+    variants: List[Variant] = field(default_factory=list)
+    chunks: List[RetrievedChunk] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+    expansion_skipped: bool = False
+
+    def debug_info(self) -> Dict:
+        """JSON-ready description of how the question was processed"""
+        analysis = self.analysis
+        queries = [variant.query for variant in self.variants]
+        return {
+            'analysis': {
+                'intent': analysis.intent.value,
+                'intent_scores': {intent.value: score for intent, score in analysis.intent_scores},
+                'entities': list(analysis.entities),
+                'keywords': list(analysis.keywords),
+                'expanded_terms': list(analysis.expanded_terms),
+                'confidence': analysis.confidence
+            },
+            'search_queries': queries,
+            'total_queries': len(queries),
+            'expansion_skipped': self.expansion_skipped,
+            'chunks': [{'id': chunk.chunk_id, 'score': chunk.score} for chunk in self.chunks],
+            'timings_ms': {stage: round(ms, 2) for stage, ms in self.timings.items()}
+        }
+
+class AdvancedRAGSystem:
+    """RAG with query analysis and expansion, retrieving for all query variants in one batch"""
+
+    def __init__(self, qa_system=None):
+        if qa_system is None:
+            from engine_registry import get_qa_system
+            qa_system = get_qa_system()
+        self.qa = qa_system
+        self.processor = QueryProcessor()
+        self.planner = FanoutPlanner()
+
+    def run(self, question: str, k: int = 4, search_params: Optional[Dict] = None) -> RAGResult:
+        """Answer a question in a single pass and return the answer with everything used to produce it.
+
+        The question is searched on its own first; its variants are only
+        searched when that first pass has no close match.
+        """
+        watch = metrics.Stopwatch('advanced_rag_stage_seconds')
+        with watch.stage('analyze'):
+            analysis = self.processor.analyze_query(question)
+        result = RAGResult(question, '', analysis, timings=watch.timings)
+
+        try:
+            self._retrieve(result, k, search_params)
+            self._generate(result)
+        except Exception as e:
+            logger.error(f"Error in advanced search: {str(e)}")
+            result.answer = f"Error: {str(e)}"
+
+        watch.timings['total'] = sum(watch.timings.values())
+        logger.info("Advanced RAG timings: " + ", ".join(f"{stage}={ms:.1f}ms" for stage, ms in watch.timings.items()))
+        return result
+
+    def _retrieve(self, result: RAGResult, k: int, search_params: Optional[Dict]):
+        db = self.qa.db
+        exclude = self.qa.index_manager.tombstones
+        params = search_parameters(db.index, **(search_params or {}))
+        candidates = max(k, VARIANT_CANDIDATES)
+        watch = metrics.Stopwatch('advanced_rag_stage_seconds', result.timings)
+
+        original = self.planner.candidates(result.analysis)[0]
+        with watch.stage('embed'):
+            vector = embed_queries(db, [original.query])
+        with watch.stage('search'):
+            first_hits = search_positions(db, vector, candidates, exclude, params)[0]
+        first = [(chunk_id, score) for _, chunk_id, score in first_hits]
+
+        if self.planner.is_confident(db, vector[0], first_hits[0][0] if first_hits else None):
+            logger.info("First pass is confident, skipping query expansion")
+            result.variants = [original]
+            result.expansion_skipped = True
+            hits = first[:k]
+        else:
+            with watch.stage('plan'):
+                variants = self.planner.plan(result.analysis)
+            rankings = [first]
+            if len(variants) > 1:
+                with watch.stage('embed'):
+                    vectors = embed_queries(db, [variant.query for variant in variants[1:]])
+                with watch.stage('search'):
+                    rankings += dense_search_by_vectors(db, vectors, candidates, exclude, params)
+            with watch.stage('fuse'):
+                fused = reciprocal_rank_fusion(rankings, [variant.score for variant in variants])
+                hits = heapq.nlargest(k, fused.items(), key=lambda item: item[1])
+                self.planner.record(variants, rankings, [chunk_id for chunk_id, _ in hits])
+            result.variants = variants
+
+        with watch.stage('fetch'):
+            result.chunks = [RetrievedChunk(chunk_id, db.docstore.search(chunk_id), score) for chunk_id, score in hits]
+        logger.info(f"Retrieved {len(result.chunks)} chunks for {len(result.variants)} search queries")
+
+    def _generate(self, result: RAGResult):
+        watch = metrics.Stopwatch('advanced_rag_stage_seconds', result.timings)
+        chunks = result.chunks
+        if not chunks:
+            result.answer = "I don't have enough information to answer that."
+            return
+
+        with watch.stage('answer_cache'):
+            cached = self.qa._cached_answer(result.question, 'advanced', chunks)
+        if cached is not None:
+            result.answer = cached
+            return
+
+        with watch.stage('prompt'):
+            context = pack_context([chunk.document.page_content for chunk in chunks]).text
+            prompt = self.qa._build_prompt(context, result.question)
+
+        with watch.stage('generate'):
+            result.answer = self.qa.llm.invoke(prompt).strip()
+        self.qa._store_answer(result.question, 'advanced', chunks, result.answer)
+
+    def answer_question(self, question: str, k: int = 4, search_params: Optional[Dict] = None) -> str:
+        """Answer a question using multi-query retrieval"""
+        return self.run(question, k, search_params).answer
+
+    def debug_query_processing(self, query: str) -> Dict:
+        """Show how a query is analyzed and which search queries it would expand to"""
+        analysis = self.processor.analyze_query(query)
+        return RAGResult(query, '', analysis, variants=self.planner.plan(analysis)).debug_info()
@@ -1,15 +1,19 @@
 import http.server
-import socketserver
 import webbrowser
 import json
 import logging
 from urllib.parse import parse_qs, urlparse
+from http_serving import (ThreadPoolHTTPServer, DEFAULT_WORKERS, DEFAULT_QUEUE_LIMIT, send_event_stream,
+                          get_search_params, is_error_answer, send_json, send_metrics, track_request)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Used by /ask and /ask/stream when the request names no search type, matching the page's default
+DEFAULT_SEARCH_TYPE = 'advanced'
+
 HTML = """
 <!DOCTYPE html>
 <html>
@@ -193,7 +197,8 @@ HTML = """
                     resultsDiv.innerHTML = '';
                     askButton.disabled = true;
                     
-                    const response = await fetch('/ask', {
+                    // Advanced search needs the whole answer for its debug info; the others stream
+                    const response = await fetch(searchType === 'advanced' ? '/ask' : '/ask/stream', {
                         method: 'POST',
                         headers: {
                             'Content-Type': 'application/json'
@@ -206,7 +211,12 @@ HTML = """
                     
                     console.log('Response status:', response.status);
                     
-                    const data = await response.json();
+                    if (searchType !== 'advanced' && response.ok && response.body) {
+                        await streamResults(response);
+                        return;
+                    }
+                    
+                    const data = await response.json().catch(() => ({}));
                     console.log('Response data:', data);
                     
                     if (response.ok && data.answer) {
@@ -223,6 +233,44 @@ HTML = """
                 }
             }
 
+            async function streamResults(response) {
+                // Read Server-Sent Events and append tokens as they arrive
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let answer = '';
+                
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    
+                    const events = buffer.split('\\n\\n');
+                    buffer = events.pop();
+                    
+                    for (const rawEvent of events) {
+                        let eventType = 'message';
+                        let payload = '';
+                        rawEvent.split('\\n').forEach(line => {
+                            if (line.startsWith('event: ')) eventType = line.slice(7);
+                            if (line.startsWith('data: ')) payload += line.slice(6);
+                        });
+                        const data = JSON.parse(payload);
+                        
+                        if (eventType === 'done') {
+                            displayResults({ answer: answer, search_type: data.search_type });
+                        } else if (eventType === 'error') {
+                            resultsDiv.innerHTML = `<div class="answer-section">Error: ${data.error}</div>`;
+                        } else {
+                            loadingDiv.style.display = 'none';
+                            answer += data.token;
+                            resultsDiv.innerHTML = '<div class="answer-section"></div>';
+                            resultsDiv.firstChild.textContent = answer;
+                        }
+                    }
+                }
+            }
+
             function displayResults(data) {
                 let html = '';
                 
@@ -240,7 +288,7 @@ HTML = """
                     html += `<div class="debug-item"><strong>Keywords:</strong> ${debug.analysis.keywords.join(', ')}</div>`;
                     html += `<div class="debug-item"><strong>Expanded Terms:</strong> ${debug.analysis.expanded_terms.join(', ')}</div>`;
                     html += `<div class="debug-item"><strong>Confidence:</strong> ${debug.analysis.confidence.toFixed(2)}</div>`;
-                    html += `<div class="debug-item"><strong>Total Search Queries:</strong> ${debug.total_queries}</div>`;
+                    html += `<div class="debug-item"><strong>Total Search Queries:</strong> ${debug.total_queries}${debug.expansion_skipped ? ' (expansion skipped, first pass was confident)' : ''}</div>`;
                     
                     if (debug.search_queries && debug.search_queries.length > 0) {
                         html += `<div class="debug-item"><strong>Search Queries Used:</strong></div>`;
@@ -251,6 +299,11 @@ HTML = """
                         html += `</ul>`;
                     }
                     
+                    if (debug.timings_ms) {
+                        const stages = Object.entries(debug.timings_ms).map(([stage, ms]) => `${stage} ${ms} ms`);
+                        html += `<div class="debug-item"><strong>Timings:</strong> ${stages.join(' · ')}</div>`;
+                    }
+                    
                     html += `</div>`;
                 }
                 
@@ -285,6 +338,9 @@ HTML = """
 
 class RequestHandler(http.server.SimpleHTTPRequestHandler):
     def do_GET(self):
+        if self.path == '/metrics':
+            send_metrics(self)
+            return
         self.send_response(200)
         self.send_header('Content-type', 'text/html')
         self.end_headers()
@@ -296,15 +352,22 @@ class RequestHandler(http.server.SimpleHTTPRequestHandler):
             post_data = self.rfile.read(content_length)
             request_data = json.loads(post_data.decode('utf-8'))
 
+            # Optional per-request ANN settings (nprobe for IVF, ef_search for HNSW)
+            try:
+                search_params = get_search_params(request_data)
+            except ValueError as e:
+                send_json(self, 400, {'error': str(e)})
+                return
+
             try:
                 # Import and use the advanced RAG system
                 from advanced_rag import AdvancedRAGSystem
-                from qa_system import QASystem
+                from engine_registry import registry, get_qa_system, coalesce_answer
                 import os
                 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
                 
                 # Get search type and query
-                search_type = request_data.get('search_type', 'advanced')
+                search_type = request_data.get('search_type', DEFAULT_SEARCH_TYPE)
                 query = request_data['query']
                 
                 response_data = {
@@ -315,29 +378,39 @@ class RequestHandler(http.server.SimpleHTTPRequestHandler):
                 
                 if search_type == 'advanced':
                     # Use advanced RAG system
-                    advanced_rag = AdvancedRAGSystem()
-                    answer = advanced_rag.answer_question(query)
-                    debug_info = advanced_rag.debug_query_processing(query)
+                    advanced_rag = registry.get('advanced_rag', AdvancedRAGSystem)
+                    # One pass produces the answer and everything the debug panel shows
+                    with track_request('/ask', search_type) as outcome:
+                        result = coalesce_answer(query, search_type,
+                                                 lambda: advanced_rag.run(query, search_params=search_params),
+                                                 search_params)
+                        if is_error_answer(result.answer):
+                            outcome['status'] = 'error'
                     
-                    response_data['answer'] = answer
-                    response_data['debug_info'] = debug_info
+                    response_data['answer'] = result.answer
+                    response_data['debug_info'] = result.debug_info()
                     response_data['retrieval_method'] = 'multi_stage'
-                    response_data['documents_used'] = len(debug_info.get('search_queries', []))
+                    response_data['documents_used'] = len(result.chunks)
                 
                 else:
                     # Use basic RAG system
-                    qa_system = QASystem()
+                    qa_system = get_qa_system()
                     
                     if search_type == 'semantic':
-                        answer = qa_system.answer_question(query)
+                        answer_fn = qa_system.answer_question
                     elif search_type == 'keyword':
-                        answer = qa_system.search_by_keywords(query)
+                        answer_fn = qa_system.search_by_keywords
                     elif search_type == 'hybrid':
-                        answer = qa_system.hybrid_search(query)
+                        answer_fn = qa_system.hybrid_search
                     else:
-                        answer = qa_system.answer_question(query)
+                        answer_fn = qa_system.answer_question
                     
-                    response_data['answer'] = answer
+                    # Concurrent identical questions share one answer
+                    with track_request('/ask', search_type) as outcome:
+                        response_data['answer'] = coalesce_answer(
+                            query, search_type, lambda: answer_fn(query, search_params=search_params), search_params)
+                        if is_error_answer(response_data['answer']):
+                            outcome['status'] = 'error'
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -353,9 +426,50 @@ class RequestHandler(http.server.SimpleHTTPRequestHandler):
                     'error': f'Error processing question: {str(e)}'
                 }).encode())
 
-def run_server(port=8000):
-    with socketserver.TCPServer(("", port), RequestHandler) as httpd:
-        print(f"Advanced RAG Server running at http://localhost:{port}")
+        elif self.path == '/ask/stream':
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            request_data = json.loads(post_data.decode('utf-8'))
+            search_type = request_data.get('search_type', DEFAULT_SEARCH_TYPE)
+
+            # Advanced RAG builds debug info from the full answer, so it is only served by /ask
+            if search_type == 'advanced':
+                self.send_response(400)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({
+                    'error': 'Streaming is not available for advanced search, use /ask'
+                }).encode())
+                return
+
+            try:
+                search_params = get_search_params(request_data)
+            except ValueError as e:
+                send_json(self, 400, {'error': str(e)})
+                return
+
+            try:
+                from engine_registry import get_qa_system
+                
+                qa_system = get_qa_system()
+            except Exception as e:
+                logger.error(f"Error processing question: {str(e)}")
+                self.send_response(500)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({
+                    'error': f'Error processing question: {str(e)}'
+                }).encode())
+                return
+            
+            tokens = qa_system.stream_answer(request_data['query'], search_type,
+                                             search_params=search_params)
+            with track_request('/ask/stream', search_type) as outcome:
+                outcome['status'] = send_event_stream(self, tokens, {'search_type': search_type})
+
+def run_server(port=8000, workers=DEFAULT_WORKERS, queue_limit=DEFAULT_QUEUE_LIMIT):
+    with ThreadPoolHTTPServer(("", port), RequestHandler, workers=workers, queue_limit=queue_limit) as httpd:
+        print(f"Advanced RAG Server running at http://localhost:{port} ({workers} workers, queue limit {queue_limit})")
         webbrowser.open(f"http://localhost:{port}")
         httpd.serve_forever()
 
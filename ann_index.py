@@ -0,0 +1,173 @@
+"""Approximate nearest neighbour FAISS indexes for large corpora.
+
+The default LangChain store uses an exact flat index, so every search scans
+every vector. This module builds IVF-Flat, IVF-PQ and HNSW indexes from the
+vectors of an existing store, and turns per-request `nprobe` / `ef_search`
+settings into FAISS search parameters.
+
+    python ann_index.py hnsw --hnsw-m 32 --ef-search 64
+    python ann_index.py ivf_pq --nlist 4096 --pq-m 64
+"""
+import os
+import math
+import argparse
+import threading
+import logging
+from typing import Iterable, Optional
+
+import faiss
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+# FAISS warns below ~39 training points per IVF list
+MIN_POINTS_PER_LIST = 39
+DEFAULT_TRAIN_SIZE = int(os.getenv('ANN_TRAIN_SIZE', '100000'))
+ADD_BATCH_SIZE = 65536
+
+_direct_map_lock = threading.Lock()
+
+def default_nlist(n: int) -> int:
+    """Rule-of-thumb IVF list count: about 4 * sqrt(n), with enough points to train each list"""
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_LIST))
+
+def build_index(vectors: np.ndarray, index_type: str, metric: int = faiss.METRIC_L2,
+                nlist: Optional[int] = None, nprobe: int = 8, pq_m: int = 16, pq_bits: int = 8,
+                hnsw_m: int = 32, ef_construction: int = 200, ef_search: int = 64,
+                train_size: int = DEFAULT_TRAIN_SIZE, seed: int = 0):
+    """Build and fill a FAISS index of `index_type`, training IVF variants on a random sample"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vectors.shape
+
+    if index_type == 'flat':
+        index = faiss.IndexFlat(d, metric)
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(d, hnsw_m, metric)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+    else:
+        nlist = nlist or default_nlist(n)
+        quantizer = faiss.IndexFlat(d, metric)
+        if index_type == 'ivf_flat':
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, metric)
+        else:
+            if d % pq_m:
+                raise ValueError(f"pq_m={pq_m} must divide the vector dimension {d}")
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m, pq_bits, metric)
+        index.nprobe = nprobe
+
+        sample = vectors
+        if n > train_size:
+            rng = np.random.default_rng(seed)
+            sample = vectors[np.sort(rng.choice(n, size=train_size, replace=False))]
+        logger.info(f"Training {index_type} (nlist={nlist}) on {len(sample)} vectors...")
+        index.train(sample)
+
+    for start in range(0, n, ADD_BATCH_SIZE):
+        index.add(vectors[start:start + ADD_BATCH_SIZE])
+    logger.info(f"✓ Built {index_type} index over {index.ntotal} vectors")
+    return index
+
+def index_type_of(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(index, faiss.IndexIVF):
+        return 'ivf_flat'
+    return 'flat'
+
+def reconstruct_all(index) -> np.ndarray:
+    """Every stored vector in id order (approximate for PQ indexes)"""
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+def reconstruct(index, position: int) -> np.ndarray:
+    """One stored vector (approximate for PQ indexes), building an IVF index's direct map on first use"""
+    if isinstance(index, faiss.IndexIVF):
+        with _direct_map_lock:
+            if index.direct_map.no():
+                index.make_direct_map()
+    return index.reconstruct(position)
+
+def convert_store(db, index_type: str, **kwargs):
+    """Replace a LangChain FAISS store's index with one of `index_type`, keeping ids in place"""
+    vectors = reconstruct_all(db.index)
+    db.index = build_index(vectors, index_type, metric=db.index.metric_type, **kwargs)
+    return db
+
+def search_parameters(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      exclude: Optional[np.ndarray] = None):
+    """FAISS SearchParameters for one query, or None to use the index defaults.
+
+    `exclude` lists index positions FAISS must skip while searching, so
+    excluded vectors never take a place in the top k.
+    """
+    selector = {}
+    if exclude is not None and len(exclude):
+        selector['sel'] = faiss.IDSelectorNot(faiss.IDSelectorBatch(np.asarray(exclude, dtype=np.int64)))
+    # Parameters replace the index settings wholesale, so a selector alone keeps the index's own
+    if isinstance(index, faiss.IndexIVF) and (nprobe or selector):
+        return faiss.SearchParametersIVF(nprobe=int(nprobe or index.nprobe), **selector)
+    if isinstance(index, faiss.IndexHNSW) and (ef_search or selector):
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search or index.hnsw.efSearch), **selector)
+    return faiss.SearchParameters(**selector) if selector else None
+
+def delete_chunks(db, ids: Iterable[str]):
+    """Remove chunks from a LangChain FAISS store whatever its index type.
+
+    FAISS.delete relies on remove_ids renumbering the remaining vectors, which
+    only flat indexes do (IVF keeps the old ids and HNSW cannot remove at all),
+    so other index types are refilled with the surviving vectors instead.
+    """
+    ids = list(ids)
+    index = db.index
+    if isinstance(index, faiss.IndexFlat):
+        db.delete(ids)
+        return
+
+    removed = set(ids)
+    keep = [i for i in range(index.ntotal) if db.index_to_docstore_id[i] not in removed]
+    vectors = reconstruct_all(index)[keep]
+    # A clone keeps the trained quantizer and search settings; reset drops the stored vectors
+    rebuilt = faiss.clone_index(index)
+    rebuilt.reset()
+    rebuilt.add(vectors)
+    db.index = rebuilt
+    db.docstore.delete(ids)
+    db.index_to_docstore_id = {position: db.index_to_docstore_id[old] for position, old in enumerate(keep)}
+
+def main():
+    from dotenv import load_dotenv
+    from chunk_store import load_index, save_index
+    from qa_system import INDEX_PATH, create_embeddings
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('index_type', choices=INDEX_TYPES)
+    parser.add_argument('--index-path', default=INDEX_PATH)
+    parser.add_argument('--nlist', type=int, default=None, help='IVF lists (default ~4*sqrt(n))')
+    parser.add_argument('--nprobe', type=int, default=8, help='Default IVF lists searched per query')
+    parser.add_argument('--pq-m', type=int, default=16, help='PQ sub-quantizers (must divide the dimension)')
+    parser.add_argument('--pq-bits', type=int, default=8)
+    parser.add_argument('--hnsw-m', type=int, default=32)
+    parser.add_argument('--ef-construction', type=int, default=200)
+    parser.add_argument('--ef-search', type=int, default=64, help='Default HNSW candidates per query')
+    parser.add_argument('--train-size', type=int, default=DEFAULT_TRAIN_SIZE)
+    args = parser.parse_args()
+
+    db = load_index(args.index_path, create_embeddings(), mmap=False)
+    logger.info(f"Converting {index_type_of(db.index)} index with {db.index.ntotal} vectors to {args.index_type}")
+    convert_store(db, args.index_type, nlist=args.nlist, nprobe=args.nprobe, pq_m=args.pq_m,
+                  pq_bits=args.pq_bits, hnsw_m=args.hnsw_m, ef_construction=args.ef_construction,
+                  ef_search=args.ef_search, train_size=args.train_size)
+    save_index(db, args.index_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from cache_utils import LRUCache
+from embedding_cache import normalize_text
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+DEFAULT_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '1000'))
+DEFAULT_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', '3600'))
+
+class _Entry:
+    def __init__(self, bucket: Tuple, vector: np.ndarray, answer: str, expires_at: Optional[float]):
+        self.bucket = bucket
+        self.vector = vector
+        self.answer = answer
+        self.expires_at = expires_at
+
+class SemanticAnswerCache:
+    """Caches generated answers by query embedding and the chunks they were built from.
+
+    A stored answer is reused when a new query's embedding is within the cosine
+    threshold of the cached one and retrieval returned exactly the same chunk
+    ids, so paraphrased questions over unchanged context skip generation.
+
+    Search types that never embed the query (keyword search) use the exact
+    methods instead, which match on the normalized query text.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, maxsize: int = DEFAULT_CACHE_SIZE,
+                 ttl: Optional[float] = DEFAULT_CACHE_TTL):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # (search type, chunk ids) -> ids of entries built from that context
+        self._buckets: Dict[Tuple, List[int]] = {}
+        self._next_id = 0
+        self._exact = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _bucket(search_type: str, chunk_ids: Iterable[str]) -> Tuple:
+        return (search_type, frozenset(chunk_ids))
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, search_type: str, query_vector, chunk_ids: Iterable[str]) -> Optional[str]:
+        """Return a cached answer for a similar query over the same chunks, if any"""
+        bucket = self._bucket(search_type, chunk_ids)
+        vector = self._normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            for entry_id in list(self._buckets.get(bucket, ())):
+                entry = self._entries[entry_id]
+                if entry.expires_at is not None and entry.expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                if float(np.dot(vector, entry.vector)) >= self.threshold:
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    metrics.inc('answer_cache_requests_total', search_type=search_type, result='hit')
+                    return entry.answer
+            self.misses += 1
+            metrics.inc('answer_cache_requests_total', search_type=search_type, result='miss')
+            return None
+
+    def store(self, search_type: str, query_vector, chunk_ids: Iterable[str], answer: str):
+        bucket = self._bucket(search_type, chunk_ids)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        entry = _Entry(bucket, self._normalize(query_vector), answer, expires_at)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._buckets.setdefault(bucket, []).append(entry_id)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def lookup_exact(self, search_type: str, query: str, chunk_ids: Iterable[str]) -> Optional[str]:
+        """Return a cached answer for the same normalized query over the same chunks, if any"""
+        answer = self._exact.get((self._bucket(search_type, chunk_ids), normalize_text(query)))
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.inc('answer_cache_requests_total', search_type=search_type, result='miss' if answer is None else 'hit')
+        return answer
+
+    def store_exact(self, search_type: str, query: str, chunk_ids: Iterable[str], answer: str):
+        self._exact.set((self._bucket(search_type, chunk_ids), normalize_text(query)), answer)
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._buckets[entry.bucket]
+        ids.remove(entry_id)
+        if not ids:
+            del self._buckets[entry.bucket]
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. after the FAISS index is rebuilt"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+        self._exact.clear()
+        logger.info("Answer cache invalidated")
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import random
+import threading
+import logging
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, ReadTimeoutError
+
+import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+ANTHROPIC_VERSION = "bedrock-2023-05-31"
+
+REGION = os.getenv('BEDROCK_REGION', 'us-east-1')
+MAX_POOL_CONNECTIONS = int(os.getenv('BEDROCK_MAX_CONNECTIONS', '50'))
+CONNECT_TIMEOUT = float(os.getenv('BEDROCK_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('BEDROCK_READ_TIMEOUT', '120'))
+MAX_ATTEMPTS = int(os.getenv('BEDROCK_MAX_ATTEMPTS', '5'))
+REQUESTS_PER_SECOND = float(os.getenv('BEDROCK_REQUESTS_PER_SECOND', '5'))
+BURST = int(os.getenv('BEDROCK_BURST', '10'))
+
+# Error codes that mean "try again later" rather than "this request is wrong"
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+    'InternalServerException',
+}
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'TooManyRequestsException'}
+
+class TokenBucket:
+    """Thread-safe token bucket limiting how fast requests are sent"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: Optional[float] = None) -> bool:
+        """Block until a token is available; False if the deadline passes first"""
+        if self.rate <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+_runtime_clients: Dict[str, Any] = {}
+_runtime_lock = threading.Lock()
+
+def _build_runtime_client(retries: Dict[str, Any]):
+    config = Config(
+        region_name=REGION,
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        tcp_keepalive=True,
+        retries=retries
+    )
+    return boto3.client('bedrock-runtime', config=config)
+
+def get_runtime_client():
+    """Return the process-wide bedrock-runtime client used for Claude calls.
+
+    botocore retries are disabled because BedrockClient retries itself, so
+    every attempt goes through the shared rate limiter.
+    """
+    return _get_runtime_client('llm', {'total_max_attempts': 1, 'mode': 'standard'})
+
+def get_embedding_runtime_client():
+    """Return the process-wide bedrock-runtime client used by LangChain embeddings.
+
+    LangChain calls invoke_model directly, so this client relies on botocore's
+    adaptive retry mode (backoff plus client-side rate limiting) instead.
+    """
+    return _get_runtime_client('embeddings', {'total_max_attempts': MAX_ATTEMPTS, 'mode': 'adaptive'})
+
+def _get_runtime_client(name: str, retries: Dict[str, Any]):
+    client = _runtime_clients.get(name)
+    if client is None:
+        with _runtime_lock:
+            client = _runtime_clients.get(name)
+            if client is None:
+                client = _runtime_clients[name] = _build_runtime_client(retries)
+    return client
+
+def record_tokens(model_id: str, input_tokens: Optional[int], output_tokens: Optional[int]):
+    """Add the token counts Bedrock reported for a call to the token counters"""
+    if input_tokens:
+        metrics.inc('bedrock_tokens_total', input_tokens, model=model_id, direction='input')
+    if output_tokens:
+        metrics.inc('bedrock_tokens_total', output_tokens, model=model_id, direction='output')
+
+class BedrockClient:
+    """Single entry point for calling Claude on Bedrock.
+
+    Adds a shared token-bucket rate limiter, jittered exponential backoff on
+    throttling and transient errors, and an optional per-call deadline.
+    """
+
+    def __init__(self, client=None, model_id: str = DEFAULT_MODEL_ID,
+                 rate_limiter: Optional[TokenBucket] = None, max_attempts: int = MAX_ATTEMPTS,
+                 base_delay: float = 0.5, max_delay: float = 20.0):
+        self.client = client or get_runtime_client()
+        self.model_id = model_id
+        self.rate_limiter = rate_limiter or TokenBucket(REQUESTS_PER_SECOND, BURST)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def _messages_body(prompt: str, max_tokens: int, temperature: Optional[float]) -> Dict[str, Any]:
+        body = {
+            "anthropic_version": ANTHROPIC_VERSION,
+            "max_tokens": max_tokens,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+        if temperature is not None:
+            body["temperature"] = temperature
+        return body
+
+    def _call(self, fn: Callable[[], Any], timeout: Optional[float]) -> Any:
+        """Run `fn` under the rate limiter, retrying retryable failures with full jitter"""
+        deadline = time.monotonic() + timeout if timeout else None
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.rate_limiter.acquire(deadline):
+                raise TimeoutError("Timed out waiting for Bedrock rate limiter")
+            try:
+                return fn()
+            except ClientError as e:
+                code = e.response.get('Error', {}).get('Code', '')
+                if code not in RETRYABLE_ERROR_CODES or attempt == self.max_attempts:
+                    raise
+                reason = "Throttled" if code in THROTTLING_ERROR_CODES else code
+                if code in THROTTLING_ERROR_CODES:
+                    metrics.inc('bedrock_throttles_total')
+            except (BotoConnectionError, ReadTimeoutError) as e:
+                if attempt == self.max_attempts:
+                    raise
+                reason = type(e).__name__
+
+            metrics.inc('bedrock_retries_total', reason=reason)
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise TimeoutError(f"Bedrock call did not succeed before its deadline ({reason})")
+            logger.warning(f"{reason}, retrying in {delay:.2f} seconds... (attempt {attempt}/{self.max_attempts})")
+            time.sleep(delay)
+
+    def invoke_json(self, body: Dict[str, Any], model_id: Optional[str] = None,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Invoke a model with a raw JSON body and return the parsed response body"""
+        model_id = model_id or self.model_id
+        with metrics.timer('bedrock_call_seconds', model=model_id):
+            response = self._call(
+                lambda: self.client.invoke_model(modelId=model_id, body=json.dumps(body)),
+                timeout
+            )
+            response_body = json.loads(response['body'].read())
+        usage = response_body.get('usage') or {}
+        # Claude reports input/output usage; Titan embeddings only an input token count
+        record_tokens(model_id, usage.get('input_tokens', response_body.get('inputTextTokenCount')),
+                      usage.get('output_tokens'))
+        return response_body
+
+    def invoke(self, prompt: str, max_tokens: int = 500, temperature: Optional[float] = None,
+               model_id: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """Send a single-turn prompt to Claude and return the answer text"""
+        with metrics.timer('rag_stage_seconds', stage='generate'):
+            response_body = self.invoke_json(self._messages_body(prompt, max_tokens, temperature), model_id, timeout)
+        return response_body['content'][0]['text']
+
+    def stream(self, prompt: str, max_tokens: int = 500, temperature: Optional[float] = None,
+               model_id: Optional[str] = None, timeout: Optional[float] = None) -> Iterator[str]:
+        """Send a prompt and yield answer text deltas as Claude generates them"""
+        model_id = model_id or self.model_id
+        body = json.dumps(self._messages_body(prompt, max_tokens, temperature))
+        start = time.perf_counter()
+        response = self._call(
+            lambda: self.client.invoke_model_with_response_stream(modelId=model_id, body=body),
+            timeout
+        )
+        first_token = True
+        for event in response['body']:
+            chunk = event.get('chunk')
+            if not chunk:
+                continue
+            data = json.loads(chunk['bytes'])
+            if data.get('type') == 'content_block_delta':
+                if first_token:
+                    metrics.observe('bedrock_first_token_seconds', time.perf_counter() - start, model=model_id)
+                    first_token = False
+                yield data['delta'].get('text', '')
+            elif data.get('type') == 'message_start':
+                record_tokens(model_id, data.get('message', {}).get('usage', {}).get('input_tokens'), None)
+            elif data.get('type') == 'message_delta':
+                record_tokens(model_id, None, data.get('usage', {}).get('output_tokens'))
+        seconds = time.perf_counter() - start
+        metrics.observe('bedrock_call_seconds', seconds, model=model_id)
+        metrics.observe('rag_stage_seconds', seconds, stage='generate')
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+def get_bedrock_client() -> BedrockClient:
+    """Return the process-wide BedrockClient so every caller shares one pool and rate limit"""
+    global _shared_client
+    if _shared_client is None:
+        with _shared_lock:
+            if _shared_client is None:
+                _shared_client = BedrockClient()
+    return _shared_client
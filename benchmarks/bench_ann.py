@@ -0,0 +1,97 @@
+"""Recall@k vs query latency of the ANN index types against the exact flat index.
+
+Uses synthetic clustered vectors by default, or the vectors of a saved index
+with --index-path. Queries are searched one at a time, as the web app does.
+Run from the repository root:
+
+    python -m benchmarks.bench_ann --vectors 200000 --dim 256 --queries 500
+    python -m benchmarks.bench_ann --index-path temp_index
+"""
+import time
+import argparse
+import statistics
+
+import faiss
+import numpy as np
+
+from ann_index import build_index, default_nlist, reconstruct_all, search_parameters
+
+NPROBES = [1, 4, 16, 64]
+EF_SEARCHES = [16, 32, 64, 128]
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Gaussian clusters, which behave more like text embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+
+def load_vectors(index_path: str) -> np.ndarray:
+    return reconstruct_all(faiss.read_index(f"{index_path}/index.faiss"))
+
+def run_queries(index, queries: np.ndarray, k: int, params=None):
+    """Search queries one by one; return result ids and per-query latencies in ms"""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        if params is not None:
+            _, row = index.search(query[None, :], k, params=params)
+        else:
+            _, row = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids[i] = row[0]
+    return ids, latencies
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(row) & set(expected)) for row, expected in zip(found, truth))
+    return hits / truth.size
+
+def report(label: str, found, latencies, truth):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<24} recall={recall_at_k(found, truth):.3f}  "
+          f"mean={statistics.mean(latencies):7.3f} ms  p95={p95:7.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index-path', default=None, help='Benchmark the vectors of a saved index')
+    parser.add_argument('--vectors', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--pq-m', type=int, default=16)
+    parser.add_argument('--hnsw-m', type=int, default=32)
+    parser.add_argument('--threads', type=int, default=1, help='FAISS OpenMP threads')
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    vectors = load_vectors(args.index_path) if args.index_path else synthetic_vectors(args.vectors, args.dim)
+    rng = np.random.default_rng(1)
+    # Queries are perturbed corpus vectors so every query has true near neighbours
+    queries = vectors[rng.choice(len(vectors), size=args.queries)]
+    queries = queries + 0.1 * rng.normal(size=queries.shape).astype(np.float32)
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {args.queries} queries, k={args.k}, "
+          f"nlist={default_nlist(len(vectors))}\n")
+
+    flat = build_index(vectors, 'flat')
+    truth, latencies = run_queries(flat, queries, args.k)
+    report('flat (exact)', truth, latencies, truth)
+
+    for index_type in ('ivf_flat', 'ivf_pq'):
+        start = time.perf_counter()
+        index = build_index(vectors, index_type, pq_m=args.pq_m)
+        print(f"\n{index_type}: built in {time.perf_counter() - start:.1f}s")
+        for nprobe in NPROBES:
+            found, latencies = run_queries(index, queries, args.k, search_parameters(index, nprobe=nprobe))
+            report(f"{index_type} nprobe={nprobe}", found, latencies, truth)
+
+    start = time.perf_counter()
+    index = build_index(vectors, 'hnsw', hnsw_m=args.hnsw_m)
+    print(f"\nhnsw: built in {time.perf_counter() - start:.1f}s")
+    for ef_search in EF_SEARCHES:
+        found, latencies = run_queries(index, queries, args.k, search_parameters(index, ef_search=ef_search))
+        report(f"hnsw ef_search={ef_search}", found, latencies, truth)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Load time, memory and lookup latency of the chunk table vs LangChain's pickled docstore.
+
+Writes N synthetic chunks both ways (vectors are left out; this measures only
+the docstore), then loads each in a fresh process and fetches random chunks
+by id the way retrieval does. Linux only (reads /proc). Run from the repository root:
+
+    python -m benchmarks.bench_chunk_store --chunks 1000000
+"""
+import os
+import time
+import pickle
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+from benchmarks.bench_mmap import memory_kb
+
+TEXT = "lorem ipsum dolor sit amet, consectetur adipiscing elit " * 8
+
+def chunk_records(chunks: int):
+    for i in range(chunks):
+        yield f"{i:08d}-chunk", f"Chunk {i}. {TEXT}", {'source': f"doc-{i // 50}.pdf", 'chunk': i % 50}
+
+def build(path: str, chunks: int):
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_core.documents import Document
+    from chunk_table import TABLE_FILES, write_chunk_table
+
+    start = time.perf_counter()
+    write_chunk_table(path, chunk_records(chunks))
+    table_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    documents = {chunk_id: Document(page_content=text, metadata=metadata)
+                 for chunk_id, text, metadata in chunk_records(chunks)}
+    with open(os.path.join(path, "index.pkl"), 'wb') as f:
+        pickle.dump((InMemoryDocstore(documents), {i: chunk_id for i, chunk_id in enumerate(documents)}), f)
+    pickle_seconds = time.perf_counter() - start
+
+    def size(names):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in names) / 2 ** 20
+    print(f"Wrote chunk table in {table_seconds:.1f}s ({size(TABLE_FILES):.0f} MB), "
+          f"pickle in {pickle_seconds:.1f}s ({size(['index.pkl']):.0f} MB)\n")
+
+def worker(mode: str, path: str, chunks: int, lookups: int, results):
+    import random
+    # Imported up front so import cost is not counted as load time
+    from langchain_community.docstore.in_memory import InMemoryDocstore  # noqa: F401
+    from chunk_store import ChunkIdMap, MappedDocstore
+    from chunk_table import ChunkTable
+
+    rss_before = memory_kb()[0]
+    start = time.perf_counter()
+    if mode == 'pickle':
+        with open(os.path.join(path, "index.pkl"), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    else:
+        table = ChunkTable(path)
+        docstore, index_to_docstore_id = MappedDocstore(table), ChunkIdMap(table)
+    load_seconds = time.perf_counter() - start
+    rss_after = memory_kb()[0]
+
+    rng = random.Random(0)
+    positions = [rng.randrange(chunks) for _ in range(lookups)]
+    start = time.perf_counter()
+    for position in positions:
+        docstore.search(index_to_docstore_id[position]).page_content
+    lookup_us = (time.perf_counter() - start) / lookups * 1e6
+    results.put((load_seconds, (rss_after - rss_before) / 1024, lookup_us))
+
+def run(mode: str, path: str, chunks: int, lookups: int):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    process = ctx.Process(target=worker, args=(mode, path, chunks, lookups, results))
+    process.start()
+    load_seconds, rss_mb, lookup_us = results.get()
+    process.join()
+    print(f"{mode:<12} load={load_seconds * 1000:9.1f} ms  RSS growth={rss_mb:8.1f} MB  "
+          f"lookup={lookup_us:6.1f} µs/chunk")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=10000)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix='bench_chunk_store_')
+    try:
+        build(path, args.chunks)
+        run('pickle', path, args.chunks, args.lookups)
+        run('chunk table', path, args.chunks, args.lookups)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Local embedding throughput and query latency for each sentence-transformers runtime.
+
+Loads the model with torch, ONNX and int8-quantized ONNX in turn, then times
+single-query embedding (what a request pays) and batched document embedding
+(what ingestion pays). Also reports how closely each runtime's vectors agree
+with torch. Run from the repository root:
+
+    python -m benchmarks.bench_embeddings --texts 2000 --threads 4
+"""
+import time
+import argparse
+
+import numpy as np
+
+from local_embeddings import DEFAULT_MODEL, RUNTIMES, LocalEmbeddings
+from benchmarks.bench_intent import make_queries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--runtimes', nargs='+', choices=RUNTIMES, default=list(RUNTIMES))
+    parser.add_argument('--texts', type=int, default=2000, help='Documents embedded per runtime')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--threads', type=int, default=0, help='Inference threads (0 = library default)')
+    args = parser.parse_args()
+
+    # Longer texts than queries, roughly the size of a small chunk
+    documents = [' '.join(make_queries(8, seed=i)) for i in range(args.texts)]
+    queries = make_queries(args.queries)
+    reference = None
+    for runtime in args.runtimes:
+        start = time.perf_counter()
+        try:
+            model = LocalEmbeddings(args.model, runtime, batch_size=args.batch_size, threads=args.threads)
+        except Exception as e:
+            print(f"{runtime:<10} unavailable: {e}")
+            continue
+        load_seconds = time.perf_counter() - start
+        model.embed_documents(documents[:args.batch_size])
+
+        start = time.perf_counter()
+        vectors = np.array([model.embed_query(query) for query in queries])
+        query_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        start = time.perf_counter()
+        model.embed_documents(documents)
+        docs_per_second = len(documents) / (time.perf_counter() - start)
+
+        # Vectors are unit length, so the row-wise dot product is the cosine similarity
+        if reference is None:
+            reference = vectors
+        agreement = float(np.mean(np.sum(vectors * reference, axis=1)))
+        print(f"{runtime:<10} load={load_seconds:5.1f}s  query={query_ms:6.2f} ms  "
+              f"documents={docs_per_second:8.1f}/s  cosine vs {args.runtimes[0]}={agreement:.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Intent classification throughput: the per-pattern re.search loop vs one precompiled regex.
+
+Classifies N synthetic questions both ways and reports time per query and how
+often the two agree; disagreements are mostly short cues the old loop matched
+inside other words. Run from the repository root:
+
+    python -m benchmarks.bench_intent --queries 100000
+"""
+import re
+import time
+import random
+import argparse
+from collections import Counter
+
+from query_processor import INTENT_PATTERNS, IntentClassifier, QueryIntent
+
+TEMPLATES = [
+    "what is {}", "who are the authors of {}", "compare {} and {}", "{} vs {}",
+    "how to train {}", "how does {} work", "why does {} fail", "explain {}",
+    "define {}", "what does {} mean", "when was {} introduced", "what causes {} to degrade",
+    "summarize the canvas of {}", "list {} benchmarks", "{} results in the appendix",
+]
+TOPICS = [
+    "transformers", "RAG", "attention", "BERT", "overfitting", "the tokenizer", "beam search",
+    "dropout", "vector databases", "runtime performance", "the evaluation dataset", "GPT models",
+]
+
+def legacy_classify(query: str) -> QueryIntent:
+    """The original classifier: re.search for every raw pattern until one matches"""
+    query_lower = query.lower()
+    for intent, patterns in INTENT_PATTERNS.items():
+        for pattern in patterns:
+            if re.search(pattern, query_lower):
+                return intent
+    return QueryIntent.UNKNOWN
+
+def make_queries(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        template = rng.choice(TEMPLATES)
+        queries.append(template.format(*rng.sample(TOPICS, template.count("{}"))))
+    return queries
+
+def timed(classify, queries):
+    start = time.perf_counter()
+    results = [classify(query) for query in queries]
+    return results, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=100000)
+    args = parser.parse_args()
+
+    queries = make_queries(args.queries)
+    classifier = IntentClassifier()
+    # re caches compiled patterns, so warm both paths before timing
+    timed(legacy_classify, queries[:1000])
+    timed(classifier.classify, queries[:1000])
+
+    legacy, legacy_seconds = timed(legacy_classify, queries)
+    compiled, compiled_seconds = timed(classifier.classify, queries)
+    _, scores_seconds = timed(classifier.scores, queries)
+
+    for label, seconds in (('re.search loop', legacy_seconds), ('compiled regex', compiled_seconds),
+                           ('compiled + scores', scores_seconds)):
+        print(f"{label:<18} {seconds:6.2f} s  {seconds / len(queries) * 1e6:6.2f} µs/query")
+    print(f"\nSpeedup: {legacy_seconds / compiled_seconds:.1f}x")
+
+    changed = Counter((query, old.value, new.value)
+                      for query, old, new in zip(queries, legacy, compiled) if old != new)
+    agreement = 1 - sum(changed.values()) / len(queries)
+    print(f"Agreement: {agreement:.1%}")
+    for (query, old, new), _ in changed.most_common(5):
+        print(f"  {query!r}: {old} -> {new}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Cold vs warm invocation time of src/lambda_function.py against stubbed AWS clients.
+
+Real boto3 clients are constructed (so client creation cost is measured) but
+their network calls are replaced with local fakes. Run from the repository root:
+
+    python -m benchmarks.bench_lambda_coldstart --cold-starts 5 --warm 50
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import statistics
+
+import boto3
+
+from benchmarks.stubs import FakeBedrockClient
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+RELOADED_MODULES = ['lambda_function', 'bedrock_client']
+
+_real_client = boto3.client
+
+def stubbed_client(service_name, *args, **kwargs):
+    """Build a real boto3 client, then swap its network calls for fakes"""
+    client = _real_client(service_name, *args, **kwargs)
+    if service_name == 'bedrock-runtime':
+        fake = FakeBedrockClient(first_token_latency=0, token_latency=0)
+        client.invoke_model = fake.invoke_model
+        client.invoke_model_with_response_stream = fake.invoke_model_with_response_stream
+    elif service_name == 'sts':
+        client.get_caller_identity = lambda: {'Arn': 'arn:aws:iam::000000000000:user/bench'}
+    elif service_name == 's3':
+        client.put_object = lambda **kw: {}
+    return client
+
+def make_event():
+    return {'body': json.dumps({'context': 'FAISS stores document vectors. ' * 200,
+                                'query': 'Where are document vectors stored?'})}
+
+def cold_start():
+    """Import the handler from scratch and run one invocation"""
+    for name in RELOADED_MODULES:
+        sys.modules.pop(name, None)
+    start = time.perf_counter()
+    module = importlib.import_module('lambda_function')
+    init = time.perf_counter() - start
+    start = time.perf_counter()
+    module.lambda_handler(make_event(), None)
+    first = time.perf_counter() - start
+    return module, init, first
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cold-starts', type=int, default=5)
+    parser.add_argument('--warm', type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('BEDROCK_REQUESTS_PER_SECOND', '0')
+    boto3.client = stubbed_client
+    sys.path.insert(0, SRC_DIR)
+
+    inits, firsts = [], []
+    for _ in range(args.cold_starts):
+        module, init, first = cold_start()
+        inits.append(init)
+        firsts.append(first)
+
+    warm = []
+    for _ in range(args.warm):
+        start = time.perf_counter()
+        module.lambda_handler(make_event(), None)
+        warm.append(time.perf_counter() - start)
+
+    print(f"Cold init (import + clients): {statistics.median(inits) * 1000:8.2f} ms median")
+    print(f"First invocation:             {statistics.median(firsts) * 1000:8.2f} ms median")
+    print(f"Warm invocation:              {statistics.median(warm) * 1000:8.2f} ms median "
+          f"(p95 {sorted(warm)[int(len(warm) * 0.95) - 1] * 1000:.2f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Per-worker load time and memory: pickled docstore vs memory-mapped chunk table.
+
+Builds a synthetic index with its keyword index, then starts N worker
+processes that each load it, run a few vector and keyword searches and fetch
+chunk texts, and report their memory while all of them are alive. The
+`pickle` workers load the legacy pickle and decode the BM25 postings into
+their heap; the `mmap` workers construct QASystem (with Bedrock faked), so
+the time is the real server start-up. RSS counts shared page-cache pages in every process; PSS
+splits them between the processes that share them, so the PSS total is what
+the machine actually pays. Linux only (reads /proc). Run from the repository root:
+
+    python -m benchmarks.bench_mmap --chunks 200000 --dim 1536 --workers 4
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+import faiss
+import numpy as np
+
+def memory_kb():
+    """(RSS, PSS) of this process in kB"""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss'):
+                values[name] = int(rest.split()[0])
+    return values['Rss'], values['Pss']
+
+def build_index(path: str, chunks: int, dim: int):
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    import keyword_index
+    from chunk_store import load_index, save_index
+
+    rng = np.random.default_rng(0)
+    index = faiss.IndexFlatL2(dim)
+    for start in range(0, chunks, 50000):
+        index.add(rng.random((min(50000, chunks - start), dim), dtype=np.float32))
+    ids = [f"chunk-{i}" for i in range(chunks)]
+    docstore = InMemoryDocstore({
+        chunk_id: Document(page_content=f"Synthetic chunk {i}. " + "lorem ipsum dolor sit amet " * 30,
+                           metadata={'source': f"doc-{i // 20}.pdf", 'chunk': i % 20})
+        for i, chunk_id in enumerate(ids)
+    })
+    # index.faiss and the pickled index.pkl for the legacy path, plus the chunk table beside them
+    db = FAISS(None, index, docstore, dict(enumerate(ids)))
+    db.save_local(path)
+    save_index(db, path)
+    keyword_index.load_or_build(load_index(path, None), path)
+
+def install_fake(dim: int):
+    """Route Bedrock calls in this process to a zero-latency fake, so QASystem needs no AWS"""
+    import bedrock_client
+    from bedrock_client import BedrockClient, TokenBucket
+    from benchmarks.stubs import FakeBedrockClient
+    fake = FakeBedrockClient(embedding_dim=dim)
+    bedrock_client._runtime_clients['llm'] = fake
+    bedrock_client._runtime_clients['embeddings'] = fake
+    bedrock_client._shared_client = BedrockClient(client=fake, rate_limiter=TokenBucket(0, 1))
+
+def worker(mode: str, path: str, dim: int, barrier, results):
+    from langchain_community.vectorstores import FAISS
+    from keyword_index import BM25Index
+    from qa_system import QASystem
+
+    install_fake(dim)
+    start = time.perf_counter()
+    if mode == 'pickle':
+        db = FAISS.load_local(path, None, allow_dangerous_deserialization=True)
+        keyword_idx = BM25Index.load(path)
+        keyword_idx._materialize()
+    else:
+        qa = QASystem(index_path=path)
+        db, keyword_idx = qa.db, qa.keyword_index
+    load_seconds = time.perf_counter() - start
+
+    # Touch the data the way serving does: searches scan the vectors and postings, answers read a few chunks
+    rng = np.random.default_rng(os.getpid())
+    _, indices = db.index.search(rng.random((20, dim), dtype=np.float32), 5)
+    for i in indices.ravel():
+        db.docstore.search(db.index_to_docstore_id[int(i)])
+    for i in rng.integers(0, db.index.ntotal, 20).tolist():
+        keyword_idx.search(f"synthetic chunk {i} lorem", k=5)
+
+    barrier.wait()
+    rss, pss = memory_kb()
+    results.put((load_seconds, rss, pss))
+    barrier.wait()
+
+def run(mode: str, path: str, dim: int, workers: int):
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(mode, path, dim, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    loads = [sample[0] for sample in samples]
+    rss = [sample[1] / 1024 for sample in samples]
+    pss = [sample[2] / 1024 for sample in samples]
+    print(f"{mode:<7} load={np.median(loads) * 1000:8.1f} ms  RSS/worker={np.mean(rss):8.1f} MB  "
+          f"PSS/worker={np.mean(pss):8.1f} MB  PSS total={sum(pss):8.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=1536, help='Titan v1 embeddings are 1536-d')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix='bench_mmap_')
+    try:
+        start = time.perf_counter()
+        build_index(path, args.chunks, args.dim)
+        print(f"Built {args.chunks} chunks x {args.dim}-d in {time.perf_counter() - start:.1f}s; "
+              f"{args.workers} workers, FAISS mmap of flat indexes "
+              f"{'supported' if hasattr(faiss, 'IO_FLAG_MMAP_IFC') else 'not supported (vectors load to heap)'}\n")
+        run('pickle', path, args.dim, args.workers)
+        run('mmap', path, args.dim, args.workers)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
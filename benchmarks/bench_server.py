@@ -0,0 +1,94 @@
+"""Requests/sec of the web_app /ask endpoint with a stub LLM behind it.
+
+Compares the old single-threaded TCPServer with ThreadPoolHTTPServer at
+1, 8 and 64 concurrent clients. Every request asks a different question, so
+single-flight coalescing cannot fold concurrent requests into one call and the
+numbers reflect the server's own concurrency. Run from the repository root:
+
+    python -m benchmarks.bench_server --latency 0.05 --requests-per-client 4
+"""
+import argparse
+import json
+import socketserver
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import web_app
+from engine_registry import registry
+from http_serving import ThreadPoolHTTPServer
+from benchmarks.stubs import StubQASystem
+
+CONCURRENCY_LEVELS = [1, 8, 64]
+
+class QuietHandler(web_app.RequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def post_ask(port: int, query: str) -> int:
+    """Send one /ask request and return the HTTP status (0 on connection failure)"""
+    body = json.dumps({'query': query, 'search_type': 'semantic'}).encode()
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/ask", data=body,
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+def run_clients(port: int, clients: int, total: int):
+    """Fire `total` requests, each with a distinct question, from `clients` concurrent clients"""
+    queries = [f"What is this system? (question {i})" for i in range(total)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        statuses = list(pool.map(lambda query: post_ask(port, query), queries))
+    elapsed = time.perf_counter() - start
+    ok = statuses.count(200)
+    return {
+        'rps': ok / elapsed if elapsed else 0.0,
+        'ok': ok,
+        'rejected': statuses.count(503),
+        'failed': len(statuses) - ok - statuses.count(503),
+        'seconds': elapsed
+    }
+
+def benchmark(label: str, make_server, requests_per_client: int):
+    server = make_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_address[1]
+    try:
+        for clients in CONCURRENCY_LEVELS:
+            result = run_clients(port, clients, clients * requests_per_client)
+            print(f"{label:<16} clients={clients:<3} {result['rps']:8.1f} req/s  "
+                  f"ok={result['ok']} 503={result['rejected']} failed={result['failed']} "
+                  f"({result['seconds']:.2f}s)")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub LLM latency in seconds')
+    parser.add_argument('--requests-per-client', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--queue-limit', type=int, default=128)
+    args = parser.parse_args()
+
+    registry.register('qa_system', StubQASystem(latency=args.latency))
+
+    benchmark('single-threaded',
+              lambda: socketserver.TCPServer(("127.0.0.1", 0), QuietHandler),
+              args.requests_per_client)
+    benchmark('thread pool',
+              lambda: ThreadPoolHTTPServer(("127.0.0.1", 0), QuietHandler,
+                                           workers=args.workers, queue_limit=args.queue_limit),
+              args.requests_per_client)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import io
+import re
+import json
+import time
+import zlib
+import random
+import threading
+from typing import List
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+class StubQASystem:
+    """Stand-in for QASystem that answers after a fixed delay instead of calling Bedrock"""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+
+    def _answer(self, query: str) -> str:
+        time.sleep(self.latency)
+        return f"Stub answer for: {query}"
+
+    def answer_question(self, question: str, k: int = 2, search_params=None) -> str:
+        return self._answer(question)
+
+    def search_by_keywords(self, query: str, k: int = 2, search_params=None) -> str:
+        return self._answer(query)
+
+    def hybrid_search(self, query: str, k: int = 3, search_params=None) -> str:
+        return self._answer(query)
+
+    def stream_answer(self, query: str, search_type: str = 'hybrid', k: int = None, search_params=None):
+        for word in self._answer(query).split(' '):
+            yield word + ' '
+
+def hash_embedding(text: str, dim: int = 1536) -> List[float]:
+    """Deterministic unit-length bag-of-words vector; texts that share words land close together"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in re.findall(r'\w+', text.lower()):
+        # crc32 rather than hash(), which is salted per process
+        h = zlib.crc32(token.encode('utf-8'))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+class FakeBedrockClient:
+    """Local stand-in for the bedrock-runtime client.
+
+    Supports invoke_model and invoke_model_with_response_stream with the same
+    response shapes as Bedrock's Anthropic messages API, and invoke_model with
+    Titan embedding bodies ({"inputText": ...}), answered with hash_embedding.
+    A seeded fraction of Claude calls can be rejected with ThrottlingException.
+    """
+
+    def __init__(self, answer: str = "This is a canned answer from the fake model.",
+                 first_token_latency: float = 0.05, token_latency: float = 0.005,
+                 embedding_latency: float = 0.0, embedding_dim: int = 1536,
+                 throttle_rate: float = 0.0, seed: int = 0):
+        self.answer = answer
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.embedding_latency = embedding_latency
+        self.embedding_dim = embedding_dim
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self.throttled = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _admit(self, operation: str):
+        """Count the call and raise ThrottlingException for a seeded fraction of them"""
+        with self._lock:
+            self.calls += 1
+            throttled = self.throttle_rate > 0 and self._rng.random() < self.throttle_rate
+            if throttled:
+                self.throttled += 1
+        if throttled:
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, operation)
+
+    def _embed(self, request):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.embedding_latency)
+        text = request['inputText']
+        payload = {'embedding': hash_embedding(text, self.embedding_dim),
+                   'inputTextTokenCount': len(text.split())}
+        return {'body': io.BytesIO(json.dumps(payload).encode())}
+
+    def invoke_model(self, modelId, body, **kwargs):
+        request = json.loads(body)
+        if 'inputText' in request:
+            return self._embed(request)
+        self._admit('InvokeModel')
+        time.sleep(self.first_token_latency + self.token_latency * len(self.answer.split()))
+        payload = {
+            'content': [{'type': 'text', 'text': self.answer}],
+            'usage': {'input_tokens': len(request['messages'][0]['content']) // 4,
+                      'output_tokens': len(self.answer.split())}
+        }
+        return {'body': io.BytesIO(json.dumps(payload).encode())}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        self._admit('InvokeModelWithResponseStream')
+        return {'body': self._events(modelId, len(json.loads(body)['messages'][0]['content']) // 4)}
+
+    def _events(self, model_id: str, input_tokens: int):
+        time.sleep(self.first_token_latency)
+        words = self.answer.split(' ')
+        yield self._event({'type': 'message_start', 'message': {
+            'id': 'msg_fake', 'type': 'message', 'role': 'assistant', 'model': model_id, 'content': [],
+            'stop_reason': None, 'usage': {'input_tokens': input_tokens, 'output_tokens': 1}}})
+        yield self._event({'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.token_latency)
+            text = word if i == 0 else ' ' + word
+            yield self._event({'type': 'content_block_delta', 'index': 0,
+                               'delta': {'type': 'text_delta', 'text': text}})
+        yield self._event({'type': 'content_block_stop', 'index': 0})
+        yield self._event({'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                           'usage': {'output_tokens': len(words)}})
+        yield self._event({'type': 'message_stop', 'amazon-bedrock-invocationMetrics': {
+            'inputTokenCount': input_tokens, 'outputTokenCount': len(words)}})
+
+    @staticmethod
+    def _event(data):
+        return {'chunk': {'bytes': json.dumps(data).encode()}}
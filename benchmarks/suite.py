@@ -0,0 +1,284 @@
+"""Offline load test of the whole pipeline against a fake Bedrock.
+
+Builds a synthetic index with deterministic hash embeddings, points the shared
+Bedrock clients at benchmarks.stubs.FakeBedrockClient (configurable latency and
+throttle rate), then drives QASystem, AdvancedRAGSystem, QueryProcessor and both
+HTTP servers with concurrent clients. Reports throughput and p50/p95/p99 latency
+per scenario and writes them to a JSON file; pass a previous file as --baseline
+to flag regressions. Run from the repository root:
+
+    python -m benchmarks.suite --requests 200 --concurrency 8
+    python -m benchmarks.suite --baseline benchmarks/results/baseline.json
+
+Every scenario gets a freshly loaded QASystem, so caches do not carry over
+between scenarios and runs stay comparable.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+
+from langchain_community.vectorstores import FAISS
+
+import metrics
+import web_app
+import advanced_web_app
+import bedrock_client
+from bedrock_client import BedrockClient, TokenBucket
+from qa_system import QASystem, create_embeddings
+from chunk_store import save_index
+from query_processor import QueryProcessor
+from advanced_rag import AdvancedRAGSystem
+from engine_registry import registry
+from http_serving import ThreadPoolHTTPServer
+from benchmarks.stubs import FakeBedrockClient
+from benchmarks.bench_intent import TOPICS, make_queries
+
+SCENARIOS = ['query_processor', 'qa_semantic', 'qa_keyword', 'qa_hybrid', 'advanced',
+             'http_web_app', 'http_advanced']
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'latest.json')
+
+FILLER = ("model training data evaluation latency retrieval index vector query answer document "
+          "context layer token embedding benchmark dataset score accuracy memory").split()
+
+def make_corpus(chunks: int, seed: int = 0) -> List[str]:
+    """Synthetic chunks, each about one topic, so questions have real nearest neighbours"""
+    rng = random.Random(seed)
+    return [f"{rng.choice(TOPICS)} {' '.join(rng.choices(FILLER, k=40))}. Chunk {i}." for i in range(chunks)]
+
+def build_index(path: str, chunks: int, dim: int):
+    """Embed the synthetic corpus with a zero-latency fake and save it the way QASystem expects"""
+    fake = FakeBedrockClient(embedding_dim=dim)
+    db = FAISS.from_texts(make_corpus(chunks), create_embeddings(fake))
+    save_index(db, path)
+
+def install_fake(args) -> FakeBedrockClient:
+    """Route every Bedrock call in this process to one fake client"""
+    fake = FakeBedrockClient(first_token_latency=args.llm_latency, token_latency=args.token_latency,
+                             embedding_latency=args.embedding_latency, embedding_dim=args.dim,
+                             throttle_rate=args.throttle_rate, seed=args.seed)
+    bedrock_client._runtime_clients['llm'] = fake
+    bedrock_client._runtime_clients['embeddings'] = fake
+    bedrock_client._shared_client = BedrockClient(client=fake, rate_limiter=TokenBucket(args.rate, args.burst),
+                                                  base_delay=args.retry_delay)
+    return fake
+
+class QuietWebHandler(web_app.RequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+class QuietAdvancedHandler(advanced_web_app.RequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def check(answer: str) -> str:
+    """The engines report failures as an "Error: ..." answer; count those as failed requests"""
+    if answer.startswith("Error:"):
+        raise RuntimeError(answer)
+    return answer
+
+def post_ask(port: int, payload: Dict) -> str:
+    """POST to /ask and return the answer; non-200 responses raise HTTPError"""
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/ask", data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return check(json.loads(response.read())['answer'])
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def load(call: Callable[[str], object], queries: List[str], concurrency: int) -> Dict:
+    """Run every query through `call` from `concurrency` clients and summarize the latencies"""
+    def one(query):
+        start = time.perf_counter()
+        try:
+            call(query)
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    retries = metrics.REGISTRY.total('bedrock_retries_total')
+    throttles = metrics.REGISTRY.total('bedrock_throttles_total')
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, queries))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(seconds * 1000 for seconds, ok in results if ok)
+    return {
+        'requests': len(results),
+        'errors': len(results) - len(latencies),
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'retries': int(metrics.REGISTRY.total('bedrock_retries_total') - retries),
+        'throttles': int(metrics.REGISTRY.total('bedrock_throttles_total') - throttles),
+    }
+
+def serve(handler_class, args):
+    server = ThreadPoolHTTPServer(("127.0.0.1", 0), handler_class, workers=args.workers,
+                                  queue_limit=args.queue_limit)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_scenario(name: str, index_path: str, queries: List[str], warmup: List[str], args) -> Dict:
+    """Set up one scenario from scratch, warm it up and load it"""
+    if name == 'query_processor':
+        processor = QueryProcessor()
+        def call(query):
+            processor.generate_search_queries(processor.analyze_query(query))
+        server = None
+    else:
+        qa = QASystem(index_path=index_path)
+        server = None
+        if name == 'qa_semantic':
+            call = lambda query: check(qa.answer_question(query))
+        elif name == 'qa_keyword':
+            call = lambda query: check(qa.search_by_keywords(query))
+        elif name == 'qa_hybrid':
+            call = lambda query: check(qa.hybrid_search(query))
+        elif name == 'advanced':
+            advanced = AdvancedRAGSystem(qa)
+            call = lambda query: check(advanced.run(query).answer)
+        else:
+            registry.reload()
+            registry.register('qa_system', qa)
+            if name == 'http_web_app':
+                server = serve(QuietWebHandler, args)
+                payload = {'search_type': 'hybrid'}
+            else:
+                registry.register('advanced_rag', AdvancedRAGSystem(qa))
+                server = serve(QuietAdvancedHandler, args)
+                payload = {'search_type': 'advanced'}
+            port = server.server_address[1]
+            def call(query):
+                post_ask(port, dict(payload, query=query))
+
+    try:
+        for query in warmup:
+            call(query)
+        return load(call, queries, args.concurrency)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Scenarios whose throughput fell or whose p95 rose by more than `threshold`"""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        if previous['rps'] and current['rps'] < previous['rps'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {previous['rps']:.1f} -> {current['rps']:.1f} req/s")
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--chunks', type=int, default=2000, help='Synthetic index size')
+    parser.add_argument('--dim', type=int, default=1536, help='Embedding dimension')
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='Fake Claude latency before the first token')
+    parser.add_argument('--token-latency', type=float, default=0.002, help='Fake Claude latency per answer word')
+    parser.add_argument('--embedding-latency', type=float, default=0.01, help='Fake Titan latency per text')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of Claude calls throttled')
+    parser.add_argument('--rate', type=float, default=0, help='Client-side Bedrock requests/sec (0 = unlimited)')
+    parser.add_argument('--burst', type=int, default=10)
+    parser.add_argument('--retry-delay', type=float, default=0.05, help='Base backoff delay after a throttle')
+    parser.add_argument('--workers', type=int, default=16, help='HTTP worker threads')
+    parser.add_argument('--queue-limit', type=int, default=128)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', help='Results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed relative regression')
+    parser.add_argument('--verbose', action='store_true', help='Keep application logging')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    fake = install_fake(args)
+    index_path = tempfile.mkdtemp(prefix='bench_suite_')
+    registry.index_path = index_path
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'verbose')},
+        'scenarios': {},
+    }
+    try:
+        start = time.perf_counter()
+        build_index(index_path, args.chunks, args.dim)
+        print(f"Built {args.chunks}-chunk index in {time.perf_counter() - start:.1f}s\n")
+
+        warmup = make_queries(args.warmup, seed=args.seed + 1)
+        queries = make_queries(args.requests, seed=args.seed)
+        print(f"{'scenario':<16} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'throttles':>9}")
+        for name in args.scenarios:
+            result = run_scenario(name, index_path, queries, warmup, args)
+            results['scenarios'][name] = result
+            print(f"{name:<16} {result['rps']:8.1f} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} "
+                  f"{result['p99_ms']:9.2f} {result['errors']:7d} {result['throttles']:9d}")
+        print(f"\nFake Bedrock calls: {fake.calls} ({fake.throttled} throttled)")
+    finally:
+        shutil.rmtree(index_path, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions against {args.baseline} (threshold {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} (threshold {args.threshold:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""LangChain FAISS stores saved without pickle and loaded through memory maps.
+
+An index directory holds index.faiss plus a chunk table (see chunk_table.py)
+instead of LangChain's pickled index.pkl. Loading memory-maps both, as far as
+the installed FAISS allows, so N workers share one page-cache copy and start
+without deserializing the corpus. Chunk texts and metadata are decoded only
+for the chunks a query actually returns.
+
+    python chunk_store.py migrate temp_index
+"""
+import os
+import argparse
+import logging
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional
+
+import faiss
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from chunk_table import ChunkTable, has_chunk_table, write_chunk_table
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.faiss"
+LEGACY_PICKLE_FILE = "index.pkl"
+# Ids and metadata of the earlier memory-mapped layout (and the old Lambda text export)
+LEGACY_STORE_FILES = ["chunks.json"]
+
+MMAP_ENABLED = os.getenv('INDEX_MMAP', '1') != '0'
+
+class ChunkIdMap(MutableMapping):
+    """FAISS position -> chunk id, read from the chunk table on demand.
+
+    Stands in for LangChain's index_to_docstore_id dict; positions assigned
+    after loading are kept in memory until the index is saved again.
+    """
+
+    def __init__(self, table: ChunkTable):
+        self.table = table
+        self._added: Dict[int, str] = {}
+        self._added_positions: Dict[str, int] = {}
+
+    def position(self, chunk_id: str) -> Optional[int]:
+        """Position of a chunk id, or None if it is not in the index"""
+        row = self.table.row(chunk_id)
+        return row if row is not None else self._added_positions.get(chunk_id)
+
+    def __getitem__(self, position: int) -> str:
+        if position in self._added:
+            return self._added[position]
+        if 0 <= position < self.table.count:
+            return self.table.chunk_id(position)
+        raise KeyError(position)
+
+    def __setitem__(self, position: int, chunk_id: str):
+        self._added[position] = chunk_id
+        self._added_positions[chunk_id] = position
+
+    def __delitem__(self, position: int):
+        raise TypeError("Positions cannot be removed; FAISS.delete replaces the whole mapping")
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    def __len__(self) -> int:
+        return max(self.table.count, max(self._added, default=-1) + 1)
+
+class MappedDocstore(Docstore, AddableMixin):
+    """LangChain docstore backed by a chunk table.
+
+    Documents added or deleted after loading are kept in memory until the
+    index is saved again.
+    """
+
+    def __init__(self, table: ChunkTable):
+        self.table = table
+        self._added: Dict[str, Document] = {}
+        self._deleted = set()
+
+    def search(self, search: str):
+        if search in self._added:
+            return self._added[search]
+        row = self.table.row(search)
+        if row is None or search in self._deleted:
+            return f"ID {search} not found."
+        return Document(page_content=self.table.text(row), metadata=self.table.metadata(row))
+
+    def _exists(self, chunk_id: str) -> bool:
+        if chunk_id in self._added:
+            return True
+        return chunk_id not in self._deleted and self.table.row(chunk_id) is not None
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = [chunk_id for chunk_id in texts if self._exists(chunk_id)]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids: List) -> None:
+        missing = [chunk_id for chunk_id in ids if not self._exists(chunk_id)]
+        if missing:
+            raise ValueError(f"Tried to delete ids that does not exist: {missing}")
+        for chunk_id in ids:
+            if self._added.pop(chunk_id, None) is None:
+                self._deleted.add(chunk_id)
+
+    def __len__(self) -> int:
+        return self.table.count - len(self._deleted) + len(self._added)
+
+def read_mapped(index_file: str):
+    """Read a FAISS index with its vectors memory-mapped where the index type allows it.
+
+    IO_FLAG_MMAP_IFC (FAISS >= 1.9) maps flat and HNSW vectors but cannot be
+    combined with IO_FLAG_MMAP, which maps IVF inverted lists, for IVF files.
+    """
+    flags_ifc = getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)
+    if flags_ifc:
+        try:
+            return faiss.read_index(index_file, faiss.IO_FLAG_MMAP | flags_ifc)
+        except RuntimeError:
+            pass
+    return faiss.read_index(index_file, faiss.IO_FLAG_MMAP)
+
+def embedding_model_id(embeddings) -> Optional[str]:
+    return getattr(embeddings, 'model_id', None)
+
+def save_index(db, index_path: str):
+    """Save a LangChain FAISS store as index.faiss plus a chunk table recording its embedding model"""
+    os.makedirs(index_path, exist_ok=True)
+    index_file = os.path.join(index_path, INDEX_FILE)
+    # Mapped IVF lists are written as a stub pointing back at the file being replaced
+    ensure_writable(db)
+    faiss.write_index(db.index, index_file + ".tmp")
+
+    def records():
+        for position in range(len(db.index_to_docstore_id)):
+            chunk_id = db.index_to_docstore_id[position]
+            document = db.docstore.search(chunk_id)
+            yield chunk_id, document.page_content, document.metadata
+
+    write_chunk_table(index_path, records(), embedding_model_id(db.embeddings))
+    os.replace(index_file + ".tmp", index_file)
+
+def migrate(index_path: str, embeddings=None):
+    """Convert an index saved with FAISS.save_local (pickled docstore) to a chunk table.
+
+    This is the only place a pickle is still read, so only migrate indexes you built.
+    """
+    logger.warning(f"Migrating pickled docstore in {index_path} to a chunk table")
+    db = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    save_index(db, index_path)
+    for name in [LEGACY_PICKLE_FILE] + LEGACY_STORE_FILES:
+        path = os.path.join(index_path, name)
+        if os.path.exists(path):
+            os.remove(path)
+    logger.info(f"✓ Migrated {db.index.ntotal} chunks")
+
+def require_chunk_table(index_path: str):
+    """Raise ValueError unless `index_path` has a chunk table, pointing pickled indexes at `migrate`"""
+    if has_chunk_table(index_path):
+        return
+    if os.path.exists(os.path.join(index_path, LEGACY_PICKLE_FILE)):
+        raise ValueError(f"Index at {index_path} still has a pickled docstore ({LEGACY_PICKLE_FILE}), which is "
+                         f"not loaded automatically; convert it once with `python chunk_store.py migrate {index_path}`")
+    raise ValueError(f"Index at {index_path} has no chunk table")
+
+def load_index(index_path: str, embeddings, mmap: bool = MMAP_ENABLED) -> FAISS:
+    """Load a FAISS store from `index_path`, memory-mapping vectors and the chunk table.
+
+    An index that only has a pickled docstore is refused until it is migrated.
+    """
+    require_chunk_table(index_path)
+
+    index_file = os.path.join(index_path, INDEX_FILE)
+    index = read_mapped(index_file) if mmap else faiss.read_index(index_file)
+    table = ChunkTable(index_path)
+    if index.ntotal != table.count:
+        raise ValueError(f"Index at {index_path} has {index.ntotal} vectors but {table.count} chunks; "
+                         f"was it loaded mid-save?")
+    # Vectors from another model would load fine and silently return unrelated chunks
+    model_id = embedding_model_id(embeddings)
+    if table.embedding_model and model_id and table.embedding_model != model_id:
+        raise ValueError(f"Index at {index_path} was embedded with {table.embedding_model} but {model_id} "
+                         f"is configured; re-ingest, or configure the model the index was built with")
+    db = FAISS(embeddings, index, MappedDocstore(table), ChunkIdMap(table))
+    # Remembered so writers can swap in a heap copy before modifying the index
+    db.index_path = index_path
+    db.mapped = mmap
+    logger.info(f"Loaded {index.ntotal} chunks{' (memory-mapped)' if mmap else ''}")
+    return db
+
+def ensure_writable(db):
+    """Swap a memory-mapped FAISS index for a heap copy read from disk so it can be modified"""
+    # Adding to a mapped flat index trips an assertion inside FAISS that aborts the process
+    if getattr(db, 'mapped', False):
+        db.index = faiss.read_index(os.path.join(db.index_path, INDEX_FILE))
+        db.mapped = False
+
+def main():
+    from qa_system import INDEX_PATH
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help='Convert a pickled docstore to a chunk table')
+    migrate_parser.add_argument('index_path', nargs='?', default=INDEX_PATH)
+    args = parser.parse_args()
+    migrate(args.index_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Columnar on-disk table of chunk ids, texts and metadata, read lazily through mmap.
+
+Rows are in FAISS position order. Every column is a flat file that is
+memory-mapped on open, so looking up one chunk touches a few pages and
+nothing is materialized for the rest of the corpus:
+
+    chunks.bin          texts as length-prefixed UTF-8 records
+    chunks.offsets      int64 byte offset of each record
+    chunks.ids          chunk ids, fixed-width bytes
+    chunks.idsort       the same ids sorted, with
+    chunks.idrows       their rows, for binary-search lookup by id
+    chunks.meta         int32 [rows x columns] codes into the header's value lists
+    chunks.header.json  row count, id width, embedding model and the distinct values of each metadata key
+
+Only needs numpy, so the Lambda can read it too.
+"""
+import os
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+HEADER_FILE = "chunks.header.json"
+BLOB_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.offsets"
+IDS_FILE = "chunks.ids"
+IDSORT_FILE = "chunks.idsort"
+IDROWS_FILE = "chunks.idrows"
+META_FILE = "chunks.meta"
+TABLE_FILES = [BLOB_FILE, OFFSETS_FILE, IDS_FILE, IDSORT_FILE, IDROWS_FILE, META_FILE, HEADER_FILE]
+
+# Each text record is a little-endian uint32 byte length followed by the UTF-8 bytes
+LENGTH_PREFIX = np.dtype('<u4')
+MISSING = -1
+
+def has_chunk_table(path: str) -> bool:
+    header_path = os.path.join(path, HEADER_FILE)
+    if not all(os.path.exists(os.path.join(path, name)) for name in TABLE_FILES):
+        return False
+    with open(header_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('version') == FORMAT_VERSION
+
+def map_array(path: str, dtype, shape=None) -> np.ndarray:
+    # np.memmap cannot map an empty file
+    if not os.path.getsize(path):
+        return np.zeros(shape or 0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+def write_array(path: str, array: np.ndarray):
+    with open(path + ".tmp", 'wb') as f:
+        np.ascontiguousarray(array).tofile(f)
+
+def write_chunk_table(path: str, records: Iterable[Tuple[str, str, Dict[str, Any]]],
+                      embedding_model: Optional[str] = None) -> int:
+    """Write (chunk id, text, metadata) records in FAISS position order; returns the row count.
+
+    Every file goes to a .tmp name first and the header is renamed into place
+    last, so readers that still map the previous table are never affected.
+    """
+    os.makedirs(path, exist_ok=True)
+    ids: List[bytes] = []
+    offsets: List[int] = []
+    # metadata key -> {JSON-encoded value: code}, and per-row {key: code}
+    columns: Dict[str, Dict[str, int]] = {}
+    rows: List[Dict[str, int]] = []
+    position = 0
+    with open(os.path.join(path, BLOB_FILE) + ".tmp", 'wb') as f:
+        for chunk_id, text, metadata in records:
+            data = text.encode('utf-8')
+            offsets.append(position)
+            f.write(np.array([len(data)], dtype=LENGTH_PREFIX).tobytes())
+            f.write(data)
+            position += LENGTH_PREFIX.itemsize + len(data)
+            ids.append(chunk_id.encode('utf-8'))
+            codes = {}
+            for key, value in (metadata or {}).items():
+                values = columns.setdefault(key, {})
+                codes[key] = values.setdefault(json.dumps(value, sort_keys=True), len(values))
+            rows.append(codes)
+
+    count = len(ids)
+    id_width = max((len(chunk_id) for chunk_id in ids), default=1)
+    id_array = np.array(ids, dtype=f'S{id_width}') if ids else np.zeros(0, dtype=f'S{id_width}')
+    order = np.argsort(id_array, kind='stable')
+    names = sorted(columns)
+    meta = np.full((count, len(names)), MISSING, dtype='<i4')
+    for row, codes in enumerate(rows):
+        for column, name in enumerate(names):
+            meta[row, column] = codes.get(name, MISSING)
+
+    write_array(os.path.join(path, OFFSETS_FILE), np.array(offsets, dtype='<i8'))
+    write_array(os.path.join(path, IDS_FILE), id_array)
+    write_array(os.path.join(path, IDSORT_FILE), id_array[order])
+    write_array(os.path.join(path, IDROWS_FILE), order.astype('<i8'))
+    write_array(os.path.join(path, META_FILE), meta)
+    header = {
+        'version': FORMAT_VERSION,
+        'count': count,
+        'id_width': id_width,
+        'embedding_model': embedding_model,
+        'columns': [{'name': name, 'values': [json.loads(value) for value in columns[name]]} for name in names]
+    }
+    with open(os.path.join(path, HEADER_FILE) + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(header, f)
+
+    for name in TABLE_FILES:
+        os.replace(os.path.join(path, name) + ".tmp", os.path.join(path, name))
+    return count
+
+class ChunkTable:
+    """Read-only, memory-mapped view of a chunk table"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, HEADER_FILE), 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk table version {header.get('version')} in {path}")
+        self.count: int = header['count']
+        # Model the vectors were embedded with; None for tables written before it was recorded
+        self.embedding_model: Optional[str] = header.get('embedding_model')
+        id_dtype = np.dtype(f"S{header['id_width']}")
+        self._columns = [column['name'] for column in header['columns']]
+        self._values = [column['values'] for column in header['columns']]
+
+        self._blob = map_array(os.path.join(path, BLOB_FILE), np.uint8)
+        self._offsets = map_array(os.path.join(path, OFFSETS_FILE), '<i8')
+        self._ids = map_array(os.path.join(path, IDS_FILE), id_dtype)
+        self._idsort = map_array(os.path.join(path, IDSORT_FILE), id_dtype)
+        self._idrows = map_array(os.path.join(path, IDROWS_FILE), '<i8')
+        self._meta = map_array(os.path.join(path, META_FILE), '<i4', shape=(self.count, len(self._columns)))
+
+    def text(self, row: int) -> str:
+        start = int(self._offsets[row])
+        length = int(self._blob[start:start + LENGTH_PREFIX.itemsize].view(LENGTH_PREFIX)[0])
+        start += LENGTH_PREFIX.itemsize
+        return self._blob[start:start + length].tobytes().decode('utf-8')
+
+    def chunk_id(self, row: int) -> str:
+        return self._ids[row].decode('utf-8')
+
+    def id_column(self) -> np.ndarray:
+        """Chunk ids of every row as memory-mapped fixed-width bytes"""
+        return self._ids
+
+    def row(self, chunk_id: str) -> Optional[int]:
+        """Row of a chunk id by binary search over the sorted id column, or None"""
+        key = chunk_id.encode('utf-8')
+        i = int(np.searchsorted(self._idsort, key))
+        if i < self.count and self._idsort[i] == key:
+            return int(self._idrows[i])
+        return None
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        codes = self._meta[row]
+        return {
+            name: values[code]
+            for name, values, code in zip(self._columns, self._values, codes.tolist())
+            if code != MISSING
+        }
+
+    def __len__(self) -> int:
+        return self.count
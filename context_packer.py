@@ -0,0 +1,91 @@
+import os
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))
+# Rough English average for Claude's tokenizer; good enough for budgeting
+CHARS_PER_TOKEN = 4
+# Trimming a chunk below this many tokens leaves too little to be useful
+MIN_CHUNK_TOKENS = 50
+
+@dataclass
+class PackedContext:
+    """Context text that fits the token budget, plus what it took to get there"""
+    text: str
+    tokens: int
+    chunks_used: int
+    chunks_trimmed: int
+    chunks_dropped: int
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate from character count"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _trim(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, preferring to end on a sentence or word boundary"""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    sentence_end = max(cut.rfind('. '), cut.rfind('.\n'), cut.rfind('? '), cut.rfind('! '))
+    if sentence_end > limit // 2:
+        return cut[:sentence_end + 1]
+    word_end = cut.rfind(' ')
+    return cut[:word_end] if word_end > 0 else cut
+
+@metrics.timed('rag_stage_seconds', stage='prompt')
+def pack_context(chunks: Sequence[str], budget: int = DEFAULT_TOKEN_BUDGET,
+                 scores: Optional[Sequence[float]] = None, separator: str = "\n\n") -> PackedContext:
+    """Greedily fill the token budget with the most relevant chunks.
+
+    Chunks are taken in relevance order (by `scores` if given, otherwise in the
+    order supplied). A chunk that does not fit is trimmed to the remaining
+    budget when enough room is left, and dropped otherwise. Empty and
+    duplicate chunks are dropped.
+    """
+    order = range(len(chunks))
+    if scores is not None:
+        order = sorted(order, key=lambda i: scores[i], reverse=True)
+
+    separator_tokens = estimate_tokens(separator)
+    selected: List[str] = []
+    seen = set()
+    used = trimmed = dropped = 0
+
+    for i in order:
+        chunk = chunks[i].strip()
+        if not chunk or chunk in seen:
+            dropped += 1
+            continue
+        seen.add(chunk)
+
+        cost = estimate_tokens(chunk) + (separator_tokens if selected else 0)
+        remaining = budget - used
+        if cost <= remaining:
+            selected.append(chunk)
+            used += cost
+        elif remaining - separator_tokens >= MIN_CHUNK_TOKENS:
+            chunk = _trim(chunk, remaining - separator_tokens)
+            selected.append(chunk)
+            used += estimate_tokens(chunk) + (separator_tokens if len(selected) > 1 else 0)
+            trimmed += 1
+        else:
+            dropped += 1
+
+    packed = PackedContext(
+        text=separator.join(selected),
+        tokens=used,
+        chunks_used=len(selected),
+        chunks_trimmed=trimmed,
+        chunks_dropped=dropped
+    )
+    logger.info(f"Packed context: {packed.chunks_used}/{len(chunks)} chunks, ~{packed.tokens}/{budget} tokens "
+                f"({packed.chunks_trimmed} trimmed, {packed.chunks_dropped} dropped)")
+    return packed
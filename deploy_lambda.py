@@ -2,9 +2,28 @@ import boto3
 import json
 import zipfile
 import os
+import sys
 import shutil
+import subprocess
 from botocore.exceptions import ClientError
 
+# Modules shared between the web apps and the Lambda handler
+LAMBDA_SHARED_MODULES = ["bedrock_client.py", "context_packer.py", "chunk_table.py", "metrics.py"]
+# Pinned dependencies vendored into the package; the Lambda runtime ships only boto3
+LAMBDA_REQUIREMENTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "requirements.txt")
+# Must match Runtime in src/template.yaml
+LAMBDA_PYTHON_VERSION = "3.12"
+LAMBDA_PLATFORMS = ["manylinux2014_x86_64", "manylinux_2_28_x86_64"]
+
+def install_dependencies(package_dir: str):
+    """Install Linux wheels of the Lambda's dependencies into the package, whatever the build machine"""
+    command = [sys.executable, "-m", "pip", "install", "--target", package_dir,
+               "--requirement", LAMBDA_REQUIREMENTS, "--implementation", "cp",
+               "--python-version", LAMBDA_PYTHON_VERSION, "--only-binary=:all:", "--upgrade", "--quiet"]
+    for platform in LAMBDA_PLATFORMS:
+        command += ["--platform", platform]
+    subprocess.run(command, check=True)
+
 def create_deployment_package():
     """Create a deployment package for the Lambda function"""
     print("Creating deployment package...")
@@ -18,14 +37,14 @@ def create_deployment_package():
     # Copy lambda function
     shutil.copy("lambda_function.py", package_dir)
     
-    # Create requirements.txt for Lambda
-    requirements = [
-        "boto3",
-        "botocore"
-    ]
+    # Copy shared modules the handler imports from the repository root
+    repo_root = os.path.dirname(os.path.abspath(__file__))
+    for module in LAMBDA_SHARED_MODULES:
+        shutil.copy(os.path.join(repo_root, module), package_dir)
     
-    with open(os.path.join(package_dir, "requirements.txt"), "w") as f:
-        f.write("\n".join(requirements))
+    # Lambda does not install requirements.txt itself, so vendor the wheels into the zip
+    install_dependencies(package_dir)
+    print("✓ Installed dependencies into the package")
     
     # Create zip file
     zip_path = "lambda-deployment.zip"
@@ -42,6 +61,31 @@ def create_deployment_package():
     print(f"✓ Created deployment package: {zip_path}")
     return zip_path
 
+def upload_index(s3_client, bucket_name, index_path="temp_index", prefix="index/"):
+    """Publish the local FAISS index and its chunk table for server-side retrieval in the Lambda"""
+    from chunk_table import TABLE_FILES, ChunkTable
+    from chunk_store import require_chunk_table
+    
+    if not os.path.exists(index_path):
+        print(f"No local index at {index_path}, skipping index upload")
+        return None
+    
+    # The Lambda reads chunk texts straight from the chunk table
+    require_chunk_table(index_path)
+    
+    # The Lambda never sees the manifest, so deleted and replaced chunks must be gone from what it gets
+    from index_manager import IndexManager, read_manifest
+    manifest = read_manifest(index_path)
+    if manifest is not None and manifest[1]:
+        print(f"Compacting {len(manifest[1])} tombstoned chunks before upload...")
+        IndexManager.open(index_path).compact()
+    
+    # TABLE_FILES ends with the header, so a complete table is in place before it changes
+    for name in ["index.faiss"] + TABLE_FILES:
+        s3_client.upload_file(os.path.join(index_path, name), bucket_name, f"{prefix}{name}")
+    print(f"✓ Uploaded index ({len(ChunkTable(index_path))} chunks) to s3://{bucket_name}/{prefix}")
+    return prefix
+
 def deploy_lambda():
     """Deploy the Lambda function using CloudFormation"""
     try:
@@ -65,6 +109,9 @@ def deploy_lambda():
         s3_client.upload_file(zip_path, bucket_name, s3_key)
         print(f"✓ Uploaded to S3: s3://{bucket_name}/{s3_key}")
         
+        # Publish the index the Lambda retrieves from
+        upload_index(s3_client, bucket_name)
+        
         # Deploy with CloudFormation
         cf_client = boto3.client('cloudformation')
         stack_name = 'rag-qa-stack'
@@ -117,7 +164,7 @@ def deploy_lambda():
                 api_endpoint = output['OutputValue']
                 print(f"\n✅ Deployment successful!")
                 print(f"API Endpoint: {api_endpoint}")
-                print(f"Test with: curl -X POST {api_endpoint} -H 'Content-Type: application/json' -d '{{\"context\":\"test context\",\"query\":\"test question\"}}'")
+                print(f"Test with: curl -X POST {api_endpoint} -H 'Content-Type: application/json' -d '{{\"query\":\"test question\"}}'")
                 return api_endpoint
         
         print("❌ Deployment completed but no API endpoint found")
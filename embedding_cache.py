@@ -0,0 +1,156 @@
+import os
+import re
+import array
+import sqlite3
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+import metrics
+from cache_utils import LRUCache
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '10000'))
+DEFAULT_CACHE_TTL = float(os.getenv('EMBEDDING_CACHE_TTL', '86400'))
+DEFAULT_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR')
+# Parallel upstream calls when embedding several queries at once
+DEFAULT_CONCURRENCY = int(os.getenv('EMBEDDING_CONCURRENCY', '8'))
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different inputs share a cache entry"""
+    return re.sub(r'\s+', ' ', text.strip()).lower()
+
+class DiskEmbeddingStore:
+    """SQLite-backed persistent tier for cached embeddings"""
+
+    def __init__(self, cache_dir: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "embeddings.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        vector = array.array('f')
+        vector.frombytes(row[0])
+        return vector.tolist()
+
+    def set_many(self, items):
+        rows = [(key, array.array('f', vector).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed cache in front of another embeddings model.
+
+    Vectors are keyed by model id + normalized text, kept in an in-memory LRU
+    and, when `cache_dir` is set, persisted to disk so they survive restarts.
+    """
+
+    def __init__(self, embeddings: Embeddings, maxsize: int = DEFAULT_CACHE_SIZE,
+                 ttl: Optional[float] = DEFAULT_CACHE_TTL, cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 concurrency: int = DEFAULT_CONCURRENCY):
+        self.embeddings = embeddings
+        self.model_id = getattr(embeddings, 'model_id', None) or type(embeddings).__name__
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.disk = DiskEmbeddingStore(cache_dir) if cache_dir else None
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed")
+
+    def _key(self, text: str, kind: str) -> str:
+        # Queries and documents may be embedded differently, so keep them apart
+        raw = f"{self.model_id}\0{kind}\0{normalize_text(text)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        vector = self.memory.get(key)
+        if vector is None and self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                self.memory.set(key, vector)
+        return vector
+
+    def _count(self, kind: str, results: List[Optional[List[float]]]):
+        misses = sum(1 for vector in results if vector is None)
+        if misses:
+            metrics.inc('embedding_cache_requests_total', misses, kind=kind, result='miss')
+        if len(results) > misses:
+            metrics.inc('embedding_cache_requests_total', len(results) - misses, kind=kind, result='hit')
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text, 'document') for text in texts]
+        results = [self._lookup(key) for key in keys]
+        self._count('document', results)
+
+        # Embed each distinct missing text once, in a single batch
+        missing = {}
+        for key, text, vector in zip(keys, texts, results):
+            if vector is None and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            for key, vector in fresh.items():
+                self.memory.set(key, vector)
+            if self.disk is not None:
+                self.disk.set_many(fresh.items())
+            results = [fresh[key] if vector is None else vector for key, vector in zip(keys, results)]
+
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text, 'query')
+        vector = self._lookup(key)
+        self._count('query', [vector])
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.memory.set(key, vector)
+            if self.disk is not None:
+                self.disk.set_many([(key, vector)])
+        else:
+            logger.debug("Embedding cache hit")
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries in one call.
+
+        Cached vectors are returned directly and each distinct miss is embedded
+        once. Models that can batch (see local_embeddings.py) get all misses in
+        one call; Titan has no batch endpoint, so for it misses go out
+        concurrently over the pooled client instead of one after another.
+        """
+        keys = [self._key(text, 'query') for text in texts]
+        results = [self._lookup(key) for key in keys]
+        self._count('query', results)
+
+        missing = {}
+        for key, text, vector in zip(keys, texts, results):
+            if vector is None and key not in missing:
+                missing[key] = text
+        if missing:
+            if len(missing) == 1:
+                vectors = [self.embeddings.embed_query(text) for text in missing.values()]
+            elif hasattr(self.embeddings, 'embed_queries'):
+                vectors = self.embeddings.embed_queries(list(missing.values()))
+            else:
+                vectors = list(self._pool.map(self.embeddings.embed_query, missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            for key, vector in fresh.items():
+                self.memory.set(key, vector)
+            if self.disk is not None:
+                self.disk.set_many(fresh.items())
+            results = [fresh[key] if vector is None else vector for key, vector in zip(keys, results)]
+
+        return results
@@ -0,0 +1,98 @@
+import os
+import threading
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from qa_system import INDEX_PATH, get_index_version
+from embedding_cache import normalize_text
+from singleflight import SingleFlight
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    """A loaded engine together with the index version it was built from"""
+    def __init__(self, engine: Any, version: Any):
+        self.engine = engine
+        self.version = version
+        # Index version whose reload failed; not retried until the index changes again
+        self.failed_version = None
+
+    def serves(self, version: Any) -> bool:
+        return version == self.version or version == self.failed_version
+
+class EngineRegistry:
+    """Process-wide registry of QA engines that are loaded once and shared by all handlers"""
+
+    def __init__(self, index_path: str = INDEX_PATH):
+        self.index_path = index_path
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Return the shared engine for `name`, building or hot-reloading it as needed"""
+        version = get_index_version(self.index_path)
+        entry = self._entries.get(name)
+        if entry is not None and entry.serves(version):
+            return entry.engine
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(name, threading.Lock())
+
+        # Only one thread builds a given engine; the others wait and reuse it
+        with build_lock:
+            entry = self._entries.get(name)
+            version = get_index_version(self.index_path)
+            if entry is not None and entry.serves(version):
+                return entry.engine
+
+            if entry is None:
+                logger.info(f"Loading engine '{name}'...")
+                engine = factory()
+            else:
+                logger.info(f"Index changed on disk, reloading engine '{name}'...")
+                try:
+                    engine = factory()
+                except Exception as e:
+                    # e.g. the index was read mid-save; keep answering from the engine already loaded
+                    logger.error(f"Reloading engine '{name}' failed, keeping the current one: {str(e)}")
+                    entry.failed_version = version
+                    return entry.engine
+            # Building may have written the index, so read the version afterwards
+            self._entries[name] = _Entry(engine, get_index_version(self.index_path))
+            logger.info(f"✓ Engine '{name}' ready")
+            return engine
+
+    def reload(self, name: Optional[str] = None):
+        """Drop cached engines so the next request rebuilds them"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def register(self, name: str, engine: Any):
+        """Install a pre-built engine (useful for stubs and benchmarks)"""
+        with self._lock:
+            self._entries[name] = _Entry(engine, get_index_version(self.index_path))
+
+# Shared registry for the whole process
+registry = EngineRegistry()
+
+def get_qa_system():
+    """Return the process-wide QASystem, loading the index on first use"""
+    from qa_system import QASystem
+    os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+    return registry.get('qa_system', QASystem)
+
+# Identical questions that arrive together share one retrieval + generation
+inflight = SingleFlight()
+
+def coalesce_answer(query: str, search_type: str, compute: Callable[[], Any],
+                    options: Optional[Dict] = None) -> Any:
+    """Run `compute` once for all concurrent requests with the same question, search type, options and index"""
+    key = (normalize_text(query), search_type, tuple(sorted((options or {}).items())),
+           get_index_version(registry.index_path))
+    return inflight.do(key, compute)
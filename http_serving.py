@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import queue
+import socketserver
+import threading
+import logging
+from contextlib import contextmanager
+
+import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv('WEB_WORKERS', '8'))
+DEFAULT_QUEUE_LIMIT = int(os.getenv('WEB_QUEUE_LIMIT', '64'))
+
+BUSY_BODY = json.dumps({'error': 'Server is busy, please retry shortly'}).encode()
+BUSY_RESPONSE = (
+    b"HTTP/1.0 503 Service Unavailable\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n"
+    b"Content-Length: " + str(len(BUSY_BODY)).encode() + b"\r\n"
+    b"\r\n" + BUSY_BODY
+)
+
+class ThreadPoolHTTPServer(socketserver.TCPServer):
+    """TCP server that hands connections to a fixed pool of worker threads.
+
+    Accepted connections wait in a bounded queue; once it is full new
+    connections are answered with a 503 straight away instead of piling up.
+    """
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, workers: int = DEFAULT_WORKERS,
+                 queue_limit: int = DEFAULT_QUEUE_LIMIT, bind_and_activate: bool = True):
+        self.workers = max(1, workers)
+        self.queue_limit = max(1, queue_limit)
+        self._requests = queue.Queue(maxsize=self.queue_limit)
+        # Let the kernel backlog absorb bursts while workers drain the queue
+        self.request_queue_size = self.queue_limit
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"http-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def process_request(self, request, client_address):
+        try:
+            self._requests.put_nowait((request, client_address))
+        except queue.Full:
+            logger.warning(f"Request queue full ({self.queue_limit}), rejecting {client_address[0]}")
+            self._reject(request)
+
+    def _reject(self, request):
+        try:
+            request.sendall(BUSY_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _worker(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._threads:
+            self._requests.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+# ANN search settings a client may override per request
+SEARCH_PARAM_KEYS = ('nprobe', 'ef_search')
+# Search types recorded as metric labels; anything else is counted as 'other'
+SEARCH_TYPES = ('semantic', 'keyword', 'hybrid', 'advanced')
+
+def get_search_params(request_data: dict) -> dict:
+    """Pick the integer ANN search settings (nprobe, ef_search) out of a request body.
+
+    Raises ValueError for anything but a positive integer; handlers answer it with a 400.
+    """
+    params = {}
+    for key in SEARCH_PARAM_KEYS:
+        value = request_data.get(key)
+        if value is None or value == '':
+            continue
+        if isinstance(value, bool) or not str(value).strip().isdigit() or int(value) <= 0:
+            raise ValueError(f"{key} must be a positive integer, got {value!r}")
+        params[key] = int(value)
+    return params
+
+def send_json(handler, status: int, data: dict):
+    handler.send_response(status)
+    handler.send_header('Content-type', 'application/json')
+    handler.end_headers()
+    handler.wfile.write(json.dumps(data).encode())
+
+def is_error_answer(answer: str) -> bool:
+    """QASystem and AdvancedRAGSystem report a failure as an answer starting with 'Error: '"""
+    return answer.startswith("Error: ")
+
+def send_metrics(handler):
+    """Serve the process metrics in the Prometheus text format"""
+    body = metrics.render().encode()
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+@contextmanager
+def track_request(endpoint: str, search_type: str):
+    """Count and time one question.
+
+    A request that raises is counted with status 'error'. The body can report
+    another outcome by setting 'status' in the yielded dict, as streams do once
+    their headers are already sent and answers do when the engine caught the error.
+    """
+    start = time.perf_counter()
+    search_type = search_type if search_type in SEARCH_TYPES else 'other'
+    outcome = {}
+    status = 'error'
+    try:
+        yield outcome
+        status = outcome.get('status', 'ok')
+    finally:
+        metrics.inc('rag_requests_total', endpoint=endpoint, search_type=search_type, status=status)
+        metrics.observe('rag_request_seconds', time.perf_counter() - start, endpoint=endpoint, search_type=search_type)
+
+def send_event_stream(handler, tokens, done_data=None) -> str:
+    """Relay answer tokens to the client as Server-Sent Events.
+
+    Each token is sent as a `data:` event; the stream ends with a `done` event
+    (or an `error` event if generation fails after the headers went out).
+    Returns the outcome: 'ok', 'error' or 'disconnected'.
+    """
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'text/event-stream')
+    handler.send_header('Cache-Control', 'no-cache')
+    handler.send_header('Connection', 'close')
+    handler.end_headers()
+
+    def write_event(data, event=None):
+        message = f"event: {event}\n" if event else ""
+        message += f"data: {json.dumps(data)}\n\n"
+        handler.wfile.write(message.encode())
+        handler.wfile.flush()
+
+    try:
+        for token in tokens:
+            write_event({'token': token})
+        write_event(done_data or {}, event='done')
+        return 'ok'
+    except (BrokenPipeError, ConnectionResetError):
+        logger.info("Client disconnected during stream")
+        return 'disconnected'
+    except Exception as e:
+        logger.error(f"Error while streaming answer: {str(e)}")
+        try:
+            write_event({'error': f'Error processing question: {str(e)}'}, event='error')
+        except OSError:
+            pass
+        return 'error'
@@ -0,0 +1,288 @@
+"""Add, update and delete documents in the FAISS index without rebuilding it.
+
+Each document is tracked by id in a manifest with a hash of its content, so
+unchanged documents are skipped. Replaced or deleted chunks are tombstoned
+and filtered out of search until compaction removes them.
+
+    python index_manager.py sync ./documents --delete-missing
+    python index_manager.py delete reports/2023.pdf
+    python index_manager.py compact
+"""
+import os
+import json
+import uuid
+import hashlib
+import argparse
+import threading
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from keyword_index import BM25Index
+from ann_index import delete_chunks
+from chunk_store import ensure_writable, load_index, save_index
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+# Compact once tombstones make up this fraction of the index
+COMPACT_RATIO = float(os.getenv('INDEX_COMPACT_RATIO', '0.2'))
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def read_manifest(index_path: str) -> Optional[Tuple[Dict[str, Dict], Set[str]]]:
+    """Return (documents, tombstones) from the manifest next to an index, or None if there is none"""
+    path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data['documents'], set(data['tombstones'])
+
+def write_manifest(index_path: str, documents: Dict[str, Dict], tombstones: Set[str]):
+    path = os.path.join(index_path, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'documents': documents, 'tombstones': sorted(tombstones)}, f)
+    os.replace(tmp_path, path)
+
+class IndexManager:
+    """Document-level updates for a FAISS index and its BM25 keyword index"""
+
+    def __init__(self, db, index_path: str, keyword_index: Optional[BM25Index] = None, embeddings=None,
+                 splitter=None, compact_ratio: float = COMPACT_RATIO, on_change: Optional[Callable[[], None]] = None):
+        self.db = db
+        self.index_path = index_path
+        self.keyword_index = keyword_index
+        self.embeddings = embeddings or db.embeddings
+        self.splitter = splitter or RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        self.compact_ratio = compact_ratio
+        self.on_change = on_change
+        self._lock = threading.Lock()
+
+        # doc id -> {'hash': content hash, 'chunks': [chunk ids]}
+        self.documents: Dict[str, Dict] = {}
+        # Chunk ids still in the index but no longer live; retrievers hold this same set
+        self.tombstones: Set[str] = set()
+        self._load_manifest()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.index_path, MANIFEST_FILE)
+
+    def _load_manifest(self):
+        manifest = read_manifest(self.index_path)
+        if manifest is not None:
+            self.documents, tombstones = manifest
+            self.tombstones.update(tombstones)
+
+    def _save_manifest(self):
+        write_manifest(self.index_path, self.documents, self.tombstones)
+
+    @property
+    def has_manifest(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def adopt(self, sources=None) -> int:
+        """Track the chunks of an index saved without a manifest, grouped by source; returns documents found.
+
+        A document whose chunks match the current `sources` split page by page,
+        as older versions of ingest.py did, is recorded with its content hash
+        so sync leaves it alone. Any other document is re-embedded by the next sync.
+        """
+        with self._lock:
+            grouped: Dict[str, List[Tuple[int, str, str]]] = {}
+            for chunk_id in self.db.index_to_docstore_id.values():
+                doc = self.db.docstore.search(chunk_id)
+                source = doc.metadata.get('source')
+                if source is not None:
+                    grouped.setdefault(source, []).append((doc.metadata.get('chunk', 0), chunk_id, doc.page_content))
+
+            hashes = {}
+            for source in sources or []:
+                if source.key not in grouped:
+                    continue
+                pages = list(source.pages())
+                expected = [chunk for page in pages for chunk in self.splitter.split_text(page)]
+                if [text for _, _, text in sorted(grouped[source.key])] == expected:
+                    hashes[source.key] = content_hash("\n\n".join(pages))
+
+            for source, chunks in grouped.items():
+                self.documents[source] = {'hash': hashes.get(source),
+                                          'chunks': [chunk_id for _, chunk_id, _ in sorted(chunks)]}
+            self._save_manifest()
+            logger.info(f"✓ Adopted {len(grouped)} documents ({len(hashes)} unchanged since ingest)")
+            return len(grouped)
+
+    def upsert(self, doc_id: str, text: str, metadata: Optional[Dict] = None) -> bool:
+        """Add or replace one document; returns False if its content is unchanged"""
+        return self.upsert_many([(doc_id, text, metadata)]) == 1
+
+    def upsert_many(self, documents: Iterable[Tuple[str, str, Optional[Dict]]]) -> int:
+        """Add or replace documents, embedding all new chunks in one batch; returns how many changed"""
+        with self._lock:
+            texts: List[str] = []
+            metadatas: List[Dict] = []
+            changed = []
+            for doc_id, text, metadata in documents:
+                digest = content_hash(text)
+                entry = self.documents.get(doc_id)
+                if entry is not None and entry['hash'] == digest:
+                    continue
+                chunks = self.splitter.split_text(text)
+                changed.append((doc_id, digest, len(chunks)))
+                for n, chunk in enumerate(chunks, 1):
+                    texts.append(chunk)
+                    metadatas.append({**(metadata or {}), 'source': doc_id, 'chunk': n})
+
+            if not changed:
+                return 0
+
+            ids = [str(uuid.uuid4()) for _ in texts]
+            if texts:
+                self._add(texts, self.embeddings.embed_documents(texts), metadatas, ids)
+
+            position = 0
+            for doc_id, digest, count in changed:
+                old = self.documents.get(doc_id)
+                if old is not None:
+                    self.tombstones.update(old['chunks'])
+                self.documents[doc_id] = {'hash': digest, 'chunks': ids[position:position + count]}
+                position += count
+
+            logger.info(f"Upserted {len(changed)} documents ({len(texts)} chunks embedded)")
+            self._commit()
+            return len(changed)
+
+    def delete(self, doc_ids: Iterable[str]) -> int:
+        """Remove documents by id; returns how many were found"""
+        with self._lock:
+            deleted = 0
+            for doc_id in doc_ids:
+                entry = self.documents.pop(doc_id, None)
+                if entry is not None:
+                    self.tombstones.update(entry['chunks'])
+                    deleted += 1
+            if deleted:
+                logger.info(f"Deleted {deleted} documents")
+                self._commit()
+            return deleted
+
+    def _add(self, texts: List[str], vectors: List[List[float]], metadatas: List[Dict], ids: List[str]):
+        text_embeddings = list(zip(texts, vectors))
+        if self.db is None:
+            self.db = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas, ids=ids)
+            self.keyword_index = BM25Index.build(zip(ids, texts))
+        else:
+            ensure_writable(self.db)
+            self.db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            self.keyword_index.add(zip(ids, texts))
+
+    @property
+    def needs_compaction(self) -> bool:
+        total = self.db.index.ntotal if self.db is not None else 0
+        return bool(self.tombstones) and len(self.tombstones) >= self.compact_ratio * total
+
+    def compact(self):
+        """Physically remove tombstoned chunks from the vector index, the docstore and BM25"""
+        with self._lock:
+            self._compact()
+            self.save()
+
+    def _compact(self):
+        if self.db is None or not self.tombstones:
+            return
+        live = set(self.db.index_to_docstore_id.values())
+        ids = [chunk_id for chunk_id in self.tombstones if chunk_id in live]
+        if ids:
+            ensure_writable(self.db)
+            delete_chunks(self.db, ids)
+            self.keyword_index.remove(ids)
+        self.tombstones.clear()
+        logger.info(f"✓ Compacted index: removed {len(ids)} chunks, {self.db.index.ntotal} remain")
+
+    def _commit(self):
+        if self.needs_compaction:
+            self._compact()
+        self.save()
+        if self.on_change is not None:
+            self.on_change()
+
+    def save(self):
+        """Write the FAISS index, keyword index and manifest"""
+        if self.db is None:
+            return
+        os.makedirs(self.index_path, exist_ok=True)
+        save_index(self.db, self.index_path)
+        self.keyword_index.save(self.index_path)
+        self._save_manifest()
+
+    @classmethod
+    def open(cls, index_path: str, **kwargs) -> "IndexManager":
+        """Load the index at `index_path` (or start an empty one) for updates"""
+        import keyword_index
+        from qa_system import create_embeddings
+        embeddings = create_embeddings()
+        db = keyword_idx = None
+        if os.path.exists(os.path.join(index_path, "index.faiss")):
+            db = load_index(index_path, embeddings, mmap=False)
+            keyword_idx = keyword_index.load_or_build(db, index_path)
+        return cls(db, index_path, keyword_idx, embeddings=embeddings, **kwargs)
+
+def sync(manager: IndexManager, location: str, delete_missing: bool = False, batch_size: int = 32) -> int:
+    """Bring the index in line with the documents under a directory or s3:// prefix"""
+    from ingest import list_sources
+    sources = list_sources(location)
+    updated = deleted = 0
+    batch = []
+    for source in sources:
+        batch.append((source.key, "\n\n".join(source.pages()), None))
+        if len(batch) >= batch_size:
+            updated += manager.upsert_many(batch)
+            batch = []
+    if batch:
+        updated += manager.upsert_many(batch)
+
+    if delete_missing:
+        present = {source.key for source in sources}
+        deleted = manager.delete([doc_id for doc_id in list(manager.documents) if doc_id not in present])
+
+    logger.info(f"✓ Synced {location}: {updated} added or updated, {deleted} deleted, "
+                f"{len(sources) - updated} unchanged")
+    return updated + deleted
+
+def main():
+    from dotenv import load_dotenv
+    from qa_system import INDEX_PATH
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index-path', default=INDEX_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    sync_parser = commands.add_parser('sync', help='Add new and changed documents')
+    sync_parser.add_argument('source', help='Directory or s3://bucket/prefix')
+    sync_parser.add_argument('--delete-missing', action='store_true', help='Delete documents no longer in source')
+    delete_parser = commands.add_parser('delete', help='Delete documents by id')
+    delete_parser.add_argument('doc_ids', nargs='+')
+    commands.add_parser('compact', help='Remove tombstoned chunks now')
+    args = parser.parse_args()
+
+    manager = IndexManager.open(args.index_path)
+    if manager.db is not None and not manager.has_manifest:
+        # Index written before ingest.py kept a manifest
+        from ingest import list_sources
+        manager.adopt(list_sources(args.source) if args.command == 'sync' else None)
+    if args.command == 'sync':
+        sync(manager, args.source, args.delete_missing)
+    elif args.command == 'delete':
+        manager.delete(args.doc_ids)
+    else:
+        manager.compact()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Bulk-ingest PDFs and text files into the FAISS index.
+
+Sources are read file by file, split into chunks exactly as index_manager.py
+sync does, and embedded in batches on a bounded thread pool. Each file is
+recorded in the index manifest with its content hash, so unchanged files are
+skipped on the next run or sync and changed ones replace their old chunks.
+
+Every few batches a checkpoint appends the chunks added since the previous
+one as a small shard next to the index, so an interrupted run resumes where
+it left off. Checkpoints cost only the size of what they add; the index itself
+is rewritten once, when the shards are merged into it at the end of the run.
+Chunk ids are derived from the file, its content hash and the chunk number,
+and chunks already in the index or a shard are skipped, so a resume never
+adds duplicates, even after a crash during the final merge.
+
+    python ingest.py ./documents
+    python ingest.py s3://my-bucket/documents/ --workers 8 --batch-size 64
+"""
+import os
+import io
+import json
+import shutil
+import argparse
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import boto3
+from dotenv import load_dotenv
+from langchain_community.vectorstores import FAISS
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+import keyword_index
+from chunk_store import ensure_writable, load_index, save_index
+from chunk_table import ChunkTable
+from index_manager import content_hash, read_manifest, write_manifest
+from qa_system import INDEX_PATH, create_embeddings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt', '.md')
+SHARDS_DIR = "ingest_shards"
+SHARD_DOCUMENTS_FILE = "documents.json"
+
+class Source:
+    """A single document to ingest, read lazily one page (or file) at a time"""
+
+    def __init__(self, key: str, path: Optional[str] = None, bucket: Optional[str] = None, s3=None):
+        self.key = key
+        self.path = path
+        self.bucket = bucket
+        self.s3 = s3
+
+    def _open(self):
+        if self.path:
+            return open(self.path, 'rb')
+        body = self.s3.get_object(Bucket=self.bucket, Key=self.key)['Body']
+        # pypdf needs a seekable stream; text files are read straight from the body
+        return io.BytesIO(body.read()) if self.key.lower().endswith('.pdf') else body
+
+    def pages(self) -> Iterator[str]:
+        stream = self._open()
+        try:
+            if self.key.lower().endswith('.pdf'):
+                for page in PdfReader(stream).pages:
+                    yield page.extract_text() or ""
+            else:
+                yield stream.read().decode('utf-8', errors='replace')
+        finally:
+            stream.close()
+
+def list_sources(location: str) -> List[Source]:
+    """Return supported documents under a local directory or an s3://bucket/prefix"""
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        s3 = boto3.client('s3')
+        sources = []
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if obj['Key'].lower().endswith(SUPPORTED_EXTENSIONS):
+                    sources.append(Source(obj['Key'], bucket=bucket, s3=s3))
+        return sorted(sources, key=lambda source: source.key)
+
+    sources = []
+    for root, _, files in os.walk(location):
+        for name in files:
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                path = os.path.join(root, name)
+                sources.append(Source(os.path.relpath(path, location), path=path))
+    return sorted(sources, key=lambda source: source.key)
+
+def chunk_id(key: str, digest: str, n: int) -> str:
+    return f"{key}#{digest[:16]}#{n}"
+
+class ShardLog:
+    """Checkpoints of a run in progress: one shard directory per checkpoint.
+
+    A shard holds the chunks added since the previous checkpoint (a FAISS
+    index with its chunk table) and the manifest entries of the files it
+    finished. It is written under a temporary name and renamed into place, so
+    it is either complete or absent.
+    """
+
+    def __init__(self, index_path: str):
+        self.path = os.path.join(index_path, SHARDS_DIR)
+        self.shards: List[str] = []
+        if os.path.isdir(self.path):
+            for name in sorted(os.listdir(self.path)):
+                if name.endswith('.tmp'):
+                    # Interrupted while being written
+                    shutil.rmtree(os.path.join(self.path, name))
+                else:
+                    self.shards.append(os.path.join(self.path, name))
+        if self.shards:
+            logger.info(f"Resuming: {len(self.shards)} checkpoints from an interrupted run")
+
+    def write(self, db, entries: Dict[str, Dict]):
+        path = os.path.join(self.path, f"shard-{len(self.shards):06d}")
+        tmp_path = path + ".tmp"
+        os.makedirs(tmp_path)
+        if db is not None:
+            save_index(db, tmp_path)
+        with open(os.path.join(tmp_path, SHARD_DOCUMENTS_FILE), 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+        self.shards.append(path)
+
+    def entries(self) -> Iterator[Dict[str, Dict]]:
+        for shard in self.shards:
+            with open(os.path.join(shard, SHARD_DOCUMENTS_FILE), encoding='utf-8') as f:
+                yield json.load(f)
+
+    def chunk_ids(self) -> Iterator[str]:
+        for shard in self.shards:
+            if os.path.exists(os.path.join(shard, "index.faiss")):
+                table = ChunkTable(shard)
+                yield from (table.chunk_id(row) for row in range(table.count))
+
+    def merge_into(self, db, embeddings, skip: Set[str]):
+        """Add every shard's chunks not in `skip` to `db` (or a new store); returns the store and chunks added"""
+        merged = 0
+        for shard in self.shards:
+            if not os.path.exists(os.path.join(shard, "index.faiss")):
+                continue
+            part = load_index(shard, embeddings, mmap=False)
+            vectors = part.index.reconstruct_n(0, part.index.ntotal)
+            ids, text_embeddings, metadatas = [], [], []
+            for position, vector in enumerate(vectors.tolist()):
+                chunk_id = part.index_to_docstore_id[position]
+                if chunk_id in skip:
+                    continue
+                document = part.docstore.search(chunk_id)
+                ids.append(chunk_id)
+                text_embeddings.append((document.page_content, vector))
+                metadatas.append(document.metadata)
+            if not ids:
+                continue
+            if db is None:
+                db = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+            else:
+                ensure_writable(db)
+                db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            merged += len(ids)
+        return db, merged
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+def record(documents: Dict[str, Dict], tombstones: Set[str], key: str, entry: Dict):
+    """Point a file's manifest entry at its new chunks, tombstoning those of an older version"""
+    old = documents.get(key)
+    if old is not None and old['hash'] != entry['hash']:
+        tombstones.update(old['chunks'])
+    # A document deleted and ingested again revives its chunks if not yet compacted
+    tombstones.difference_update(entry['chunks'])
+    documents[key] = entry
+
+def iter_chunks(sources: List[Source], splitter, completed: Set[str], documents: Dict[str, Dict],
+                existing: Set[str]) -> Iterator[Tuple[str, Dict, Optional[str]]]:
+    """Yield (chunk id, metadata, text) for chunks not yet in the index.
+
+    A (source key, manifest entry, None) marker follows the chunks of each file.
+    """
+    for source in sources:
+        if source.key in completed:
+            continue
+        # Same text and splitter as IndexManager.upsert_many, so sync sees the same hash
+        text = "\n\n".join(source.pages())
+        digest = content_hash(text)
+        entry = documents.get(source.key)
+        if entry is None or entry['hash'] != digest:
+            ids = []
+            for n, chunk in enumerate(splitter.split_text(text), 1):
+                ids.append(chunk_id(source.key, digest, n))
+                if ids[-1] not in existing:
+                    yield ids[-1], {'source': source.key, 'chunk': n}, chunk
+            entry = {'hash': digest, 'chunks': ids}
+        yield source.key, entry, None
+
+def iter_batches(chunks: Iterator[Tuple[str, Dict, Optional[str]]], batch_size: int):
+    """Group chunks into batches of up to batch_size texts, keeping end-of-file markers in order"""
+    batch = []
+    texts = 0
+    for item in chunks:
+        batch.append(item)
+        if item[2] is not None:
+            texts += 1
+        if texts >= batch_size:
+            yield batch
+            batch, texts = [], 0
+    if batch:
+        yield batch
+
+def ingest(location: str, index_path: str = INDEX_PATH, chunk_size: int = 1000, chunk_overlap: int = 200,
+           batch_size: int = 32, workers: int = 4, checkpoint_every: int = 10) -> int:
+    """Ingest every document under `location` into the index at `index_path`; returns chunks added"""
+    load_dotenv()
+    embeddings = create_embeddings()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    db = None
+    if os.path.exists(os.path.join(index_path, "index.faiss")):
+        db = load_index(index_path, embeddings)
+    os.makedirs(index_path, exist_ok=True)
+    manifest = read_manifest(index_path)
+    if db is not None and manifest is None:
+        logger.warning(f"{index_path} has no manifest, so its documents will be added again; run "
+                       f"`python index_manager.py sync <documents>` once first to adopt them")
+    documents, tombstones = manifest or ({}, set())
+    indexed = set(db.index_to_docstore_id.values()) if db is not None else set()
+
+    # Files finished and chunks added by an interrupted run, possibly after its last checkpoint
+    shards = ShardLog(index_path)
+    completed = set()
+    for entries in shards.entries():
+        for key, entry in entries.items():
+            record(documents, tombstones, key, entry)
+            completed.add(key)
+    existing = indexed | set(shards.chunk_ids())
+
+    sources = list_sources(location)
+    logger.info(f"Found {len(sources)} documents in {location}")
+
+    def embed(batch):
+        texts = [text for _, _, text in batch if text is not None]
+        return batch, (embeddings.embed_documents(texts) if texts else [])
+
+    added = 0
+    batches_since_save = 0
+    # Chunks and finished files since the last checkpoint
+    shard_db = None
+    shard_entries: Dict[str, Dict] = {}
+    pending = deque()
+    batches = iter_batches(iter_chunks(sources, splitter, completed, documents, existing), batch_size)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # Keep a bounded number of embedding batches in flight
+            while len(pending) < workers * 2:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                pending.append(pool.submit(embed, batch))
+            if not pending:
+                break
+
+            # Add results in submission order so each shard holds the files it marks finished
+            batch, vectors = pending.popleft().result()
+            items = [item for item in batch if item[2] is not None]
+            if items:
+                text_embeddings = [(text, vector) for (_, _, text), vector in zip(items, vectors)]
+                metadatas = [metadata for _, metadata, _ in items]
+                ids = [item[0] for item in items]
+                if shard_db is None:
+                    shard_db = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+                else:
+                    shard_db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+                added += len(items)
+
+            for key, entry, text in batch:
+                if text is None:
+                    record(documents, tombstones, key, entry)
+                    shard_entries[key] = entry
+                    completed.add(key)
+
+            batches_since_save += 1
+            if batches_since_save >= checkpoint_every:
+                shards.write(shard_db, shard_entries)
+                shard_db, shard_entries = None, {}
+                batches_since_save = 0
+                logger.info(f"Checkpoint: {added} chunks added, {len(completed)} files done")
+
+    if shard_db is not None or shard_entries:
+        shards.write(shard_db, shard_entries)
+
+    # The only full rewrite of the index in the run
+    db, merged = shards.merge_into(db, embeddings, indexed)
+    if db is None:
+        logger.info("Nothing to ingest")
+        shards.remove()
+        return 0
+    if merged:
+        save_index(db, index_path)
+    write_manifest(index_path, documents, tombstones)
+    keyword_index.load_or_build(db, index_path)
+    shards.remove()
+    logger.info(f"✓ Ingested {added} chunks from {len(sources)} documents into {index_path}")
+    return added
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='Directory or s3://bucket/prefix to ingest')
+    parser.add_argument('--index-path', default=INDEX_PATH)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--chunk-overlap', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent embedding batches')
+    parser.add_argument('--checkpoint-every', type=int, default=10, help='Batches between checkpoints')
+    args = parser.parse_args()
+
+    ingest(args.source, args.index_path, args.chunk_size, args.chunk_overlap,
+           args.batch_size, args.workers, args.checkpoint_every)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 import os
-import time
 from advanced_rag import AdvancedRAGSystem
 
 def interactive_rag():
@@ -62,9 +61,6 @@ def interactive_rag():
             print(answer)
             print("\n" + "="*60 + "\n")
             
-            # Add delay to avoid rate limiting
-            time.sleep(2)
-            
         except KeyboardInterrupt:
             print("\nGoodbye!")
             break
@@ -0,0 +1,321 @@
+"""BM25 keyword index over the chunks in the FAISS docstore.
+
+Saved as flat columns beside the chunk table and memory-mapped on load, so
+worker processes share the postings through the page cache instead of each
+decoding them into its own heap:
+
+    bm25.terms          distinct terms, sorted, fixed-width UTF-8 bytes
+    bm25.offsets        int64 start of each term's postings, plus the end
+    bm25.positions      int32 document positions of every posting, grouped by term
+    bm25.tfs            int32 term frequency of each posting
+    bm25.lengths        int32 token count of each document
+    bm25.ids            chunk ids in FAISS position order, fixed-width bytes
+    bm25.header.json    format version, k1, b and the term and id widths
+
+A loaded index is read-only until it is modified; add and remove first copy
+it into the in-memory form used while building.
+"""
+import os
+import re
+import json
+import math
+import heapq
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+import metrics
+from chunk_table import map_array, write_array
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+STOP_WORDS = {
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'is', 'are', 'was', 'were', 'be', 'been', 'it', 'its', 'this', 'that', 'these', 'those'
+}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stop words removed"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+FORMAT_VERSION = 1
+HEADER_FILE = "bm25.header.json"
+TERMS_FILE = "bm25.terms"
+OFFSETS_FILE = "bm25.offsets"
+POSITIONS_FILE = "bm25.positions"
+TFS_FILE = "bm25.tfs"
+LENGTHS_FILE = "bm25.lengths"
+IDS_FILE = "bm25.ids"
+INDEX_FILES = [TERMS_FILE, OFFSETS_FILE, POSITIONS_FILE, TFS_FILE, LENGTHS_FILE, IDS_FILE, HEADER_FILE]
+# Written by earlier versions; replaced by the columns above on the next build
+LEGACY_FILE = "bm25.json"
+
+def has_keyword_index(path: str) -> bool:
+    if not all(os.path.exists(os.path.join(path, name)) for name in INDEX_FILES):
+        return False
+    with open(os.path.join(path, HEADER_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f).get('version') == FORMAT_VERSION
+
+def _fixed_width(values: List[bytes]) -> np.ndarray:
+    width = max((len(value) for value in values), default=1)
+    return np.array(values, dtype=f'S{width}') if values else np.zeros(0, dtype=f'S{width}')
+
+class MappedPostings:
+    """Read-only, memory-mapped columns of a saved BM25 index"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, HEADER_FILE), 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported keyword index version {header.get('version')} in {path}")
+        self.path = path
+        self.k1: float = header['k1']
+        self.b: float = header['b']
+        self.terms = map_array(os.path.join(path, TERMS_FILE), f"S{header['term_width']}")
+        self.offsets = map_array(os.path.join(path, OFFSETS_FILE), '<i8')
+        self.positions = map_array(os.path.join(path, POSITIONS_FILE), '<i4')
+        self.tfs = map_array(os.path.join(path, TFS_FILE), '<i4')
+        self.lengths = map_array(os.path.join(path, LENGTHS_FILE), '<i4')
+        self.ids = map_array(os.path.join(path, IDS_FILE), f"S{header['id_width']}")
+        self.count = len(self.lengths)
+        self.avgdl = float(self.lengths.sum()) / self.count if self.count else 0.0
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(positions, term frequencies) of a term by binary search over the sorted terms, or None"""
+        key = term.encode('utf-8')
+        # Longer keys would be truncated to the column width and could match a prefix
+        if len(key) > self.terms.dtype.itemsize:
+            return None
+        i = int(np.searchsorted(self.terms, key))
+        if i < len(self.terms) and self.terms[i] == key:
+            start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+            return self.positions[start:end], self.tfs[start:end]
+        return None
+
+    def doc_id(self, position: int) -> str:
+        return self.ids[position].decode('utf-8')
+
+class BM25Index:
+    """Inverted index over the chunks in the FAISS docstore, scored with Okapi BM25"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lengths: List[int] = []
+        # term -> {document position: term frequency}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self._idf: Dict[str, float] = {}
+        self._norms: List[float] = []
+        # Set while the index is still the read-only view it was loaded as
+        self._mapped: Optional[MappedPostings] = None
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]], **kwargs) -> "BM25Index":
+        """Build an index from (doc_id, text) pairs"""
+        index = cls(**kwargs)
+        for doc_id, text in documents:
+            index._add(doc_id, text)
+        index._finalize()
+        return index
+
+    def add(self, documents: Iterable[Tuple[str, str]]):
+        """Append (doc_id, text) pairs, in the same order they were added to FAISS"""
+        self._materialize()
+        for doc_id, text in documents:
+            self._add(doc_id, text)
+        self._finalize()
+
+    def remove(self, doc_ids: Iterable[str]):
+        """Drop documents and renumber the remaining ones, keeping their order"""
+        self._materialize()
+        removed = set(doc_ids)
+        keep = [position for position, doc_id in enumerate(self.doc_ids) if doc_id not in removed]
+        if len(keep) == len(self.doc_ids):
+            return
+        new_positions = {old: new for new, old in enumerate(keep)}
+        self.doc_ids = [self.doc_ids[position] for position in keep]
+        self.doc_lengths = [self.doc_lengths[position] for position in keep]
+        postings = {}
+        for term, docs in self.postings.items():
+            kept = {new_positions[position]: tf for position, tf in docs.items() if position in new_positions}
+            if kept:
+                postings[term] = kept
+        self.postings = postings
+        self._finalize()
+
+    def _add(self, doc_id: str, text: str):
+        position = len(self.doc_ids)
+        tokens = tokenize(text)
+        self.doc_ids.append(doc_id)
+        self.doc_lengths.append(len(tokens))
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            self.postings.setdefault(token, {})[position] = tf
+
+    def _materialize(self):
+        """Copy a loaded index into the in-memory dicts so it can be modified"""
+        mapped = self._mapped
+        if mapped is None:
+            return
+        self.doc_ids = [doc_id.decode('utf-8') for doc_id in mapped.ids.tolist()]
+        self.doc_lengths = mapped.lengths.tolist()
+        offsets = mapped.offsets.tolist()
+        positions = mapped.positions.tolist()
+        tfs = mapped.tfs.tolist()
+        self.postings = {
+            term.decode('utf-8'): dict(zip(positions[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]]))
+            for i, term in enumerate(mapped.terms.tolist())
+        }
+        self._mapped = None
+        self._finalize()
+
+    def _finalize(self):
+        """Precompute IDF and length norms so a query only touches its own postings"""
+        n = len(self.doc_ids)
+        avgdl = (sum(self.doc_lengths) / n) if n else 0.0
+        self._idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        self._norms = [
+            self.k1 * (1 - self.b + self.b * (length / avgdl if avgdl else 0.0))
+            for length in self.doc_lengths
+        ]
+
+    @metrics.timed('rag_stage_seconds', stage='keyword')
+    def search(self, query: str, k: int = 10, exclude: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """Return the top-k (doc_id, score) pairs for the query, skipping doc ids in `exclude`"""
+        if self._mapped is not None:
+            return self._search_mapped(query, k, exclude)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self._idf[term]
+            for position, tf in docs.items():
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / (tf + self._norms[position])
+        candidates = scores.items()
+        if exclude:
+            candidates = [(position, score) for position, score in candidates if self.doc_ids[position] not in exclude]
+        top = heapq.nlargest(k, candidates, key=lambda item: item[1])
+        return [(self.doc_ids[position], score) for position, score in top]
+
+    def _search_mapped(self, query: str, k: int, exclude: Optional[Set[str]]) -> List[Tuple[str, float]]:
+        """Search over the mapped columns: each query term reads only its own postings slice"""
+        mapped = self._mapped
+        hit_positions, hit_scores = [], []
+        for term in set(tokenize(query)):
+            postings = mapped.postings(term)
+            if postings is None:
+                continue
+            positions, tfs = postings
+            df = len(positions)
+            idf = math.log(1 + (mapped.count - df + 0.5) / (df + 0.5))
+            lengths = mapped.lengths[positions] / mapped.avgdl if mapped.avgdl else 0.0
+            norms = self.k1 * (1 - self.b + self.b * lengths)
+            tfs = tfs.astype(np.float64)
+            hit_positions.append(positions)
+            hit_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norms))
+        if not hit_positions:
+            return []
+        positions, inverse = np.unique(np.concatenate(hit_positions), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(hit_scores))
+        # Ids are only decoded for the candidates read in score order, until k are kept
+        results = []
+        for i in np.argsort(-scores, kind='stable').tolist():
+            doc_id = mapped.doc_id(int(positions[i]))
+            if exclude and doc_id in exclude:
+                continue
+            results.append((doc_id, float(scores[i])))
+            if len(results) == k:
+                break
+        return results
+
+    def matches(self, db) -> bool:
+        """Whether this index covers exactly the chunks of `db`, in FAISS position order"""
+        mapping = db.index_to_docstore_id
+        if len(mapping) != len(self):
+            return False
+        table = getattr(mapping, 'table', None)
+        if self._mapped is not None and table is not None and table.count == len(mapping):
+            # Both id columns are memory-mapped: compare the bytes without decoding any id
+            return bool(np.array_equal(self._mapped.ids, table.id_column()))
+        doc_ids = self.doc_ids if self._mapped is None else [self._mapped.doc_id(i) for i in range(len(self))]
+        return doc_ids == [mapping[i] for i in range(len(mapping))]
+
+    def save(self, index_path: str):
+        """Write the columns to .tmp names and rename them into place, header last"""
+        mapped = self._mapped
+        if mapped is not None:
+            if os.path.abspath(mapped.path) == os.path.abspath(index_path):
+                return  # Unchanged since it was loaded from here
+            self._materialize()
+        terms = sorted(self.postings)
+        offsets = [0]
+        positions: List[int] = []
+        tfs: List[int] = []
+        for term in terms:
+            docs = self.postings[term]
+            for position in sorted(docs):
+                positions.append(position)
+                tfs.append(docs[position])
+            offsets.append(len(positions))
+        term_array = _fixed_width([term.encode('utf-8') for term in terms])
+        id_array = _fixed_width([doc_id.encode('utf-8') for doc_id in self.doc_ids])
+
+        write_array(os.path.join(index_path, TERMS_FILE), term_array)
+        write_array(os.path.join(index_path, OFFSETS_FILE), np.array(offsets, dtype='<i8'))
+        write_array(os.path.join(index_path, POSITIONS_FILE), np.array(positions, dtype='<i4'))
+        write_array(os.path.join(index_path, TFS_FILE), np.array(tfs, dtype='<i4'))
+        write_array(os.path.join(index_path, LENGTHS_FILE), np.array(self.doc_lengths, dtype='<i4'))
+        write_array(os.path.join(index_path, IDS_FILE), id_array)
+        header = {
+            'version': FORMAT_VERSION,
+            'k1': self.k1,
+            'b': self.b,
+            'term_width': term_array.dtype.itemsize,
+            'id_width': id_array.dtype.itemsize
+        }
+        with open(os.path.join(index_path, HEADER_FILE) + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        for name in INDEX_FILES:
+            os.replace(os.path.join(index_path, name) + ".tmp", os.path.join(index_path, name))
+        legacy = os.path.join(index_path, LEGACY_FILE)
+        if os.path.exists(legacy):
+            os.remove(legacy)
+
+    @classmethod
+    def load(cls, index_path: str) -> "BM25Index":
+        """Map a saved index; nothing is decoded until it is searched or modified"""
+        mapped = MappedPostings(index_path)
+        index = cls(k1=mapped.k1, b=mapped.b)
+        index._mapped = mapped
+        return index
+
+    def __len__(self) -> int:
+        return self._mapped.count if self._mapped is not None else len(self.doc_ids)
+
+def load_or_build(db, index_path: str) -> BM25Index:
+    """Load the BM25 index saved next to a FAISS index, rebuilding it if it is missing or stale"""
+    try:
+        if has_keyword_index(index_path):
+            index = BM25Index.load(index_path)
+            if index.matches(db):
+                return index
+            logger.info("Keyword index is out of date with the docstore, rebuilding...")
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not load keyword index, rebuilding: {str(e)}")
+
+    doc_ids = [db.index_to_docstore_id[i] for i in range(len(db.index_to_docstore_id))]
+    index = BM25Index.build((doc_id, db.docstore.search(doc_id).page_content) for doc_id in doc_ids)
+    index.save(index_path)
+    logger.info(f"✓ Built keyword index over {len(index)} chunks")
+    return index
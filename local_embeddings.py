@@ -0,0 +1,87 @@
+"""Sentence-transformers embeddings computed on the local CPU.
+
+Used instead of Titan when EMBEDDING_BACKEND=local: queries are embedded
+without a network round trip and ingestion costs nothing per chunk. Texts are
+encoded in batches, the number of inference threads is configurable, and the
+model can run on ONNX Runtime, optionally with an int8-quantized export:
+
+    EMBEDDING_BACKEND=local LOCAL_EMBEDDING_RUNTIME=onnx-int8 python web_app.py
+
+ONNX needs `pip install "sentence-transformers[onnx]"`. Indexes record the
+model they were built with, so switching models means re-ingesting.
+"""
+import os
+import logging
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv('LOCAL_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+# torch, onnx or onnx-int8
+DEFAULT_RUNTIME = os.getenv('LOCAL_EMBEDDING_RUNTIME', 'torch')
+DEFAULT_BATCH_SIZE = int(os.getenv('LOCAL_EMBEDDING_BATCH_SIZE', '32'))
+# Inference threads; 0 keeps the library default (one per core)
+DEFAULT_THREADS = int(os.getenv('LOCAL_EMBEDDING_THREADS', '0'))
+# Quantized export loaded for onnx-int8; the AVX2 build runs on any recent x86 CPU
+INT8_ONNX_FILE = os.getenv('LOCAL_EMBEDDING_INT8_FILE', 'onnx/model_quint8_avx2.onnx')
+RUNTIMES = ('torch', 'onnx', 'onnx-int8')
+
+class LocalEmbeddings(Embeddings):
+    """LangChain embeddings backed by a sentence-transformers model"""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, runtime: str = DEFAULT_RUNTIME,
+                 batch_size: int = DEFAULT_BATCH_SIZE, threads: int = DEFAULT_THREADS,
+                 device: Optional[str] = None):
+        if runtime not in RUNTIMES:
+            raise ValueError(f"Unknown embedding runtime '{runtime}', expected one of {', '.join(RUNTIMES)}")
+        # Optional dependency, only needed when this backend is selected
+        from sentence_transformers import SentenceTransformer
+
+        self.model_id = model_name
+        self.runtime = runtime
+        self.batch_size = batch_size
+
+        model_kwargs = {}
+        if runtime == 'torch':
+            if threads:
+                import torch
+                torch.set_num_threads(threads)
+            backend = 'torch'
+        else:
+            if threads:
+                import onnxruntime
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = threads
+                model_kwargs['session_options'] = options
+            if runtime == 'onnx-int8':
+                model_kwargs['file_name'] = INT8_ONNX_FILE
+            backend = 'onnx'
+
+        logger.info(f"Loading local embedding model {model_name} ({runtime})...")
+        self.model = SentenceTransformer(model_name, device=device or 'cpu', backend=backend,
+                                         model_kwargs=model_kwargs or None)
+        # Retrieval models such as E5 expect queries to carry a prompt like "query: "
+        self._query_prompt = 'query' if 'query' in self.model.prompts else None
+        self._document_prompt = 'document' if 'document' in self.model.prompts else None
+        logger.info(f"✓ Loaded {model_name} ({self.model.get_sentence_embedding_dimension()} dimensions)")
+
+    def _encode(self, texts: List[str], prompt_name: Optional[str]) -> List[List[float]]:
+        # Normalized, so L2 distances and inner products both rank by cosine similarity
+        vectors = self.model.encode(texts, batch_size=self.batch_size, prompt_name=prompt_name,
+                                    normalize_embeddings=True, convert_to_numpy=True,
+                                    show_progress_bar=False)
+        return vectors.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts, self._document_prompt)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text], self._query_prompt)[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries as one batch"""
+        return self._encode(texts, self._query_prompt)
@@ -0,0 +1,202 @@
+"""Lightweight in-process metrics: counters, histograms and timers.
+
+Everything is recorded in one process-wide registry. The web apps render it
+in the Prometheus text format on /metrics; the Lambda writes a structured
+JSON log line per invocation instead. Recording is a dict lookup and an
+addition under a lock, so it is cheap enough for the hot path.
+
+    with metrics.timer('rag_stage_seconds', stage='search'):
+        ...
+    metrics.inc('embedding_cache_requests_total', kind='query', result='hit')
+
+Only needs the standard library, so the Lambda can use it too.
+"""
+import time
+import json
+import bisect
+import functools
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond FAISS searches to slow generations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'rag_stage_seconds': 'Time spent in each retrieval and generation stage',
+    'advanced_rag_stage_seconds': 'Time spent in each stage of the advanced RAG pipeline',
+    'rag_requests_total': 'Questions received, by endpoint, search type and status',
+    'rag_request_seconds': 'End-to-end time to answer a question',
+    'bedrock_call_seconds': 'Latency of Bedrock invocations, by model',
+    'bedrock_first_token_seconds': 'Time to the first streamed answer token',
+    'bedrock_retries_total': 'Bedrock calls retried, by reason',
+    'bedrock_throttles_total': 'Bedrock calls rejected by throttling',
+    'bedrock_tokens_total': 'Tokens reported by Bedrock, by model and direction',
+    'embedding_cache_requests_total': 'Embedding cache lookups, by kind and result',
+    'answer_cache_requests_total': 'Semantic answer cache lookups, by result',
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _escape(value: str) -> str:
+    """Escape a label value as the exposition format requires"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(key: LabelKey, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Timer:
+    """Context manager that observes its elapsed time in seconds"""
+    __slots__ = ('registry', 'name', 'labels', 'start', 'seconds')
+
+    def __init__(self, registry: 'Registry', name: str, labels: Dict[str, object]):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.seconds = 0.0
+
+    def __enter__(self) -> 'Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.registry.observe(self.name, self.seconds, **self.labels)
+
+class Registry:
+    """Thread-safe set of labelled counters and histograms"""
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, name: str, **labels) -> Timer:
+        return Timer(self, name, labels)
+
+    def total(self, name: str) -> float:
+        """Sum of a counter over all of its label values"""
+        with self._lock:
+            return sum(self._counters.get(name, {}).values())
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        bucket = _format_labels(key, f'le="{bound:g}"')
+                        lines.append(f"{name}_bucket{bucket} {cumulative}")
+                    bucket = _format_labels(key, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{bucket} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+class Stopwatch:
+    """Stage timings of a single request in ms, optionally also recorded in a histogram"""
+
+    def __init__(self, metric: Optional[str] = None, timings: Optional[Dict[str, float]] = None,
+                 registry: Optional[Registry] = None):
+        self.metric = metric
+        self.timings = {} if timings is None else timings
+        self.registry = registry or REGISTRY
+
+    def stage(self, name: str) -> '_Stage':
+        return _Stage(self, name)
+
+    def log_line(self, event: str, **fields) -> str:
+        """One JSON log line with the stage timings and any extra fields"""
+        stages = {stage: round(ms, 2) for stage, ms in self.timings.items()}
+        return json.dumps({'event': event, 'stages_ms': stages, **fields}, default=str)
+
+class _Stage:
+    __slots__ = ('stopwatch', 'name', 'start')
+
+    def __init__(self, stopwatch: Stopwatch, name: str):
+        self.stopwatch = stopwatch
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        timings = self.stopwatch.timings
+        timings[self.name] = timings.get(self.name, 0.0) + seconds * 1000
+        if self.stopwatch.metric:
+            self.stopwatch.registry.observe(self.stopwatch.metric, seconds, stage=self.name)
+
+# Shared registry for the whole process
+REGISTRY = Registry()
+
+def inc(name: str, amount: float = 1.0, **labels):
+    REGISTRY.inc(name, amount, **labels)
+
+def observe(name: str, value: float, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+def timer(name: str, **labels) -> Timer:
+    return REGISTRY.timer(name, **labels)
+
+def timed(name: str, **labels):
+    """Decorator recording the duration of every call in a histogram"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with REGISTRY.timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def render() -> str:
+    return REGISTRY.render()
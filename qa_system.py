@@ -1,36 +1,72 @@
 import os
 from dotenv import load_dotenv
-import boto3
-from langchain_aws import BedrockEmbeddings
 from langchain_community.vectorstores import FAISS
 import logging
 import json
+import time
+from typing import Dict, Optional
+from embedding_cache import CachedEmbeddings
+import keyword_index
+from index_manager import IndexManager
+from ann_index import search_parameters
+from chunk_store import load_index, save_index
+from retrieval import HybridRetriever, RetrievedChunk, dense_search
+from answer_cache import SemanticAnswerCache
+from bedrock_client import get_bedrock_client, get_embedding_runtime_client
+from context_packer import pack_context
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Directory the FAISS index is saved to and loaded from
+INDEX_PATH = "temp_index"
+
+# "bedrock" (Titan) or "local" (sentence-transformers, see local_embeddings.py)
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'bedrock')
+EMBEDDING_MODEL_ID = os.getenv('EMBEDDING_MODEL_ID', 'amazon.titan-embed-text-v1')
+
+def get_index_version(index_path: str = INDEX_PATH):
+    """Return a token that changes whenever the on-disk index is rewritten"""
+    if not os.path.isdir(index_path):
+        return None
+    version = []
+    for name in sorted(os.listdir(index_path)):
+        stat = os.stat(os.path.join(index_path, name))
+        version.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+def create_embeddings(client=None, backend: str = None):
+    """Embeddings for the configured backend, wrapped in the embedding cache"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == 'local':
+        from local_embeddings import LocalEmbeddings
+        return CachedEmbeddings(LocalEmbeddings())
+    if backend != 'bedrock':
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}', expected 'bedrock' or 'local'")
+
+    from langchain_aws import BedrockEmbeddings
+    return CachedEmbeddings(BedrockEmbeddings(
+        client=client or get_embedding_runtime_client(),
+        model_id=EMBEDDING_MODEL_ID
+    ))
+
 class QASystem:
-    def __init__(self):
+    def __init__(self, index_path: str = INDEX_PATH):
+        self.index_path = index_path
+        
         # Load environment variables
         load_dotenv()
         
-        # Initialize Bedrock client
-        self.bedrock = boto3.client(
-            'bedrock-runtime',
-            region_name='us-east-1',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
+        # Shared Bedrock clients: pooled connections, rate limiting and retries
+        self.bedrock = get_embedding_runtime_client()
+        self.llm = get_bedrock_client()
         
-        # Initialize Titan embeddings
-        self.embeddings = BedrockEmbeddings(
-            client=self.bedrock,
-            model_id="amazon.titan-embed-text-v1"
-        )
+        # Initialize embeddings (Titan unless EMBEDDING_BACKEND=local) behind a cache so repeated text is only embedded once
+        self.embeddings = create_embeddings(self.bedrock)
         
         # Create a simple test index if none exists
-        if not os.path.exists("temp_index"):
+        if not os.path.exists(self.index_path):
             logger.info("Creating new test index...")
             texts = [
                 "This is a RAG (Retrieval Augmented Generation) system.",
@@ -39,24 +75,28 @@ class QASystem:
                 "Questions are answered using relevant document context."
             ]
             self.db = FAISS.from_texts(texts, self.embeddings)
-            self.db.save_local("temp_index")
+            save_index(self.db, self.index_path)
             logger.info("✓ Created and saved test index")
         else:
             logger.info("Loading existing index...")
-            self.db = FAISS.load_local("temp_index", self.embeddings, allow_dangerous_deserialization=True)
+            # Vectors and chunk texts are memory-mapped, so worker processes share one copy
+            self.db = load_index(self.index_path, self.embeddings)
             logger.info("✓ Loaded existing index")
+        
+        # Keyword (BM25) index kept in sync with the FAISS docstore
+        self.keyword_index = keyword_index.load_or_build(self.db, self.index_path)
+        
+        # Answers are tied to this index; a rebuilt index gets a fresh cache
+        self.answer_cache = SemanticAnswerCache()
+        
+        # Document-level updates; its tombstones are filtered out of every search
+        self.index_manager = IndexManager(self.db, self.index_path, self.keyword_index,
+                                          embeddings=self.embeddings, on_change=self.answer_cache.invalidate)
+        self.retriever = HybridRetriever(self.db, self.keyword_index, exclude=self.index_manager.tombstones)
     
-    def answer_question(self, question: str, k: int = 2) -> str:
-        """Answer a question using RAG"""
-        try:
-            # Get relevant documents
-            docs = self.db.similarity_search(question, k=k)
-            
-            # Prepare context
-            context = "\n\n".join(doc.page_content for doc in docs)
-            
-            # Generate answer
-            prompt = f"""Based on this context:
+    def _build_prompt(self, context: str, question: str) -> str:
+        """Build the answer prompt shared by every search type"""
+        return f"""Based on this context:
             ---
             {context}
             ---
@@ -65,201 +105,154 @@ class QASystem:
             
             If the context doesn't contain relevant information, say "I don't have enough information to answer that."
             """
+
+    def _retrieve(self, query: str, search_type: str, k: int, search_params: Optional[Dict] = None):
+        """Fetch context chunks (with their chunk ids) for the given search type.
+
+        `search_params` may set `nprobe` (IVF) or `ef_search` (HNSW) for this query only.
+        """
+        tombstones = self.index_manager.tombstones
+        params = search_parameters(self.db.index, **(search_params or {}))
+        if search_type == 'semantic':
+            hits = dense_search(self.db, query, k, exclude=tombstones, params=params)
+        elif search_type == 'keyword':
+            hits = self.keyword_index.search(query, k=k, exclude=tombstones)
+        else:
+            return self.retriever.retrieve(query, k=k, params=params)
+        return [RetrievedChunk(chunk_id, self.db.docstore.search(chunk_id), score) for chunk_id, score in hits]
+
+    def _cached_answer(self, query: str, search_type: str, chunks):
+        """Return a cached answer for a similar query over the same chunks, if any"""
+        chunk_ids = [chunk.chunk_id for chunk in chunks]
+        # Keyword search never embeds the query, so match its answers on the query text instead of paying for an embedding
+        if search_type == 'keyword':
+            answer = self.answer_cache.lookup_exact(search_type, query, chunk_ids)
+        else:
+            answer = self.answer_cache.lookup(search_type, self.embeddings.embed_query(query), chunk_ids)
+        if answer is not None:
+            logger.info("Answer cache hit")
+        return answer
+
+    def _store_answer(self, query: str, search_type: str, chunks, answer: str):
+        chunk_ids = [chunk.chunk_id for chunk in chunks]
+        if search_type == 'keyword':
+            self.answer_cache.store_exact(search_type, query, chunk_ids, answer)
+        else:
+            self.answer_cache.store(search_type, self.embeddings.embed_query(query), chunk_ids, answer)
+
+    def answer_question(self, question: str, k: int = 2, search_params: Optional[Dict] = None) -> str:
+        """Answer a question using RAG"""
+        try:
+            # Get relevant documents
+            chunks = self._retrieve(question, 'semantic', k, search_params)
+            
+            # Reuse the answer to a similar question over the same documents
+            cached = self._cached_answer(question, 'semantic', chunks)
+            if cached is not None:
+                return cached
             
-            import time
-            max_retries = 3
-            retry_delay = 2
+            # Prepare context
+            context = pack_context([chunk.document.page_content for chunk in chunks]).text
             
-            for attempt in range(max_retries):
-                try:
-                    response = self.bedrock.invoke_model(
-                        modelId="anthropic.claude-3-5-sonnet-20240620-v1:0",
-                        body=json.dumps({
-                            "anthropic_version": "bedrock-2023-05-31",
-                            "max_tokens": 500,
-                            "messages": [
-                                {
-                                    "role": "user",
-                                    "content": prompt
-                                }
-                            ]
-                        })
-                    )
-                    break  # Success, exit retry loop
-                except Exception as e:
-                    if "reached max retries" in str(e) and attempt < max_retries - 1:
-                        logger.warning(f"Rate limit hit, retrying in {retry_delay} seconds... (attempt {attempt + 1}/{max_retries})")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2  # Exponential backoff
-                        continue
-                    else:
-                        raise e
+            # Generate answer
+            prompt = self._build_prompt(context, question)
             
-            response_body = json.loads(response['body'].read())
-            answer = response_body['content'][0]['text']
-            return answer.strip()
+            answer = self.llm.invoke(prompt).strip()
+            self._store_answer(question, 'semantic', chunks, answer)
+            return answer
             
         except Exception as e:
             logger.error(f"Error answering question: {str(e)}")
             return f"Error: {str(e)}"
 
-    def search_by_keywords(self, query: str, k: int = 2) -> str:
-        """Search using keyword matching instead of semantic search"""
+    def search_by_keywords(self, query: str, k: int = 2, search_params: Optional[Dict] = None) -> str:
+        """Search using BM25 keyword matching instead of semantic search"""
         try:
-            # Get all documents from the index using a dummy query
-            all_docs = self.db.similarity_search("document", k=100)  # Get many docs
-            
-            # Filter by keyword matching
-            matching_docs = []
-            query_lower = query.lower()
-            
-            for doc in all_docs:
-                content_lower = doc.page_content.lower()
-                if query_lower in content_lower:
-                    matching_docs.append(doc)
+            # Look up matching chunks in the BM25 index
+            chunks = self._retrieve(query, 'keyword', k, search_params)
             
-            if not matching_docs:
+            if not chunks:
                 return "I don't have enough information to answer that."
             
+            cached = self._cached_answer(query, 'keyword', chunks)
+            if cached is not None:
+                return cached
+            
             # Use the matching documents
-            context = "\n\n".join(doc.page_content for doc in matching_docs[:k])
+            context = pack_context([chunk.document.page_content for chunk in chunks]).text
             
             # Generate answer using the same prompt as before
-            prompt = f"""Based on this context:
-            ---
-            {context}
-            ---
-            
-            Answer this question: {query}
-            
-            If the context doesn't contain relevant information, say "I don't have enough information to answer that."
-            """
+            prompt = self._build_prompt(context, query)
             
-            # Use your existing Bedrock call
-            import time
-            max_retries = 3
-            retry_delay = 2
-            
-            for attempt in range(max_retries):
-                try:
-                    response = self.bedrock.invoke_model(
-                        modelId="anthropic.claude-3-5-sonnet-20240620-v1:0",
-                        body=json.dumps({
-                            "anthropic_version": "bedrock-2023-05-31",
-                            "max_tokens": 500,
-                            "messages": [
-                                {
-                                    "role": "user",
-                                    "content": prompt
-                                }
-                            ]
-                        })
-                    )
-                    break
-                except Exception as e:
-                    if "reached max retries" in str(e) and attempt < max_retries - 1:
-                        logger.warning(f"Rate limit hit, retrying in {retry_delay} seconds... (attempt {attempt + 1}/{max_retries})")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2
-                        continue
-                    else:
-                        raise e
-            
-            response_body = json.loads(response['body'].read())
-            answer = response_body['content'][0]['text']
-            return answer.strip()
+            answer = self.llm.invoke(prompt).strip()
+            self._store_answer(query, 'keyword', chunks, answer)
+            return answer
             
         except Exception as e:
             logger.error(f"Error in keyword search: {str(e)}")
             return f"Error: {str(e)}"
 
-    def hybrid_search(self, query: str, k: int = 3) -> str:
-        """Combines semantic and keyword search for better results"""
+    def hybrid_search(self, query: str, k: int = 3, search_params: Optional[Dict] = None) -> str:
+        """Combines semantic and keyword search with rank fusion for better results"""
         try:
-            # Get semantic search results
-            semantic_docs = self.db.similarity_search(query, k=k)
-            
-            # Get keyword search results
-            all_docs = self.db.similarity_search("document", k=100)  # Get many docs
-            query_lower = query.lower()
-            keyword_docs = []
-            
-            for doc in all_docs:
-                content_lower = doc.page_content.lower()
-                if query_lower in content_lower:
-                    keyword_docs.append(doc)
+            # Dense and BM25 results fused by score, deduplicated by chunk id
+            chunks = self._retrieve(query, 'hybrid', k, search_params)
             
-            # Combine and deduplicate results
-            combined_docs = []
-            seen_content = set()
-            
-            # Add semantic results first (they're usually more relevant)
-            for doc in semantic_docs:
-                if doc.page_content not in seen_content:
-                    combined_docs.append(doc)
-                    seen_content.add(doc.page_content)
-            
-            # Add keyword results that aren't already included
-            for doc in keyword_docs:
-                if doc.page_content not in seen_content:
-                    combined_docs.append(doc)
-                    seen_content.add(doc.page_content)
-            
-            if not combined_docs:
+            if not chunks:
                 return "I don't have enough information to answer that."
             
-            # Use the combined documents
-            context = "\n\n".join(doc.page_content for doc in combined_docs[:k])
+            cached = self._cached_answer(query, 'hybrid', chunks)
+            if cached is not None:
+                return cached
             
-            # Generate answer
-            prompt = f"""Based on this context:
-            ---
-            {context}
-            ---
-            
-            Answer this question: {query}
-            
-            If the context doesn't contain relevant information, say "I don't have enough information to answer that."
-            """
-            
-            # Use your existing Bedrock call with retry logic
-            import time
-            max_retries = 3
-            retry_delay = 2
+            # Use the fused documents
+            context = pack_context([chunk.document.page_content for chunk in chunks]).text
             
-            for attempt in range(max_retries):
-                try:
-                    response = self.bedrock.invoke_model(
-                        modelId="anthropic.claude-3-5-sonnet-20240620-v1:0",
-                        body=json.dumps({
-                            "anthropic_version": "bedrock-2023-05-31",
-                            "max_tokens": 500,
-                            "messages": [
-                                {
-                                    "role": "user",
-                                    "content": prompt
-                                }
-                            ]
-                        })
-                    )
-                    break
-                except Exception as e:
-                    if "reached max retries" in str(e) and attempt < max_retries - 1:
-                        logger.warning(f"Rate limit hit, retrying in {retry_delay} seconds... (attempt {attempt + 1}/{max_retries})")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2
-                        continue
-                    else:
-                        raise e
+            # Generate answer
+            prompt = self._build_prompt(context, query)
             
-            response_body = json.loads(response['body'].read())
-            answer = response_body['content'][0]['text']
-            return answer.strip()
+            answer = self.llm.invoke(prompt).strip()
+            self._store_answer(query, 'hybrid', chunks, answer)
+            return answer
             
         except Exception as e:
             logger.error(f"Error in hybrid search: {str(e)}")
             return f"Error: {str(e)}"
 
+    def stream_answer(self, query: str, search_type: str = 'hybrid', k: int = None,
+                      search_params: Optional[Dict] = None):
+        """Yield the answer text incrementally as Claude generates it"""
+        if search_type not in ('semantic', 'keyword'):
+            search_type = 'hybrid'
+        if k is None:
+            k = 3 if search_type == 'hybrid' else 2
+        
+        chunks = self._retrieve(query, search_type, k, search_params)
+        if not chunks:
+            yield "I don't have enough information to answer that."
+            return
+        
+        cached = self._cached_answer(query, search_type, chunks)
+        if cached is not None:
+            yield cached
+            return
+        
+        context = pack_context([chunk.document.page_content for chunk in chunks]).text
+        prompt = self._build_prompt(context, query)
+        
+        start = time.perf_counter()
+        first_token_at = None
+        parts = []
+        for text in self.llm.stream(prompt):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                logger.info(f"Time to first token: {(first_token_at - start) * 1000:.0f} ms")
+            parts.append(text)
+            yield text
+        
+        logger.info(f"Streamed answer in {(time.perf_counter() - start) * 1000:.0f} ms")
+        self._store_answer(query, search_type, chunks, "".join(parts).strip())
+
     def show_available_documents(self, limit: int = 5):
         """Show preview of available documents"""
         if not self.db:
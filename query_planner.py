@@ -0,0 +1,139 @@
+"""Choose which query variants are worth a retrieval round trip.
+
+QueryProcessor can produce a dozen variants per question, and each one costs
+an embedding call and a search row. The planner ranks them by expected value:
+how novel their terms are compared with the original, how well the intent was
+recognized, and how often variants of the same kind (and term) contributed
+chunks to past answers. It keeps a bounded, deterministic top-N and skips
+expansion when the plain query already has a close match.
+"""
+import os
+import re
+import threading
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ann_index import reconstruct
+from cache_utils import LRUCache
+from embedding_cache import normalize_text
+from query_processor import QueryAnalysis, QueryIntent
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Variants searched besides the original question
+FANOUT_MAX = int(os.getenv('QUERY_FANOUT_MAX', '4'))
+FANOUT_MIN_SCORE = float(os.getenv('QUERY_FANOUT_MIN_SCORE', '0.1'))
+# Cosine similarity of the best first-pass hit above which expansion is skipped
+CONFIDENT_SIMILARITY = float(os.getenv('QUERY_FANOUT_CONFIDENT_SIMILARITY', '0.8'))
+
+# Starting usefulness of each variant kind, before any history is recorded
+KIND_PRIORS = {'reformulation': 0.5, 'expansion': 0.6, 'entity': 0.4}
+USEFULNESS_ALPHA = 0.1
+
+@dataclass(frozen=True)
+class Variant:
+    """A search query derived from the question, with its fusion weight"""
+    query: str
+    kind: str
+    term: str = ''
+    score: float = 1.0
+
+def _terms(text: str) -> set:
+    return {word for word in re.findall(r'\w+', text.lower()) if len(word) > 2}
+
+class UsefulnessStats:
+    """Moving average of how often variants of a kind, or built from a term, added chunks to the answer"""
+
+    def __init__(self, alpha: float = USEFULNESS_ALPHA, maxsize: int = 4096):
+        self.alpha = alpha
+        self._kinds = dict(KIND_PRIORS)
+        self._terms = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, term: str = '') -> float:
+        value = self._terms.get((kind, term)) if term else None
+        return self._kinds[kind] if value is None else value
+
+    def update(self, kind: str, term: str, useful: bool):
+        target = 1.0 if useful else 0.0
+        with self._lock:
+            self._kinds[kind] += self.alpha * (target - self._kinds[kind])
+            if term:
+                current = self._terms.get((kind, term), KIND_PRIORS[kind])
+                self._terms.set((kind, term), current + self.alpha * (target - current))
+
+class FanoutPlanner:
+    """Score candidate query variants and keep the most promising few"""
+
+    def __init__(self, max_variants: int = FANOUT_MAX, min_score: float = FANOUT_MIN_SCORE,
+                 confident_similarity: float = CONFIDENT_SIMILARITY, stats: UsefulnessStats = None):
+        self.max_variants = max_variants
+        self.min_score = min_score
+        self.confident_similarity = confident_similarity
+        self.stats = stats or UsefulnessStats()
+
+    @staticmethod
+    def candidates(analysis: QueryAnalysis) -> List[Variant]:
+        """All variants QueryProcessor would search, in a fixed order and without duplicates"""
+        original = analysis.original_query
+        variants = [Variant(original, 'original')]
+        variants += [Variant(query, 'reformulation') for query in analysis.reformulated_queries]
+        variants += [Variant(f"{original} {term}", 'expansion', term.lower()) for term in analysis.expanded_terms]
+        variants += [Variant(f"{entity} {original}", 'entity', entity.lower()) for entity in analysis.entities]
+
+        seen = set()
+        unique = []
+        for variant in variants:
+            key = normalize_text(variant.query)
+            if key not in seen:
+                seen.add(key)
+                unique.append(variant)
+        return unique
+
+    def score(self, variant: Variant, analysis: QueryAnalysis) -> float:
+        """Expected value of searching a variant, between 0 and 1"""
+        terms = _terms(variant.query)
+        novelty = len(terms - _terms(analysis.original_query)) / max(1, len(terms))
+        # Intent-specific rewordings help when the intent is clear; synonyms help vague questions most
+        if variant.kind == 'reformulation':
+            fit = analysis.confidence if analysis.intent != QueryIntent.UNKNOWN else 0.5 * analysis.confidence
+        else:
+            fit = 1.0 - 0.5 * analysis.confidence
+        return self.stats.get(variant.kind, variant.term) * fit * (0.5 + 0.5 * novelty)
+
+    def plan(self, analysis: QueryAnalysis) -> List[Variant]:
+        """The original question followed by the top-scoring variants"""
+        original, *others = self.candidates(analysis)
+        scored = [Variant(v.query, v.kind, v.term, self.score(v, analysis)) for v in others]
+        # Stable sort, so ties keep candidate order and the plan is deterministic
+        scored.sort(key=lambda v: v.score, reverse=True)
+        kept = [v for v in scored if v.score >= self.min_score][:self.max_variants]
+        return [original] + kept
+
+    def is_confident(self, db, vector: np.ndarray, position: Optional[int]) -> bool:
+        """Whether the best first-pass hit, at `position` in the FAISS index, is close enough
+        to the query vector that expansion is not worth its cost"""
+        if position is None:
+            return False
+        # Search scores only equal cosine similarity for unit-length vectors, and Titan v1
+        # embeddings are not normalized, so compare against the stored vector directly
+        hit = reconstruct(db.index, position)
+        norms = float(np.linalg.norm(vector) * np.linalg.norm(hit))
+        return norms > 0 and float(np.dot(vector, hit)) / norms >= self.confident_similarity
+
+    def record(self, variants: Sequence[Variant], rankings: Sequence[Sequence[Tuple[str, float]]],
+               selected: Sequence[str]):
+        """Learn from one retrieval: a variant was useful if it found a selected chunk the original missed"""
+        if len(variants) < 2:
+            return
+        depth = len(selected)
+        original_ids = {chunk_id for chunk_id, _ in rankings[0][:depth]}
+        selected = set(selected)
+        for variant, ranking in zip(variants[1:], rankings[1:]):
+            found = {chunk_id for chunk_id, _ in ranking[:depth]}
+            self.stats.update(variant.kind, variant.term, bool((found & selected) - original_ids))
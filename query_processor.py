@@ -1,17 +1,22 @@
+import os
 import re
 import json
 import logging
 from typing import List, Dict, Tuple, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
-import boto3
-import os
 from dotenv import load_dotenv
+from bedrock_client import get_bedrock_client
+from cache_utils import LRUCache
+from embedding_cache import normalize_text
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Analyses (and their search queries) kept per normalized query
+ANALYSIS_CACHE_SIZE = int(os.getenv('QUERY_ANALYSIS_CACHE_SIZE', '1024'))
+
 class QueryIntent(Enum):
     """Query intent classification"""
     FACTUAL = "factual"  # What is X? Who is Y?
@@ -23,16 +28,74 @@ class QueryIntent(Enum):
     CAUSAL = "causal"  # What causes X?
     UNKNOWN = "unknown"
 
-@dataclass
+@dataclass(frozen=True)
 class QueryAnalysis:
-    """Structured analysis of a query"""
+    """Structured analysis of a query (immutable, so cached analyses can be shared)"""
     original_query: str
     intent: QueryIntent
-    entities: List[str]
-    keywords: List[str]
-    expanded_terms: List[str]
-    reformulated_queries: List[str]
+    entities: Tuple[str, ...]
+    keywords: Tuple[str, ...]
+    expanded_terms: Tuple[str, ...]
+    reformulated_queries: Tuple[str, ...]
     confidence: float
+    # Every intent with a cue in the query and its share of the cues, best first
+    intent_scores: Tuple[Tuple[QueryIntent, float], ...] = ()
+
+# Intent cue phrases, in priority order (earlier intents win ties)
+INTENT_PATTERNS = {
+    QueryIntent.FACTUAL: [
+        r'what is', r'what are', r'who is', r'who are', 
+        r'which is', r'which are', r'where is', r'where are'
+    ],
+    QueryIntent.COMPARATIVE: [
+        r'compar(?:e|es|ed|ing|ison)', r'differences?', r'versus', r'vs', 
+        r'better than', r'worse than', r'advantages?', r'disadvantages?'
+    ],
+    QueryIntent.PROCEDURAL: [
+        r'how to', r'how do', r'how can', r'how does',
+        r'steps to', r'process of', r'method to'
+    ],
+    QueryIntent.ANALYTICAL: [
+        r'why', r'explain(?:s|ed|ing)?', r'analy[sz]e', r'reason for',
+        r'cause of', r'purpose of'
+    ],
+    QueryIntent.DEFINITIONAL: [
+        r'define', r'definition', r'meaning of', r'what does\b.*?\bmean'
+    ],
+    QueryIntent.TEMPORAL: [
+        r'when', r'time', r'date', r'history', r'timeline'
+    ],
+    QueryIntent.CAUSAL: [
+        r'causes', r'results in', r'leads to', r'because of'
+    ]
+}
+
+class IntentClassifier:
+    """Classify query intent in one scan of a single precompiled regex.
+
+    Each intent's patterns form one named group of an alternation wrapped in
+    word boundaries, so short cues like 'vs' or 'why' only match whole words.
+    """
+
+    def __init__(self, patterns: Dict[QueryIntent, List[str]] = INTENT_PATTERNS):
+        self.intents = list(patterns)
+        groups = [f"(?P<i{i}>{'|'.join(cues)})" for i, cues in enumerate(patterns.values())]
+        self.regex = re.compile(r'\b(?:' + '|'.join(groups) + r')\b')
+
+    def scores(self, query: str) -> List[Tuple[QueryIntent, float]]:
+        """Every intent with a cue in the query and its share of the cues found, best first"""
+        counts = [0] * len(self.intents)
+        for match in self.regex.finditer(query.lower()):
+            counts[int(match.lastgroup[1:])] += 1
+        total = sum(counts)
+        ranked = [(self.intents[i], count / total) for i, count in enumerate(counts) if count]
+        # Stable sort keeps priority order between equally supported intents
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked
+
+    def classify(self, query: str) -> QueryIntent:
+        ranked = self.scores(query)
+        return ranked[0][0] if ranked else QueryIntent.UNKNOWN
 
 class QueryProcessor:
     """Advanced query processing with expansion, reformulation, and intent understanding"""
@@ -40,42 +103,16 @@ class QueryProcessor:
     def __init__(self):
         load_dotenv()
         
-        # Initialize Bedrock client for LLM-based processing
-        self.bedrock = boto3.client(
-            'bedrock-runtime',
-            region_name='us-east-1',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
+        # Shared Bedrock client for LLM-based processing
+        self.llm = get_bedrock_client()
         
-        # Intent patterns
-        self.intent_patterns = {
-            QueryIntent.FACTUAL: [
-                r'what is', r'what are', r'who is', r'who are', 
-                r'which is', r'which are', r'where is', r'where are'
-            ],
-            QueryIntent.COMPARATIVE: [
-                r'compare', r'difference', r'versus', r'vs', 
-                r'better than', r'worse than', r'advantage', r'disadvantage'
-            ],
-            QueryIntent.PROCEDURAL: [
-                r'how to', r'how do', r'how can', r'how does',
-                r'steps to', r'process of', r'method to'
-            ],
-            QueryIntent.ANALYTICAL: [
-                r'why', r'explain', r'analyze', r'reason for',
-                r'cause of', r'purpose of'
-            ],
-            QueryIntent.DEFINITIONAL: [
-                r'define', r'definition', r'meaning of', r'what does.*mean'
-            ],
-            QueryIntent.TEMPORAL: [
-                r'when', r'time', r'date', r'history', r'timeline'
-            ],
-            QueryIntent.CAUSAL: [
-                r'causes', r'results in', r'leads to', r'because of'
-            ]
-        }
+        # Intent patterns, compiled once into a single regex
+        self.intent_patterns = INTENT_PATTERNS
+        self.intent_classifier = IntentClassifier(self.intent_patterns)
+        
+        # Memoized analyses and search queries
+        self.analysis_cache = LRUCache(maxsize=ANALYSIS_CACHE_SIZE)
+        self.search_query_cache = LRUCache(maxsize=ANALYSIS_CACHE_SIZE)
         
         # Common synonyms and related terms
         self.synonym_dict = {
@@ -92,7 +129,18 @@ class QueryProcessor:
         }
     
     def analyze_query(self, query: str) -> QueryAnalysis:
-        """Comprehensive query analysis"""
+        """Comprehensive query analysis, memoized by normalized query"""
+        key = normalize_text(query)
+        analysis = self.analysis_cache.get(key)
+        if analysis is None:
+            analysis = self._analyze(query)
+            self.analysis_cache.set(key, analysis)
+        elif analysis.original_query != query:
+            # Same question written differently: reuse the analysis, keep the caller's wording
+            analysis = replace(analysis, original_query=query)
+        return analysis
+    
+    def _analyze(self, query: str) -> QueryAnalysis:
         logger.info(f"Analyzing query: {query}")
         
         # Clean and preprocess query
@@ -103,7 +151,8 @@ class QueryProcessor:
         keywords = self._extract_keywords(cleaned_query)
         
         # Classify intent
-        intent = self._classify_intent(cleaned_query)
+        intent_scores = self.intent_classifier.scores(cleaned_query)
+        intent = intent_scores[0][0] if intent_scores else QueryIntent.UNKNOWN
         
         # Expand query with synonyms
         expanded_terms = self._expand_query(cleaned_query)
@@ -117,11 +166,12 @@ class QueryProcessor:
         return QueryAnalysis(
             original_query=query,
             intent=intent,
-            entities=entities,
-            keywords=keywords,
-            expanded_terms=expanded_terms,
-            reformulated_queries=reformulated_queries,
-            confidence=confidence
+            entities=tuple(entities),
+            keywords=tuple(keywords),
+            expanded_terms=tuple(expanded_terms),
+            reformulated_queries=tuple(reformulated_queries),
+            confidence=confidence,
+            intent_scores=tuple(intent_scores)
         )
     
     def _clean_query(self, query: str) -> str:
@@ -152,7 +202,7 @@ class QueryProcessor:
             if term in query:
                 entities.append(term)
         
-        return list(set(entities))
+        return list(dict.fromkeys(entities))
     
     def _extract_keywords(self, query: str) -> List[str]:
         """Extract important keywords from query"""
@@ -166,14 +216,7 @@ class QueryProcessor:
     
     def _classify_intent(self, query: str) -> QueryIntent:
         """Classify query intent using pattern matching"""
-        query_lower = query.lower()
-        
-        for intent, patterns in self.intent_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, query_lower):
-                    return intent
-        
-        return QueryIntent.UNKNOWN
+        return self.intent_classifier.classify(query)
     
     def _expand_query(self, query: str) -> List[str]:
         """Expand query with synonyms and related terms"""
@@ -184,7 +227,7 @@ class QueryProcessor:
             if word in self.synonym_dict:
                 expanded_terms.extend(self.synonym_dict[word])
         
-        return list(set(expanded_terms))
+        return list(dict.fromkeys(expanded_terms))
     
     def _reformulate_query(self, query: str, intent: QueryIntent) -> List[str]:
         """Generate alternative query formulations"""
@@ -233,20 +276,15 @@ class QueryProcessor:
     
     def generate_search_queries(self, analysis: QueryAnalysis) -> List[str]:
         """Generate multiple search queries for retrieval"""
-        search_queries = [analysis.original_query]
-        
-        # Add reformulated queries
-        search_queries.extend(analysis.reformulated_queries)
-        
-        # Add expanded term queries
-        for term in analysis.expanded_terms:
-            search_queries.append(f"{analysis.original_query} {term}")
-        
-        # Add entity-based queries
-        for entity in analysis.entities:
-            search_queries.append(f"{entity} {analysis.original_query}")
-        
-        return list(set(search_queries))  # Remove duplicates
+        cached = self.search_query_cache.get(analysis)
+        if cached is not None:
+            return list(cached)
+        
+        # Original, reformulations, synonym expansions and entity prefixes, as the planner sees them
+        from query_planner import FanoutPlanner
+        search_queries = tuple(variant.query for variant in FanoutPlanner.candidates(analysis))
+        self.search_query_cache.set(analysis, search_queries)
+        return list(search_queries)
     
     def process_with_llm(self, query: str) -> Dict:
         """Use LLM for advanced query processing"""
@@ -271,22 +309,7 @@ Format as JSON:
     "related_concepts": ["concept1", "concept2"]
 }}"""
 
-            response = self.bedrock.invoke_model(
-                modelId="anthropic.claude-3-5-sonnet-20240620-v1:0",
-                body=json.dumps({
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "max_tokens": 500,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ]
-                })
-            )
-            
-            response_body = json.loads(response['body'].read())
-            llm_response = response_body['content'][0]['text']
+            llm_response = self.llm.invoke(prompt)
             
             # Try to parse JSON from LLM response
             try:
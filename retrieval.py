@@ -0,0 +1,163 @@
+import os
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_FUSION = os.getenv('HYBRID_FUSION', 'rrf')
+RRF_K = 60
+
+@dataclass
+class RetrievedChunk:
+    """A chunk returned by a retriever, identified by its docstore id"""
+    chunk_id: str
+    document: Any
+    score: float
+
+def dense_search(db, query: str, k: int, exclude: Optional[Set[str]] = None,
+                 params=None) -> List[Tuple[str, float]]:
+    """Search the FAISS index and return (chunk_id, score) pairs, higher scores first"""
+    return dense_search_by_vectors(db, embed_queries(db, [query]), k, exclude, params)[0]
+
+def dense_search_by_vectors(db, vectors: np.ndarray, k: int, exclude: Optional[Set[str]] = None,
+                            params=None) -> List[List[Tuple[str, float]]]:
+    """Run one FAISS search for a batch of query vectors, skipping chunk ids in `exclude`.
+
+    `params` are the optional nprobe / ef_search overrides for this search only,
+    as returned by ann_index.search_parameters.
+    """
+    return [[(chunk_id, score) for _, chunk_id, score in row]
+            for row in search_positions(db, vectors, k, exclude, params)]
+
+@metrics.timed('rag_stage_seconds', stage='search')
+def search_positions(db, vectors: np.ndarray, k: int, exclude: Optional[Set[str]] = None,
+                     params=None) -> List[List[Tuple[int, str, float]]]:
+    """Like dense_search_by_vectors, but each hit also carries its position in the FAISS index"""
+    if getattr(db, '_normalize_L2', False):
+        import faiss
+        faiss.normalize_L2(vectors)
+    k = min(k, db.index.ntotal)
+    if k <= 0:
+        return [[] for _ in range(len(vectors))]
+    if exclude:
+        # Filtered inside FAISS, so tombstoned chunks cannot push results below k
+        from ann_index import search_parameters
+        params = search_parameters(db.index, getattr(params, 'nprobe', None), getattr(params, 'efSearch', None),
+                                   excluded_positions(db, exclude))
+
+    if params is not None:
+        distances, indices = db.index.search(vectors, k, params=params)
+    else:
+        distances, indices = db.index.search(vectors, k)
+    # Default FAISS indexes return L2 distances; flip them so larger is better
+    higher_is_better = str(getattr(db, 'distance_strategy', '')).endswith('MAX_INNER_PRODUCT')
+    results = []
+    for row_distances, row_indices in zip(distances, indices):
+        row = []
+        for distance, i in zip(row_distances, row_indices):
+            if i == -1:
+                continue
+            chunk_id = db.index_to_docstore_id[int(i)]
+            score = float(distance) if higher_is_better else -float(distance)
+            row.append((int(i), chunk_id, score))
+        results.append(row)
+    return results
+
+def excluded_positions(db, exclude: Set[str]) -> np.ndarray:
+    """FAISS positions of the chunk ids in `exclude`, recomputed only when the set or the index changes.
+
+    Tombstones only grow between compactions, and compaction changes the index size.
+    """
+    mapping = db.index_to_docstore_id
+    key = (id(exclude), len(exclude), db.index.ntotal, id(mapping))
+    cached = getattr(db, '_excluded_positions', None)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    lookup = getattr(mapping, 'position', None)
+    if lookup is None:
+        reverse = {chunk_id: position for position, chunk_id in mapping.items()}
+        lookup = reverse.get
+    positions = [lookup(chunk_id) for chunk_id in list(exclude)]
+    positions = np.array(sorted(p for p in positions if p is not None), dtype=np.int64)
+    db._excluded_positions = (key, positions)
+    return positions
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[List[Tuple[str, float]]],
+                           weights: Optional[Sequence[float]] = None,
+                           rrf_k: int = RRF_K) -> Dict[str, float]:
+    """Fuse ranked lists by summing weight / (rrf_k + rank) for each chunk"""
+    weights = weights or [1.0] * len(ranked_lists)
+    fused: Dict[str, float] = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, (chunk_id, _) in enumerate(ranked, 1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + weight / (rrf_k + rank)
+    return fused
+
+def weighted_score_fusion(scored_lists: Sequence[List[Tuple[str, float]]],
+                          weights: Optional[Sequence[float]] = None) -> Dict[str, float]:
+    """Fuse by min-max normalizing each list's scores and summing them with weights"""
+    weights = weights or [1.0] * len(scored_lists)
+    fused: Dict[str, float] = {}
+    for scored, weight in zip(scored_lists, weights):
+        if not scored:
+            continue
+        scores = [score for _, score in scored]
+        low, high = min(scores), max(scores)
+        span = (high - low) or 1.0
+        for chunk_id, score in scored:
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + weight * (score - low) / span
+    return fused
+
+@metrics.timed('rag_stage_seconds', stage='embed')
+def embed_queries(db, queries: Sequence[str]) -> np.ndarray:
+    """Embed several queries in one batch where the embeddings support it"""
+    batch = getattr(db.embeddings, 'embed_queries', None)
+    if batch is not None:
+        vectors = batch(list(queries))
+    else:
+        vectors = [db.embeddings.embed_query(query) for query in queries]
+    return np.array(vectors, dtype=np.float32)
+
+class HybridRetriever:
+    """Runs dense (FAISS) and sparse (BM25) retrieval concurrently and fuses the scores"""
+
+    def __init__(self, db, keyword_index, fusion: str = DEFAULT_FUSION,
+                 dense_weight: float = 1.0, sparse_weight: float = 1.0, candidates: int = 20,
+                 exclude: Optional[Set[str]] = None):
+        self.db = db
+        self.keyword_index = keyword_index
+        # Chunk ids that must never be returned, e.g. the index manager's tombstones
+        self.exclude = exclude
+        self.fusion = fusion
+        self.weights = [dense_weight, sparse_weight]
+        self.candidates = candidates
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="dense-search")
+
+    def retrieve(self, query: str, k: int = 3, params=None) -> List[RetrievedChunk]:
+        n = max(k, self.candidates)
+
+        # Dense search waits on the embedding call, so overlap it with BM25
+        dense_future = self._pool.submit(dense_search, self.db, query, n, self.exclude, params)
+        sparse = self.keyword_index.search(query, k=n, exclude=self.exclude)
+        dense = dense_future.result()
+
+        if self.fusion == 'weighted':
+            fused = weighted_score_fusion([dense, sparse], self.weights)
+        else:
+            fused = reciprocal_rank_fusion([dense, sparse], self.weights)
+
+        top = heapq.nlargest(k, fused.items(), key=lambda item: item[1])
+        return [
+            RetrievedChunk(chunk_id, self.db.docstore.search(chunk_id), score)
+            for chunk_id, score in top
+        ]
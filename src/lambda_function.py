@@ -1,45 +1,161 @@
 import json
 import boto3
 import os
+import time
 import logging
 from botocore.exceptions import ClientError
 from datetime import datetime
+from bedrock_client import get_bedrock_client
+from context_packer import pack_context
+import metrics
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Cap on how much of any payload is written to the logs
+LOG_MAX_CHARS = int(os.getenv('LOG_MAX_CHARS', '1000'))
+DEBUG_IDENTITY = os.getenv('DEBUG_IDENTITY', 'false').lower() == 'true'
+
+# Where the published FAISS index lives and how it is cached in the container
+INDEX_BUCKET = os.getenv('INDEX_BUCKET', os.getenv('S3_BUCKET'))
+INDEX_PREFIX = os.getenv('INDEX_PREFIX', 'index/')
+INDEX_CACHE_DIR = os.getenv('INDEX_CACHE_DIR', '/tmp/index')
+INDEX_CHECK_INTERVAL = float(os.getenv('INDEX_CHECK_INTERVAL', '300'))
+EMBEDDING_MODEL_ID = os.getenv('EMBEDDING_MODEL_ID', 'amazon.titan-embed-text-v1')
+TOP_K = int(os.getenv('TOP_K', '4'))
+# Counters reported per invocation in the structured request log line
+LOGGED_COUNTERS = {'retries': 'bedrock_retries_total', 'throttles': 'bedrock_throttles_total'}
+
+# Clients are created once per container and reused by warm invocations
+llm = get_bedrock_client()
+s3 = boto3.client('s3')
+_caller_identity = None
+
+def truncate(text, limit=LOG_MAX_CHARS):
+    """Shorten text for logging, noting how much was cut"""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+def log_caller_identity():
+    """Log the IAM identity once per container when DEBUG_IDENTITY is set"""
+    global _caller_identity
+    if not DEBUG_IDENTITY or _caller_identity is not None:
+        return
+    try:
+        _caller_identity = boto3.client('sts').get_caller_identity()
+        logger.info(f"Current IAM Identity: {_caller_identity.get('Arn')}")
+    except Exception as e:
+        logger.error(f"Error getting identity: {str(e)}")
+
+def index_files():
+    """Files the published index consists of; chunk_table needs numpy, so it is imported on first use"""
+    from chunk_table import TABLE_FILES
+    return ['index.faiss'] + TABLE_FILES
+
+class IndexCache:
+    """FAISS index downloaded from S3 once per container and refreshed when its ETags change"""
+
+    def __init__(self):
+        self.index = None
+        self.chunks = None
+        self.etags = None
+        self.checked_at = 0.0
+
+    def _remote_etags(self):
+        return [
+            s3.head_object(Bucket=INDEX_BUCKET, Key=INDEX_PREFIX + name)['ETag']
+            for name in index_files()
+        ]
+
+    def _download(self, etags):
+        os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+        etag_path = os.path.join(INDEX_CACHE_DIR, 'etags.json')
+        cached_etags = None
+        if os.path.exists(etag_path):
+            with open(etag_path) as f:
+                cached_etags = json.load(f)
+
+        # /tmp can outlive a handler instance, so only download what changed
+        if cached_etags != etags:
+            logger.info(f"Downloading index from s3://{INDEX_BUCKET}/{INDEX_PREFIX}")
+            for name in index_files():
+                s3.download_file(INDEX_BUCKET, INDEX_PREFIX + name, os.path.join(INDEX_CACHE_DIR, name))
+            with open(etag_path, 'w') as f:
+                json.dump(etags, f)
+
+        # faiss and numpy are only needed to retrieve, not when the caller sends its own context
+        import faiss
+        from chunk_table import ChunkTable
+
+        # Chunk texts stay on disk (memory-mapped) and are decoded only for retrieved rows
+        chunks = ChunkTable(INDEX_CACHE_DIR)
+        # Queries are embedded with Titan here, so an index built with a local model cannot be searched
+        if chunks.embedding_model and chunks.embedding_model != EMBEDDING_MODEL_ID:
+            raise ValueError(f"Index was embedded with {chunks.embedding_model}, "
+                             f"but EMBEDDING_MODEL_ID is {EMBEDDING_MODEL_ID}")
+        self.index = faiss.read_index(os.path.join(INDEX_CACHE_DIR, 'index.faiss'))
+        self.chunks = chunks
+        self.etags = etags
+        logger.info(f"Loaded index with {self.index.ntotal} chunks")
+
+    def get(self):
+        """Return (faiss index, chunk table), checking S3 for a new version at most every INDEX_CHECK_INTERVAL seconds"""
+        now = time.monotonic()
+        if self.index is None or now - self.checked_at >= INDEX_CHECK_INTERVAL:
+            etags = self._remote_etags()
+            if etags != self.etags:
+                self._download(etags)
+            self.checked_at = now
+        return self.index, self.chunks
+
+index_cache = IndexCache()
+
+def embed_query(query):
+    """Embed the query with Titan through the shared Bedrock client"""
+    import numpy as np
+    response_body = llm.invoke_json({"inputText": query}, model_id=EMBEDDING_MODEL_ID)
+    return np.array([response_body['embedding']], dtype=np.float32)
+
+def retrieve_context(query, k=TOP_K, watch=None):
+    """Top-k chunk texts for the query from the cached FAISS index"""
+    watch = watch or metrics.Stopwatch()
+    with watch.stage('index'):
+        index, chunks = index_cache.get()
+    with watch.stage('embed'):
+        vector = embed_query(query)
+    with watch.stage('search'):
+        _, indices = index.search(vector, min(k, index.ntotal))
+    with watch.stage('fetch'):
+        return [chunks.text(int(i)) for i in indices[0] if i != -1]
+
+def counter_totals():
+    return {field: metrics.REGISTRY.total(name) for field, name in LOGGED_COUNTERS.items()}
+
+def log_request(watch, baseline, status, **fields):
+    """Write one structured JSON log line per invocation with stage timings and counters"""
+    counts = {field: int(total - baseline[field]) for field, total in counter_totals().items()}
+    logger.info(watch.log_line('rag_request', status=status, **counts, **fields))
+
 def invoke_bedrock(prompt, model_id="anthropic.claude-v2"):
     """Invoke Bedrock model with the given prompt"""
-    bedrock = boto3.client('bedrock-runtime')
-    
     try:
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 1000,
-            "temperature": 0.1,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"""Given the following context, please answer the question. Keep your response concise and relevant.
+        context = pack_context(prompt['context'].split("\n\n")).text
+        return llm.invoke(
+            f"""Given the following context, please answer the question. Keep your response concise and relevant.
 
-Context: {prompt['context']}
+Context: {context}
 
 Question: {prompt['query']}
 
-Answer the question based only on the provided context. If the context doesn't contain enough information to answer the question, say so."""
-                }
-            ]
-        })
-        
-        response = bedrock.invoke_model(
-            modelId=model_id,
-            body=body
+Answer the question based only on the provided context. If the context doesn't contain enough information to answer the question, say so.""",
+            max_tokens=1000,
+            temperature=0.1,
+            model_id=model_id
         )
         
-        response_body = json.loads(response['body'].read())
-        return response_body['content'][0]['text']
-        
     except Exception as e:
         print(f"Error invoking Bedrock: {str(e)}")
         raise
@@ -47,7 +163,6 @@ Answer the question based only on the provided context. If the context doesn't c
 def store_qa_history(query, context, answer, bucket_name):
     """Store QA interaction history in S3"""
     try:
-        s3 = boto3.client('s3')
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         qa_record = {
@@ -70,19 +185,22 @@ def store_qa_history(query, context, answer, bucket_name):
         return None
 
 def lambda_handler(event, context):
+    watch = metrics.Stopwatch()
+    baseline = counter_totals()
     try:
-        # Log the incoming event
         logger.info("Starting Lambda execution")
-        logger.info(f"Event: {json.dumps(event)}")
         
         # Parse input
-        logger.info("Parsing input body")
         body = json.loads(event['body'])
         context_text = body.get('context', '')
         query = body.get('query', '')
         
-        if not context_text or not query:
+        # Log a bounded summary instead of the full event
+        logger.info(f"Query: {truncate(query)} | context: {len(context_text)} chars")
+        
+        if not query:
             logger.warning("Missing required parameters")
+            log_request(watch, baseline, 400)
             return {
                 'statusCode': 400,
                 'headers': {
@@ -90,22 +208,23 @@ def lambda_handler(event, context):
                     'Access-Control-Allow-Origin': '*'
                 },
                 'body': json.dumps({
-                    'error': 'Both context and query are required'
+                    'error': 'query is required'
                 })
             }
         
-        # Initialize Bedrock client
-        logger.info("Initializing Bedrock client")
-        bedrock = boto3.client('bedrock-runtime', region_name='us-east-1')
+        # Retrieve context server-side unless the caller supplied it
+        if context_text:
+            chunks = context_text.split("\n\n")
+        else:
+            chunks = retrieve_context(query, watch=watch)
+            logger.info(f"Retrieved {len(chunks)} chunks")
+        
+        # Fit the context to the prompt token budget, most relevant chunks first
+        with watch.stage('prompt'):
+            context_text = pack_context(chunks).text
         
         # Get IAM identity for debugging
-        try:
-            sts = boto3.client('sts')
-            identity = sts.get_caller_identity()
-            logger.info("Current IAM Identity:")
-            logger.info(json.dumps(identity, indent=2))
-        except Exception as e:
-            logger.error(f"Error getting identity: {str(e)}")
+        log_caller_identity()
         
         # Prepare the request payload
         model_id = 'anthropic.claude-3-sonnet-20240229-v1:0'
@@ -136,18 +255,18 @@ def lambda_handler(event, context):
         }
         
         logger.info(f"Invoking model: {model_id}")
-        logger.info(f"Request body: {json.dumps(request_body)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Request body: {truncate(json.dumps(request_body))}")
         
         # Invoke model
         try:
-            response = bedrock.invoke_model(
-                modelId=model_id,
-                body=json.dumps(request_body)
-            )
-            
-            # Parse response
-            response_body = json.loads(response['body'].read())
-            logger.info(f"Bedrock response: {json.dumps(response_body)}")
+            with watch.stage('generate'):
+                response_body = llm.invoke_json(request_body, model_id=model_id)
+            usage = response_body.get('usage', {})
+            log_request(watch, baseline, 200, chunks=len(chunks),
+                        input_tokens=usage.get('input_tokens'), output_tokens=usage.get('output_tokens'))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Bedrock response: {truncate(json.dumps(response_body))}")
             
             answer = response_body['content'][0]['text']
             
@@ -171,7 +290,8 @@ def lambda_handler(event, context):
             logger.error(f"Error Code: {error_code}")
             logger.error(f"Error Message: {error_message}")
             logger.error(f"Request ID: {request_id}")
-            logger.error(f"Full error response: {json.dumps(e.response)}")
+            logger.error(f"Full error response: {truncate(json.dumps(e.response, default=str))}")
+            log_request(watch, baseline, 500, error=error_code)
             
             return {
                 'statusCode': 500,
@@ -192,6 +312,7 @@ def lambda_handler(event, context):
             
     except Exception as e:
         logger.error(f"Error: {str(e)}", exc_info=True)
+        log_request(watch, baseline, 500, error=type(e).__name__)
         return {
             'statusCode': 500,
             'headers': {
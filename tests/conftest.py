@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# Modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('KMP_DUPLICATE_LIB_OK', 'TRUE')
+
+import bedrock_client
+from bedrock_client import BedrockClient, TokenBucket
+from benchmarks.stubs import FakeBedrockClient
+
+@pytest.fixture
+def fake_bedrock(monkeypatch):
+    """Route every Bedrock call in the process to `fake` (a zero-latency FakeBedrockClient by default)"""
+    def install(fake=None, max_attempts=5):
+        fake = fake or FakeBedrockClient(first_token_latency=0, token_latency=0)
+        monkeypatch.setitem(bedrock_client._runtime_clients, 'llm', fake)
+        monkeypatch.setitem(bedrock_client._runtime_clients, 'embeddings', fake)
+        monkeypatch.setattr(bedrock_client, '_shared_client',
+                            BedrockClient(client=fake, rate_limiter=TokenBucket(0, 1), max_attempts=max_attempts,
+                                          base_delay=0.001))
+        return fake
+    return install
+
+@pytest.fixture
+def make_qa_system(fake_bedrock, tmp_path):
+    """Build a QASystem on the small test index with every Bedrock call served by `fake`"""
+    def make(fake=None, max_attempts=5):
+        from qa_system import QASystem
+        fake_bedrock(fake, max_attempts)
+        return QASystem(index_path=str(tmp_path / "index"))
+    return make
@@ -0,0 +1,27 @@
+"""Answer cache lookups and what they cost in embedding calls."""
+import metrics
+from answer_cache import SemanticAnswerCache
+
+def embedding_lookups():
+    return metrics.REGISTRY.total('embedding_cache_requests_total')
+
+def test_keyword_search_never_embeds_the_query(make_qa_system):
+    qa = make_qa_system()
+    before = embedding_lookups()
+
+    first = qa.search_by_keywords("Where are documents stored?")
+    calls = qa.llm.client.calls
+    second = qa.search_by_keywords("  where are DOCUMENTS stored? ")
+
+    assert second == first
+    assert qa.llm.client.calls == calls
+    assert embedding_lookups() == before
+
+def test_exact_entries_need_the_same_chunks_and_are_invalidated():
+    cache = SemanticAnswerCache()
+    cache.store_exact('keyword', "What is FAISS?", ['a', 'b'], "A vector index.")
+
+    assert cache.lookup_exact('keyword', "what is  faiss?", ['b', 'a']) == "A vector index."
+    assert cache.lookup_exact('keyword', "What is FAISS?", ['a']) is None
+    cache.invalidate()
+    assert cache.lookup_exact('keyword', "What is FAISS?", ['a', 'b']) is None
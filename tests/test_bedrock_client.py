@@ -0,0 +1,114 @@
+"""Retries, deadlines and rate limiting in BedrockClient."""
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+import bedrock_client
+from bedrock_client import BedrockClient, TokenBucket
+from benchmarks.stubs import FakeBedrockClient
+
+class FakeClock:
+    """Stands in for time.monotonic and time.sleep so waits take no real time"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(bedrock_client.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(bedrock_client.time, 'sleep', clock.sleep)
+    return clock
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'InvokeModel')
+
+def failing(*errors, result="ok"):
+    """A call that raises each error in turn, then returns `result`; `.calls` counts attempts"""
+    def fn():
+        fn.calls += 1
+        if fn.calls <= len(errors):
+            raise errors[fn.calls - 1]
+        return result
+    fn.calls = 0
+    return fn
+
+def make_client(max_attempts=5, rate_limiter=None, **kwargs):
+    return BedrockClient(client=FakeBedrockClient(), rate_limiter=rate_limiter or TokenBucket(0, 1),
+                         max_attempts=max_attempts, base_delay=0.5, **kwargs)
+
+@pytest.mark.parametrize('error', [
+    client_error('ThrottlingException'),
+    client_error('ServiceUnavailableException'),
+    ReadTimeoutError(endpoint_url='https://bedrock'),
+], ids=['throttling', 'unavailable', 'read-timeout'])
+def test_retryable_errors_are_retried(clock, error):
+    fn = failing(error, error)
+
+    assert make_client()._call(fn, timeout=None) == "ok"
+    assert fn.calls == 3
+    assert len(clock.slept) == 2
+
+@pytest.mark.parametrize('code', ['ValidationException', 'AccessDeniedException'])
+def test_non_retryable_errors_are_raised_at_once(clock, code):
+    fn = failing(client_error(code))
+
+    with pytest.raises(ClientError, match=code):
+        make_client()._call(fn, timeout=None)
+    assert fn.calls == 1
+    assert clock.slept == []
+
+def test_gives_up_after_max_attempts(clock):
+    fn = failing(*[client_error('ThrottlingException')] * 10)
+
+    with pytest.raises(ClientError, match='ThrottlingException'):
+        make_client(max_attempts=3)._call(fn, timeout=None)
+    assert fn.calls == 3
+
+def test_backoff_never_sleeps_past_the_deadline(clock):
+    fn = failing(*[client_error('ThrottlingException')] * 10)
+    client = make_client(max_attempts=10, max_delay=60.0)
+
+    with pytest.raises(TimeoutError, match='deadline'):
+        client._call(fn, timeout=2.0)
+    assert sum(clock.slept) <= 2.0
+    assert fn.calls < 10
+
+def test_rate_limiter_wait_counts_against_the_deadline(clock):
+    bucket = TokenBucket(rate=0.1, capacity=1)
+    client = make_client(rate_limiter=bucket)
+    fn = failing()
+
+    assert client._call(fn, timeout=1.0) == "ok"
+    with pytest.raises(TimeoutError, match='rate limiter'):
+        client._call(fn, timeout=1.0)
+    assert fn.calls == 1
+
+def test_token_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3)
+
+    assert all(bucket.acquire() for _ in range(3))
+    assert clock.slept == []
+
+    assert bucket.acquire()
+    assert clock.slept == [pytest.approx(0.5)]
+
+    clock.now += 10
+    assert all(bucket.acquire() for _ in range(3))
+    assert len(clock.slept) == 1
+
+def test_throttled_invocations_are_retried_until_they_succeed(clock):
+    fake = FakeBedrockClient(answer="Recovered.", first_token_latency=0, token_latency=0,
+                             throttle_rate=0.5, seed=7)
+    client = BedrockClient(client=fake, rate_limiter=TokenBucket(0, 1), max_attempts=20, base_delay=0.01)
+
+    assert [client.invoke("Hello?") for _ in range(5)] == ["Recovered."] * 5
+    assert fake.throttled > 0
+    assert fake.calls == fake.throttled + 5
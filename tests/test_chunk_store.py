@@ -0,0 +1,38 @@
+"""Loading indexes saved as a chunk table, and refusing pickled ones."""
+import os
+
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from ann_index import convert_store
+from chunk_store import INDEX_FILE, load_index, migrate, save_index
+from qa_system import create_embeddings
+
+def test_pickled_index_is_refused_until_migrated(fake_bedrock, tmp_path):
+    fake_bedrock()
+    embeddings = create_embeddings()
+    index_path = str(tmp_path / "index")
+    FAISS.from_texts(["first chunk", "second chunk"], embeddings).save_local(index_path)
+
+    with pytest.raises(ValueError, match="python chunk_store.py migrate"):
+        load_index(index_path, embeddings)
+
+    migrate(index_path, embeddings)
+    assert load_index(index_path, embeddings).index.ntotal == 2
+
+@pytest.mark.parametrize('index_type, options', [
+    ('flat', {}), ('hnsw', {}), ('ivf_flat', {'nlist': 4}), ('ivf_pq', {'nlist': 4, 'pq_m': 16, 'pq_bits': 4}),
+])
+def test_saving_a_memory_mapped_index_keeps_its_vectors(fake_bedrock, tmp_path, index_type, options):
+    fake_bedrock()
+    embeddings = create_embeddings()
+    index_path = str(tmp_path / "index")
+    texts = [f"chunk {i} about topic {i % 7}" for i in range(64)]
+    save_index(convert_store(FAISS.from_texts(texts, embeddings), index_type, **options), index_path)
+    size = os.path.getsize(os.path.join(index_path, INDEX_FILE))
+
+    save_index(load_index(index_path, embeddings, mmap=True), index_path)
+
+    assert os.path.getsize(os.path.join(index_path, INDEX_FILE)) == size
+    db = load_index(index_path, embeddings, mmap=True)
+    assert db.similarity_search("chunk 5 about topic 5", k=1)
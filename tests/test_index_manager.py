@@ -0,0 +1,117 @@
+"""Document updates, tombstones and compaction on every FAISS index type."""
+import pytest
+
+import keyword_index
+from ann_index import convert_store
+from chunk_store import load_index
+from index_manager import IndexManager
+from qa_system import create_embeddings
+from retrieval import dense_search
+
+INDEX_TYPES = [('flat', {}), ('hnsw', {}), ('ivf_flat', {'nlist': 4})]
+
+def text(i):
+    return f"Document {i} covers topic {i % 7} and item {i * 13 % 29}."
+
+@pytest.fixture(params=[True, False], ids=['mmap', 'heap'])
+def open_manager(request, fake_bedrock, tmp_path):
+    """IndexManager over 64 one-chunk documents in an index of the given type, reloaded from disk"""
+    fake_bedrock()
+    index_path = str(tmp_path / "index")
+
+    def open_(index_type, options):
+        manager = IndexManager(None, index_path, embeddings=create_embeddings())
+        manager.upsert_many([(f"doc{i}", text(i), None) for i in range(64)])
+        convert_store(manager.db, index_type, **options)
+        manager.save()
+        return reopen(index_path)
+
+    def reopen(path=index_path):
+        embeddings = create_embeddings()
+        db = load_index(path, embeddings, mmap=request.param)
+        return IndexManager(db, path, keyword_index.load_or_build(db, path), embeddings=embeddings,
+                            compact_ratio=1.0)
+
+    open_.reopen = reopen
+    return open_
+
+@pytest.mark.parametrize('index_type, options', INDEX_TYPES, ids=[t for t, _ in INDEX_TYPES])
+def test_search_returns_k_live_chunks_however_many_are_tombstoned(open_manager, index_type, options):
+    manager = open_manager(index_type, options)
+    manager.delete([f"doc{i}" for i in range(40)])
+
+    hits = dense_search(manager.db, text(3), 20, exclude=manager.tombstones)
+
+    assert len(hits) == 20
+    assert not {chunk_id for chunk_id, _ in hits} & manager.tombstones
+
+class RecordingS3:
+    def __init__(self):
+        self.uploaded = {}
+
+    def upload_file(self, path, bucket, key):
+        with open(path, 'rb') as f:
+            self.uploaded[key] = f.read()
+
+def test_upload_index_compacts_tombstones_first(open_manager):
+    from deploy_lambda import upload_index
+    from index_manager import read_manifest
+    manager = open_manager('flat', {})
+    manager.delete(['doc1', 'doc2'])
+
+    s3 = RecordingS3()
+    upload_index(s3, 'bucket', manager.index_path)
+
+    assert read_manifest(manager.index_path)[1] == set()
+    db = load_index(manager.index_path, create_embeddings())
+    assert db.index.ntotal == 62
+    assert not {db.index_to_docstore_id[i] for i in range(62)} & manager.tombstones
+    assert 'index/index.faiss' in s3.uploaded
+
+def assert_index_consistent(manager, live):
+    """Every live document, and only those, is in the index and found by its own text"""
+    db = manager.db
+    assert db.index.ntotal == len(live)
+    ids = {db.index_to_docstore_id[i] for i in range(db.index.ntotal)}
+    assert ids == {chunk_id for i in live for chunk_id in manager.documents[f"doc{i}"]['chunks']}
+    for i in live:
+        (chunk_id, _), = dense_search(db, text(i), 1, exclude=manager.tombstones)
+        assert db.docstore.search(chunk_id).page_content == text(i)
+    assert {chunk_id for chunk_id, _ in manager.keyword_index.search(text(live[0]), k=64)} <= ids
+
+@pytest.mark.parametrize('index_type, options', INDEX_TYPES, ids=[t for t, _ in INDEX_TYPES])
+def test_compaction_removes_deleted_chunks(open_manager, index_type, options):
+    manager = open_manager(index_type, options)
+    manager.delete([f"doc{i}" for i in range(0, 64, 3)])
+    assert len(manager.tombstones) == 22
+    manager.compact()
+    assert not manager.tombstones
+
+    live = [i for i in range(64) if i % 3]
+    assert_index_consistent(manager, live)
+    assert_index_consistent(open_manager.reopen(), live)
+
+@pytest.mark.parametrize('index_type, options', INDEX_TYPES, ids=[t for t, _ in INDEX_TYPES])
+def test_updates_compact_automatically_past_the_ratio(open_manager, index_type, options):
+    manager = open_manager(index_type, options)
+    manager.compact_ratio = 0.1
+    manager.upsert('doc5', text(100))
+    assert len(manager.tombstones) == 1
+    manager.delete([f"doc{i}" for i in range(10, 16)])
+    assert not manager.tombstones
+
+    reopened = open_manager.reopen()
+    assert reopened.db.index.ntotal == 58
+    (chunk_id, _), = dense_search(reopened.db, text(100), 1)
+    assert chunk_id == reopened.documents['doc5']['chunks'][0]
+
+@pytest.mark.parametrize('index_type, options', INDEX_TYPES, ids=[t for t, _ in INDEX_TYPES])
+def test_deleted_documents_stay_hidden_after_reload(open_manager, index_type, options):
+    manager = open_manager(index_type, options)
+    manager.delete(['doc3'])
+
+    reopened = open_manager.reopen()
+    assert reopened.db.index.ntotal == 64
+    assert reopened.tombstones == manager.tombstones
+    hits = dense_search(reopened.db, text(3), 5, exclude=reopened.tombstones)
+    assert len(hits) == 5 and not {chunk_id for chunk_id, _ in hits} & reopened.tombstones
@@ -0,0 +1,115 @@
+"""Resumable bulk ingestion."""
+import os
+
+import pytest
+
+import ingest
+from chunk_store import load_index
+from qa_system import create_embeddings
+
+@pytest.fixture
+def documents(tmp_path):
+    path = tmp_path / "documents"
+    path.mkdir()
+    for i in range(6):
+        sentences = [f"Document {i} sentence {j} about vectors and retrieval." for j in range(40)]
+        (path / f"doc{i}.txt").write_text(" ".join(sentences))
+    return str(path)
+
+def chunk_ids(index_path):
+    db = load_index(index_path, create_embeddings())
+    return list(db.index_to_docstore_id.values())
+
+OPTIONS = dict(chunk_size=200, chunk_overlap=0, batch_size=4, workers=1)
+
+@pytest.fixture
+def expected(fake_bedrock, documents, tmp_path):
+    """Chunk ids of an uninterrupted run"""
+    fake_bedrock()
+    ingest.ingest(documents, str(tmp_path / "complete"), **OPTIONS)
+    return sorted(chunk_ids(str(tmp_path / "complete")))
+
+def test_resume_after_crash_while_writing_a_checkpoint(expected, documents, tmp_path, monkeypatch):
+    index_path = str(tmp_path / "index")
+    real_write = ingest.ShardLog.write
+    def crashing_write(self, db, entries):
+        if len(self.shards) == 2:
+            # Die halfway through the third checkpoint
+            os.makedirs(os.path.join(self.path, "shard-000002.tmp"))
+            raise KeyboardInterrupt
+        real_write(self, db, entries)
+    monkeypatch.setattr(ingest.ShardLog, 'write', crashing_write)
+    with pytest.raises(KeyboardInterrupt):
+        ingest.ingest(documents, index_path, checkpoint_every=2, **OPTIONS)
+    monkeypatch.setattr(ingest.ShardLog, 'write', real_write)
+    assert not os.path.exists(os.path.join(index_path, "index.faiss"))
+
+    resumed = ingest.ingest(documents, index_path, **OPTIONS)
+
+    assert 0 < resumed < len(expected)
+    assert sorted(chunk_ids(index_path)) == expected
+    assert not os.path.exists(os.path.join(index_path, ingest.SHARDS_DIR))
+
+def test_resume_after_crash_during_the_final_merge_adds_no_duplicates(expected, documents, tmp_path, monkeypatch):
+    index_path = str(tmp_path / "index")
+    # The merged index is saved, the manifest and shard cleanup never happen
+    real_write_manifest = ingest.write_manifest
+    def crash(*args):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(ingest, 'write_manifest', crash)
+    with pytest.raises(KeyboardInterrupt):
+        ingest.ingest(documents, index_path, checkpoint_every=2, **OPTIONS)
+    monkeypatch.setattr(ingest, 'write_manifest', real_write_manifest)
+    assert os.path.exists(os.path.join(index_path, ingest.SHARDS_DIR))
+
+    assert ingest.ingest(documents, index_path, **OPTIONS) == 0
+    assert sorted(chunk_ids(index_path)) == expected
+
+def test_checkpoints_do_not_rewrite_the_index(expected, documents, tmp_path, monkeypatch):
+    index_path = str(tmp_path / "index")
+    saved = []
+    real_save = ingest.save_index
+    def recording_save(db, path):
+        saved.append(os.path.relpath(path, index_path))
+        real_save(db, path)
+    monkeypatch.setattr(ingest, 'save_index', recording_save)
+    ingest.ingest(documents, index_path, checkpoint_every=1, **OPTIONS)
+
+    assert saved.count('.') == 1
+    assert len(saved) > 10
+    assert sorted(chunk_ids(index_path)) == expected
+
+def test_sync_after_ingest_skips_unchanged_documents(fake_bedrock, documents, tmp_path):
+    from index_manager import IndexManager, read_manifest, sync
+    fake = fake_bedrock()
+    index_path = str(tmp_path / "index")
+    ingest.ingest(documents, index_path, batch_size=4, workers=1)
+    embedded = fake.calls
+
+    assert sync(IndexManager.open(index_path), documents) == 0
+    assert fake.calls == embedded
+
+    # A changed file replaces its chunks on the next ingest
+    old_chunks = read_manifest(index_path)[0]['doc0.txt']['chunks']
+    with open(os.path.join(documents, "doc0.txt"), "a") as f:
+        f.write(" One more sentence.")
+    ingest.ingest(documents, index_path, batch_size=4, workers=1)
+    manifest, tombstones = read_manifest(index_path)
+    assert tombstones == set(old_chunks)
+    assert not tombstones & set(manifest['doc0.txt']['chunks'])
+    assert sync(IndexManager.open(index_path), documents) == 0
+
+def test_adopt_records_hashes_of_unchanged_documents(fake_bedrock, documents, tmp_path):
+    from index_manager import IndexManager, MANIFEST_FILE, sync
+    fake_bedrock()
+    index_path = str(tmp_path / "index")
+    ingest.ingest(documents, index_path, batch_size=4, workers=1)
+    os.remove(os.path.join(index_path, MANIFEST_FILE))
+
+    manager = IndexManager.open(index_path)
+    assert manager.documents == {}
+    with open(os.path.join(documents, "doc0.txt"), "a") as f:
+        f.write(" Edited after ingest.")
+    assert manager.adopt(ingest.list_sources(documents)) == 6
+    assert [doc_id for doc_id, entry in manager.documents.items() if entry['hash'] is None] == ['doc0.txt']
+    assert sync(manager, documents) == 1
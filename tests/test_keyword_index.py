@@ -0,0 +1,71 @@
+"""BM25 index saved as memory-mapped columns."""
+import pytest
+from langchain_community.vectorstores import FAISS
+
+import keyword_index
+from chunk_store import load_index, save_index
+from keyword_index import BM25Index
+from qa_system import create_embeddings
+
+TEXTS = [f"Chunk {i} covers topic {i % 7}, item {i * 13 % 29} and the word {'rare' if i == 5 else 'common'}."
+         for i in range(40)]
+QUERIES = ["topic 3 item 12", "rare word", "common", "covers chunk 17", "nothing matches"]
+
+@pytest.fixture
+def saved(fake_bedrock, tmp_path):
+    """A FAISS index and its keyword index saved under tmp_path, and the in-memory BM25 built from them"""
+    fake_bedrock()
+    index_path = str(tmp_path / "index")
+    db = FAISS.from_texts(TEXTS, create_embeddings())
+    save_index(db, index_path)
+    built = keyword_index.load_or_build(load_index(index_path, create_embeddings()), index_path)
+    return index_path, built
+
+def test_mapped_search_scores_like_the_built_index(saved):
+    index_path, built = saved
+    loaded = BM25Index.load(index_path)
+
+    for query in QUERIES:
+        expected = built.search(query, k=10)
+        actual = loaded.search(query, k=10)
+        assert [score for _, score in actual] == pytest.approx([score for _, score in expected])
+        assert {doc_id for doc_id, _ in actual} == {doc_id for doc_id, _ in expected}
+
+    excluded = {doc_id for doc_id, _ in built.search("topic 3", k=3)}
+    hits = loaded.search("topic 3", k=5, exclude=excluded)
+    assert len(hits) == 5 and not {doc_id for doc_id, _ in hits} & excluded
+
+def test_load_or_build_reuses_the_mapped_index(saved, monkeypatch):
+    index_path, built = saved
+    monkeypatch.setattr(BM25Index, 'build', lambda *args, **kwargs: pytest.fail("rebuilt an up-to-date index"))
+
+    index = keyword_index.load_or_build(load_index(index_path, create_embeddings()), index_path)
+
+    assert index._mapped is not None
+    assert len(index) == len(TEXTS)
+
+def test_stale_index_is_rebuilt(saved):
+    index_path, built = saved
+    built.remove([built.doc_ids[0]])
+    built.save(index_path)
+
+    index = keyword_index.load_or_build(load_index(index_path, create_embeddings()), index_path)
+
+    assert len(index) == len(TEXTS)
+
+def test_modifying_a_loaded_index_copies_it_to_memory(saved):
+    index_path, built = saved
+    loaded = BM25Index.load(index_path)
+    loaded.add([("extra", "an extra rare chunk")])
+    loaded.remove([built.doc_ids[5]])
+    loaded.save(index_path)
+
+    reloaded = BM25Index.load(index_path)
+    assert len(reloaded) == len(TEXTS)
+    assert [doc_id for doc_id, _ in reloaded.search("rare", k=5)] == ["extra"]
+
+def test_terms_longer_than_any_indexed_term_do_not_match_a_prefix(saved):
+    index_path, _ = saved
+    loaded = BM25Index.load(index_path)
+
+    assert loaded.search("commonplace", k=5) == []
@@ -0,0 +1,36 @@
+"""Skipping query expansion when the first pass already has a close match."""
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+import pytest
+
+from ann_index import build_index
+from query_planner import FanoutPlanner
+
+@pytest.mark.parametrize('index_type', ['flat', 'ivf_flat'])
+def test_is_confident_uses_cosine_for_unnormalized_vectors(index_type):
+    rng = np.random.default_rng(0)
+    # Titan v1 vectors are far from unit length, so L2 distances say nothing about cosine on their own
+    vectors = rng.normal(size=(200, 16)).astype(np.float32) * 5
+    db = SimpleNamespace(index=build_index(vectors, index_type, metric=faiss.METRIC_L2, nlist=4))
+    planner = FanoutPlanner(confident_similarity=0.8)
+
+    assert planner.is_confident(db, vectors[7] * 3, 7)
+    orthogonal = vectors[7] - vectors[3] * (vectors[7] @ vectors[3]) / (vectors[3] @ vectors[3])
+    assert not planner.is_confident(db, orthogonal, 3)
+    assert not planner.is_confident(db, vectors[7], None)
+
+def test_generate_search_queries_lists_planner_candidates_and_is_memoized(fake_bedrock):
+    from query_processor import QueryProcessor
+    fake_bedrock()
+    processor = QueryProcessor()
+    analysis = processor.analyze_query("Compare BERT and GPT models for machine learning")
+
+    queries = processor.generate_search_queries(analysis)
+
+    assert queries == [variant.query for variant in FanoutPlanner.candidates(analysis)]
+    assert queries[0] == analysis.original_query and len(queries) > 1
+    queries.append("mutated by the caller")
+    assert processor.generate_search_queries(analysis) == queries[:-1]
+    assert len(processor.search_query_cache) == 1
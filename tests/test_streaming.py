@@ -0,0 +1,180 @@
+"""/ask/stream end to end against FakeBedrockClient, and the page script that reads it."""
+import re
+import json
+import shutil
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+
+import pytest
+
+import metrics
+import web_app
+import advanced_web_app
+from engine_registry import registry
+from http_serving import ThreadPoolHTTPServer, get_search_params
+from benchmarks.stubs import FakeBedrockClient
+
+class QuietHandler(web_app.RequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+class QuietAdvancedHandler(advanced_web_app.RequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def serve(monkeypatch, make_qa_system):
+    """Start web_app (or `handler`) on a free port in front of a QASystem whose Bedrock calls all go to `fake`"""
+    servers = []
+
+    def start(fake, handler=QuietHandler, **client_options):
+        qa = make_qa_system(fake, **client_options)
+        monkeypatch.setattr(registry, 'index_path', qa.index_path)
+        registry.reload()
+        registry.register('qa_system', qa)
+        server = ThreadPoolHTTPServer(("127.0.0.1", 0), handler, workers=2, queue_limit=4)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    registry.reload()
+
+def read_events(port, payload):
+    """POST to /ask/stream and parse the response into (event, data) frames"""
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/ask/stream", data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        assert response.headers['Content-Type'] == 'text/event-stream'
+        body = response.read().decode()
+    assert body.endswith("\n\n")
+    frames = []
+    for raw in body[:-2].split("\n\n"):
+        event, data = 'message', None
+        for line in raw.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        frames.append((event, data))
+    return frames
+
+def test_stream_relays_tokens_then_done(serve):
+    fake = FakeBedrockClient(answer="FAISS stores the document vectors.", first_token_latency=0, token_latency=0)
+    port = serve(fake)
+
+    frames = read_events(port, {'query': 'Where are documents stored?', 'search_type': 'semantic'})
+
+    *tokens, last = frames
+    assert last == ('done', {'search_type': 'semantic'})
+    assert all(event == 'message' for event, _ in tokens)
+    assert "".join(data['token'] for _, data in tokens) == fake.answer
+    assert len(tokens) == len(fake.answer.split(' '))
+
+def test_failed_stream_ends_with_error_event(serve):
+    before = metrics.REGISTRY.total('rag_requests_total')
+    fake = FakeBedrockClient(throttle_rate=1.0, first_token_latency=0, token_latency=0)
+    port = serve(fake, max_attempts=1)
+
+    frames = read_events(port, {'query': 'Where are documents stored?', 'search_type': 'hybrid'})
+
+    assert [event for event, _ in frames] == ['error']
+    assert 'ThrottlingException' in frames[0][1]['error']
+    assert metrics.REGISTRY.total('rag_requests_total') == before + 1
+    assert 'rag_requests_total{endpoint="/ask/stream",search_type="hybrid",status="error"}' in metrics.render()
+
+def test_failed_answer_is_counted_as_error(serve):
+    port = serve(FakeBedrockClient(throttle_rate=1.0, first_token_latency=0, token_latency=0), max_attempts=1)
+    payload = {'query': 'Where are documents stored?', 'search_type': 'semantic'}
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/ask", data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        assert json.loads(response.read())['answer'].startswith("Error: ")
+
+    assert 'rag_requests_total{endpoint="/ask",search_type="semantic",status="error"}' in metrics.render()
+
+def test_advanced_app_streams_basic_search_types(serve):
+    fake = FakeBedrockClient(answer="Streamed from the advanced app.", first_token_latency=0, token_latency=0)
+    port = serve(fake, handler=QuietAdvancedHandler)
+
+    *tokens, last = read_events(port, {'query': 'Where are documents stored?', 'search_type': 'keyword'})
+
+    assert last == ('done', {'search_type': 'keyword'})
+    assert "".join(data['token'] for _, data in tokens) == fake.answer
+
+def test_advanced_app_defaults_to_advanced_search_on_both_endpoints(serve):
+    port = serve(FakeBedrockClient(first_token_latency=0, token_latency=0), handler=QuietAdvancedHandler)
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/ask/stream",
+                                     data=json.dumps({'query': 'What is this system?'}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=30)
+    assert error.value.code == 400
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="needs node to parse the page script")
+@pytest.mark.parametrize('page', [web_app.HTML, advanced_web_app.HTML], ids=['web_app', 'advanced_web_app'])
+def test_page_script_parses(page, tmp_path):
+    scripts = re.findall(r"<script>(.*?)</script>", page, re.S)
+    assert scripts
+    path = tmp_path / "page.js"
+    path.write_text("\n".join(scripts))
+    result = subprocess.run(['node', '--check', str(path)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+@pytest.mark.parametrize('path', ['/ask', '/ask/stream'])
+def test_invalid_search_params_are_rejected_with_400(serve, path):
+    port = serve(FakeBedrockClient(first_token_latency=0, token_latency=0))
+    payload = {'query': 'What is this system?', 'search_type': 'semantic', 'nprobe': 'abc'}
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=30)
+    assert error.value.code == 400
+    assert 'nprobe' in json.loads(error.value.read())['error']
+
+@pytest.mark.parametrize('value', [0, '0', -1, '-2'])
+def test_search_params_must_be_positive(value):
+    with pytest.raises(ValueError, match='nprobe'):
+        get_search_params({'nprobe': value})
+
+class StubResult:
+    answer = "An answer."
+    chunks = []
+
+    def debug_info(self):
+        return {}
+
+class RecordingAdvancedRAG:
+    def __init__(self):
+        self.calls = []
+
+    def run(self, question, k=4, search_params=None):
+        self.calls.append(search_params)
+        return StubResult()
+
+def test_advanced_search_uses_the_requested_search_params(monkeypatch, tmp_path):
+    monkeypatch.setattr(registry, 'index_path', str(tmp_path))
+    engine = RecordingAdvancedRAG()
+    registry.register('advanced_rag', engine)
+    server = ThreadPoolHTTPServer(("127.0.0.1", 0), QuietAdvancedHandler, workers=2, queue_limit=4)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        for nprobe in (4, 16):
+            payload = {'query': 'What is this system?', 'search_type': 'advanced', 'nprobe': nprobe}
+            request = urllib.request.Request(f"http://127.0.0.1:{server.server_address[1]}/ask",
+                                             data=json.dumps(payload).encode(),
+                                             headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=30) as response:
+                assert json.loads(response.read())['answer'] == "An answer."
+    finally:
+        server.shutdown()
+        server.server_close()
+        registry.reload()
+
+    assert engine.calls == [{'nprobe': 4}, {'nprobe': 16}]
@@ -1,41 +1,16 @@
 import http.server
-import socketserver
 import webbrowser
 import json
-import boto3
-import requests
 import logging
 from urllib.parse import parse_qs, urlparse
+from http_serving import (ThreadPoolHTTPServer, DEFAULT_WORKERS, DEFAULT_QUEUE_LIMIT, send_event_stream,
+                          get_search_params, is_error_answer, send_json, send_metrics, track_request)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def get_api_endpoint():
-    cf_client = boto3.client('cloudformation')
-    try:
-        response = cf_client.describe_stacks(StackName='rag-qa-stack')
-        outputs = response['Stacks'][0]['Outputs']
-        for output in outputs:
-            if output['OutputKey'] == 'WebEndpoint':
-                return output['OutputValue']
-    except Exception as e:
-        logger.error(f"Error getting endpoint: {str(e)}")
-    return None
-
-def get_s3_bucket():
-    cf_client = boto3.client('cloudformation')
-    try:
-        response = cf_client.describe_stacks(StackName='rag-qa-stack')
-        outputs = response['Stacks'][0]['Outputs']
-        for output in outputs:
-            if output['OutputKey'] == 'S3BucketName':
-                return output['OutputValue']
-    except Exception as e:
-        logger.error(f"Error getting S3 bucket: {str(e)}")
-    return None
-
 HTML = """
 <!DOCTYPE html>
 <html>
@@ -142,7 +117,7 @@ HTML = """
                     answerDiv.innerHTML = '';
                     askButton.disabled = true;
                     
-                    const response = await fetch('/ask', {
+                    const response = await fetch('/ask/stream', {
                         method: 'POST',
                         headers: {
                             'Content-Type': 'application/json'
@@ -155,14 +130,46 @@ HTML = """
                     
                     console.log('Response status:', response.status);
                     
-                    const data = await response.json();
-                    console.log('Response data:', data);
-                    
-                    if (response.ok && data.answer) {
-                        answerDiv.innerHTML = data.answer.replace(/\\n/g, '<br>');
-                        answerDiv.innerHTML += `<br><br><small>Search type: ${data.search_type}</small>`;
-                    } else {
+                    if (!response.ok || !response.body) {
+                        const data = await response.json().catch(() => ({}));
                         answerDiv.innerHTML = `Error: ${data.error || 'Could not get an answer. Please try again.'}`;
+                        return;
+                    }
+                    
+                    // Read Server-Sent Events and append tokens as they arrive
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    let answer = '';
+                    
+                    while (true) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, { stream: true });
+                        
+                        const events = buffer.split('\\n\\n');
+                        buffer = events.pop();
+                        
+                        for (const rawEvent of events) {
+                            let eventType = 'message';
+                            let payload = '';
+                            rawEvent.split('\\n').forEach(line => {
+                                if (line.startsWith('event: ')) eventType = line.slice(7);
+                                if (line.startsWith('data: ')) payload += line.slice(6);
+                            });
+                            const data = JSON.parse(payload);
+                            
+                            if (eventType === 'done') {
+                                answerDiv.innerHTML = answer.replace(/\\n/g, '<br>');
+                                answerDiv.innerHTML += `<br><br><small>Search type: ${data.search_type}</small>`;
+                            } else if (eventType === 'error') {
+                                answerDiv.innerHTML = `Error: ${data.error}`;
+                            } else {
+                                loadingDiv.style.display = 'none';
+                                answer += data.token;
+                                answerDiv.textContent = answer;
+                            }
+                        }
                     }
                 } catch (error) {
                     console.error('Error:', error);
@@ -189,39 +196,10 @@ HTML = """
 """
 
 class RequestHandler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        # Cache the document content
-        self._document_content = None
-        super().__init__(*args, **kwargs)
-
-    def get_document_content(self):
-        """Get processed document content from S3 with caching"""
-        if self._document_content is None:
-            try:
-                s3_client = boto3.client('s3')
-                bucket_name = get_s3_bucket()
-                
-                response = s3_client.list_objects_v2(
-                    Bucket=bucket_name,
-                    Prefix='documents/text/'
-                )
-                
-                all_content = []
-                for obj in response.get('Contents', []):
-                    content = s3_client.get_object(
-                        Bucket=bucket_name,
-                        Key=obj['Key']
-                    )['Body'].read().decode('utf-8')
-                    all_content.append(content)
-                
-                self._document_content = "\n\n".join(all_content)
-            except Exception as e:
-                logger.error(f"Error getting document content: {str(e)}")
-                return ""
-        
-        return self._document_content
-
     def do_GET(self):
+        if self.path == '/metrics':
+            send_metrics(self)
+            return
         self.send_response(200)
         self.send_header('Content-type', 'text/html')
         self.end_headers()
@@ -233,26 +211,38 @@ class RequestHandler(http.server.SimpleHTTPRequestHandler):
             post_data = self.rfile.read(content_length)
             request_data = json.loads(post_data.decode('utf-8'))
 
+            # Optional per-request ANN settings (nprobe for IVF, ef_search for HNSW)
+            try:
+                search_params = get_search_params(request_data)
+            except ValueError as e:
+                send_json(self, 400, {'error': str(e)})
+                return
+
             try:
-                # Import and use the local QA system
-                from qa_system import QASystem
-                import os
-                os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+                # Use the process-wide QA system so the index is only loaded once
+                from engine_registry import get_qa_system, coalesce_answer
                 
-                qa_system = QASystem()
+                qa_system = get_qa_system()
                 
                 # Get search type and query
                 search_type = request_data.get('search_type', 'hybrid')  # Default to hybrid
                 query = request_data['query']
                 
                 if search_type == 'semantic':
-                    answer = qa_system.answer_question(query)
+                    answer_fn = qa_system.answer_question
                 elif search_type == 'keyword':
-                    answer = qa_system.search_by_keywords(query)
+                    answer_fn = qa_system.search_by_keywords
                 elif search_type == 'hybrid':
-                    answer = qa_system.hybrid_search(query)
+                    answer_fn = qa_system.hybrid_search
                 else:
-                    answer = qa_system.hybrid_search(query)  # Default to hybrid
+                    answer_fn = qa_system.hybrid_search  # Default to hybrid
+                
+                # Concurrent identical questions share one answer
+                with track_request('/ask', search_type) as outcome:
+                    answer = coalesce_answer(query, search_type, lambda: answer_fn(query, search_params=search_params),
+                                             search_params)
+                    if is_error_answer(answer):
+                        outcome['status'] = 'error'
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -271,9 +261,40 @@ class RequestHandler(http.server.SimpleHTTPRequestHandler):
                     'error': f'Error processing question: {str(e)}'
                 }).encode())
 
-def run_server(port=8000):
-    with socketserver.TCPServer(("", port), RequestHandler) as httpd:
-        print(f"Server running at http://localhost:{port}")
+        elif self.path == '/ask/stream':
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            request_data = json.loads(post_data.decode('utf-8'))
+
+            try:
+                search_params = get_search_params(request_data)
+            except ValueError as e:
+                send_json(self, 400, {'error': str(e)})
+                return
+
+            try:
+                from engine_registry import get_qa_system
+                
+                qa_system = get_qa_system()
+            except Exception as e:
+                logger.error(f"Error processing question: {str(e)}")
+                self.send_response(500)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({
+                    'error': f'Error processing question: {str(e)}'
+                }).encode())
+                return
+            
+            search_type = request_data.get('search_type', 'hybrid')
+            tokens = qa_system.stream_answer(request_data['query'], search_type,
+                                             search_params=search_params)
+            with track_request('/ask/stream', search_type) as outcome:
+                outcome['status'] = send_event_stream(self, tokens, {'search_type': search_type})
+
+def run_server(port=8000, workers=DEFAULT_WORKERS, queue_limit=DEFAULT_QUEUE_LIMIT):
+    with ThreadPoolHTTPServer(("", port), RequestHandler, workers=workers, queue_limit=queue_limit) as httpd:
+        print(f"Server running at http://localhost:{port} ({workers} workers, queue limit {queue_limit})")
         webbrowser.open(f"http://localhost:{port}")
         httpd.serve_forever()
 